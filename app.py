@@ -6,16 +6,21 @@
 """
 
 import os
+import sys
 import base64
 import uuid
 import time
 import numpy as np
-import cv2
 from flask import Flask, render_template, request, jsonify
 import easyocr
 from PIL import Image
 import io
 
+# 预处理和单字快速路径复用Django识别服务的实现，两个入口识别完全相同的输入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'handwriting_project'))
+from recognition.backends import EasyOCRBackend
+from recognition.cache import RecognitionCache
+
 app = Flask(__name__)
 
 UPLOAD_FOLDER = 'static/uploads'
@@ -27,27 +32,17 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# 识别结果缓存：键为解码后像素数据的哈希加PREPROCESS_VERSION和后端的cache_version
+RESULT_CACHE_SIZE = 512
+result_cache = RecognitionCache(max_entries=RESULT_CACHE_SIZE)
+
 print("正在加载EasyOCR模型...")
 start_time = time.time()
 reader = easyocr.Reader(['ch_sim'], gpu=False, verbose=False)
 print(f"模型加载完成，耗时: {time.time() - start_time:.2f}秒")
 
-
-def preprocess_image(image_np):
-    """图像预处理：增强对比度"""
-    try:
-        gray = cv2.cvtColor(image_np, cv2.COLOR_RGB2GRAY)
-
-        blurred = cv2.GaussianBlur(gray, (3, 3), 0)
-
-        enhanced = cv2.equalizeHist(blurred)
-
-        enhanced = cv2.cvtColor(enhanced, cv2.COLOR_GRAY2RGB)
-
-        return enhanced
-    except Exception as e:
-        print(f"图像预处理错误: {e}")
-        return image_np
+# 灰度化+高斯模糊+直方图均衡化，单字图像跳过文本检测，多行文本或未识别出文字时走完整流程
+easyocr_backend = EasyOCRBackend(detector_skip=True)
 
 
 def allowed_file(filename):
@@ -100,20 +95,30 @@ def recognize():
             return jsonify({'success': False, 'error': '图片数据为空'}), 400
 
         image = base64_to_image(image_data)
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        image_np = np.array(image)
+        cache_key = RecognitionCache.make_key(image, easyocr_backend.cache_version)
+        cached = result_cache.get(cache_key)
+        # 预处理图像文件已被/api/clear删除时重新识别
+        if cached is not None and os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], cached['filename'])):
+            # 命中缓存：跳过预处理、识别和PNG编码
+            return jsonify({
+                'success': True,
+                'texts': cached['texts'],
+                'confidences': cached['confidences'],
+                'image_url': f"/static/uploads/{cached['filename']}",
+                'cached': True
+            })
 
-        processed_np = preprocess_image(image_np)
+        processed_np = easyocr_backend.prepare(image)
 
         timestamp = int(time.time() * 1000)
         filename = f"temp_{timestamp}.png"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         Image.fromarray(processed_np).save(filepath)
 
-        result = reader.readtext(processed_np)
+        result = easyocr_backend.read(reader, [processed_np])[0]
         print(f"EasyOCR返回: {result}")
         texts, confidences = process_ocr_result(result)
+        result_cache.set(cache_key, {'texts': texts, 'confidences': confidences, 'filename': filename})
 
         return jsonify({
             'success': True,
@@ -129,6 +134,11 @@ def recognize():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({'success': True, **result_cache.stats()})
+
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     try:
@@ -1,7 +1,18 @@
+import argparse
+import hashlib
+import json
 import os
-import numpy as np
-import struct
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 from PIL import Image
+
+# .gnt解析复用models/gnt.py（GntDataset使用的同一实现），models目录内为同级导入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'handwriting_project', 'models'))
+from gnt import build_char_dict, iter_gnt_file, load_gnt_index, tagcode_to_char
+
 # data文件夹存放转换后的.png文件
 data_dir = 'data'
 # 路径为存放数据集解压后的.gnt文件
@@ -9,66 +20,170 @@ train_data_dir = os.path.join('', 'wordDatas/trn_gnt')
 test_data_dir = os.path.join('', 'wordDatas/tst_gnt')
 
 
+def list_gnt_files(gnt_dir):
+    return sorted(file_name for file_name in os.listdir(gnt_dir) if file_name.endswith('.gnt'))
+
+
 def read_from_gnt_dir(gnt_dir=train_data_dir):
-    def one_file(f):
-        header_size = 10
-        while True:
-            header = np.fromfile(f, dtype='uint8', count=header_size)
-            if not header.size: break
-            sample_size = int(header[0]) + (int(header[1]) << 8) + (int(header[2]) << 16) + (int(header[3]) << 24)
-            tagcode = int(header[5]) + (int(header[4]) << 8)
-            width = int(header[6]) + (int(header[7]) << 8)
-            height = int(header[8]) + (int(header[9]) << 8)
-            if header_size + width * height != sample_size:
-                break
-            image = np.fromfile(f, dtype='uint8', count=width * height).reshape((height, width))
-            yield image, tagcode
-
-    for file_name in os.listdir(gnt_dir):
-        if file_name.endswith('.gnt'):
-            file_path = os.path.join(gnt_dir, file_name)
-            with open(file_path, 'rb') as f:
-                for image, tagcode in one_file(f):
-                    yield image, tagcode
-
-
-char_set = set()
-for _, tagcode in read_from_gnt_dir(gnt_dir=train_data_dir):
-    tagcode_unicode = struct.pack('>H', tagcode).decode('gb2312')
-    char_set.add(tagcode_unicode)
-char_list = list(char_set)
-char_dict = dict(zip(sorted(char_list), range(len(char_list))))
-print(len(char_dict))
-print("char_dict=", char_dict)
+    for file_name in list_gnt_files(gnt_dir):
+        yield from iter_gnt_file(os.path.join(gnt_dir, file_name))
 
-import pickle
 
-f = open('char_dict', 'wb')
-pickle.dump(char_dict, f)
-f.close()
-train_counter = 0
-test_counter = 0
-for image, tagcode in read_from_gnt_dir(gnt_dir=train_data_dir):
-    tagcode_unicode = struct.pack('>H', tagcode).decode('gb2312')
-    im = Image.fromarray(image)
-# 路径为data文件夹下的子文件夹，train为存放训练集.png的文件夹
-    dir_name = 'data/train/' + '%0.5d' % char_dict[tagcode_unicode]
-    print(dir_name)
-    if not os.path.exists(dir_name):
-        os.mkdir(dir_name)
-    im.convert('RGB').save(dir_name + '/' + str(train_counter) + '.png')
-    print("train_counter=", train_counter)
-    train_counter += 1
-print('Train transformation finished ...')
-for image, tagcode in read_from_gnt_dir(gnt_dir=test_data_dir):
-    tagcode_unicode = struct.pack('>H', tagcode).decode('gb2312')
-    im = Image.fromarray(image)
-# 路径为data文件夹下的子文件夹，test为存放测试集.png的文件夹
-    dir_name = 'data/test/' + '%0.5d' % char_dict[tagcode_unicode]
-    if not os.path.exists(dir_name):
-        os.mkdir(dir_name)
-    im.convert('RGB').save(dir_name + '/' + str(test_counter) + '.png')
-    print("test_counter=", test_counter)
-    test_counter += 1
-print('Test transformation finished ...')
+def build_char_dict_from_dir(gnt_dir, workers):
+    """
+    根据训练集构建char_dict：并行扫描样本头（同时写出GntDataset可复用的旁路索引），按汉字排序后编号
+    """
+    paths = [os.path.join(gnt_dir, file_name) for file_name in list_gnt_files(gnt_dir)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        indexes = list(executor.map(load_gnt_index, paths))
+    return build_char_dict(indexes)
+
+
+def convert_file(file_path, output_dir, char_dict):
+    """
+    把一个.gnt文件转换成单通道PNG（在工作进程中执行）
+
+    文件名由.gnt文件名和样本序号决定，重复转换同一个文件会覆盖而不是追加
+
+    Returns:
+        tuple: (.gnt文件名, 写入的样本数, 跳过的样本数)
+    """
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    written = 0
+    skipped = 0
+    for i, (image, tagcode) in enumerate(iter_gnt_file(file_path)):
+        label = char_dict.get(tagcode_to_char(tagcode))
+        if label is None:
+            skipped += 1
+            continue
+        # 直接保存灰度图，不再转换成RGB
+        Image.fromarray(image).save(os.path.join(output_dir, '%0.5d' % label, f'{stem}_{i:06d}.png'))
+        written += 1
+    return os.path.basename(file_path), written, skipped
+
+
+def char_dict_digest(char_dict):
+    """
+    计算char_dict的哈希，汉字到类别索引的映射变化时清单中已转换的文件需要重新转换
+    """
+    items = sorted(char_dict.items())
+    return hashlib.sha256(json.dumps(items, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def load_manifest(manifest_path, digest):
+    """
+    读取已转换文件的清单；清单由其他char_dict生成（或为旧格式）时忽略，全部重新转换
+
+    Args:
+        manifest_path: 清单路径
+        digest: 当前char_dict的哈希
+
+    Returns:
+        dict: 文件名到转换记录的映射
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('char_dict_digest') != digest:
+        print(f'{manifest_path}由不同的char_dict生成，忽略清单并重新转换所有文件；'
+              f'旧的类别目录中可能残留按旧编号保存的图像，建议先清空输出目录')
+        return {}
+    return manifest.get('files', {})
+
+
+def save_manifest(files, manifest_path, digest):
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'char_dict_digest': digest, 'files': files}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def convert_split(gnt_dir, output_dir, char_dict, workers, progress_interval=5.0):
+    """
+    并行转换一个数据集划分，已完成的.gnt文件记录在清单中，中断后重新运行会跳过它们
+    清单同时记录char_dict的哈希，换用其他char_dict时不会跳过按旧编号转换的文件
+
+    Args:
+        gnt_dir: .gnt文件目录
+        output_dir: 输出目录，例如data/train
+        char_dict: 汉字到类别索引的字典
+        workers: 进程数
+        progress_interval: 进度输出的最小间隔（秒）
+    """
+    # 类别目录一次性创建，不再在每个样本上检查
+    for label in char_dict.values():
+        os.makedirs(os.path.join(output_dir, '%0.5d' % label), exist_ok=True)
+
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    digest = char_dict_digest(char_dict)
+    manifest = load_manifest(manifest_path, digest)
+
+    pending = []
+    for file_name in list_gnt_files(gnt_dir):
+        file_path = os.path.join(gnt_dir, file_name)
+        stat = os.stat(file_path)
+        entry = manifest.get(file_name)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == int(stat.st_mtime):
+            continue
+        pending.append(file_path)
+
+    done = len(list_gnt_files(gnt_dir)) - len(pending)
+    if done:
+        print(f'{output_dir}: 跳过{done}个已转换的文件')
+    if not pending:
+        return
+
+    total = len(pending)
+    samples = 0
+    start = last_report = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(convert_file, path, output_dir, char_dict): path for path in pending}
+        for completed, future in enumerate(as_completed(futures), 1):
+            file_path = futures[future]
+            file_name, written, skipped = future.result()
+            stat = os.stat(file_path)
+            manifest[file_name] = {
+                'samples': written,
+                'skipped': skipped,
+                'size': stat.st_size,
+                'mtime': int(stat.st_mtime),
+            }
+            save_manifest(manifest, manifest_path, digest)
+            samples += written
+
+            now = time.perf_counter()
+            if now - last_report >= progress_interval or completed == total:
+                last_report = now
+                elapsed = now - start
+                print(f'{output_dir}: {completed}/{total}个文件，{samples}个样本，'
+                      f'{samples / elapsed:.0f}个样本/秒')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='把CASIA-HWDB的.gnt文件并行转换成单通道PNG，支持断点续转')
+    parser.add_argument('--train-dir', default=train_data_dir, help='训练集.gnt文件目录')
+    parser.add_argument('--test-dir', default=test_data_dir, help='测试集.gnt文件目录')
+    parser.add_argument('--output', default=data_dir, help='输出目录')
+    parser.add_argument('--char-dict', default='char_dict', help='char_dict文件路径，不存在时根据训练集生成')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='进程数')
+    args = parser.parse_args()
+
+    if os.path.exists(args.char_dict):
+        with open(args.char_dict, 'rb') as f:
+            char_dict = pickle.load(f)
+    else:
+        char_dict = build_char_dict_from_dir(args.train_dir, args.workers)
+        with open(args.char_dict, 'wb') as f:
+            pickle.dump(char_dict, f)
+    print(len(char_dict))
+
+    # train为存放训练集.png的文件夹，test为存放测试集.png的文件夹
+    convert_split(args.train_dir, os.path.join(args.output, 'train'), char_dict, args.workers)
+    print('Train transformation finished ...')
+    convert_split(args.test_dir, os.path.join(args.output, 'test'), char_dict, args.workers)
+    print('Test transformation finished ...')
+
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,397 @@
+"""
+推理基准测试：逐阶段测量识别链路的延迟，输出JSON，可与基线对比发现性能回退
+
+阶段：
+    decode            PNG字节解码为PIL图像
+    preprocess        ImagePreprocessor.preprocess（批次大于1时为preprocess_batch）
+    view_preprocess   ImageRecognitionView._preprocess_image（当前配置的识别后端的prepare）
+    easyocr_readtext  EasyOCR readtext（批次大于1时为readtext_batched），只使用本地已有的模型文件
+    crnn_forward      CRNN前向传播
+    cnn_mlp_forward   CNNMLP前向传播
+
+输入是固定随机种子生成的合成笔迹图像，不需要数据集和网络；模型使用随机初始化的权重（延迟与权重取值无关）。
+缺少依赖（Django、PyTorch、EasyOCR模型文件等）的阶段记为跳过，不影响其他阶段。
+
+用法：
+    python benchmark.py --output baseline.json
+    python benchmark.py --output current.json --compare baseline.json --threshold 0.1
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from models.image_transforms import IMAGE_SIZE
+
+STAGES = ['decode', 'preprocess', 'view_preprocess', 'easyocr_readtext', 'crnn_forward', 'cnn_mlp_forward']
+
+class StageSkipped(Exception):
+    """
+    阶段无法在当前环境中运行（缺少依赖或模型文件）
+    """
+
+
+def make_images(count, size=280, seed=0):
+    """
+    生成白底黑色笔画的合成手写图像
+
+    Args:
+        count: 图像数量
+        size: 图像边长
+        seed: 随机种子，固定后每次运行的输入相同
+
+    Returns:
+        list: RGB的uint8数组列表
+    """
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        canvas = np.full((size, size, 3), 255, dtype=np.uint8)
+        for _ in range(8):
+            x0, y0, x1, y1 = (int(v) for v in rng.integers(size // 7, size - size // 7, size=4))
+            cv2.line(canvas, (x0, y0), (x1, y1), (0, 0, 0), thickness=9)
+        images.append(canvas)
+    return images
+
+
+def encode_png(image):
+    buffer = BytesIO()
+    Image.fromarray(image).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def time_call(func, repeat, warmup):
+    """
+    先预热warmup次，再计时repeat次
+
+    Returns:
+        list: 每次调用的耗时（毫秒）
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(samples, batch_size):
+    samples = np.asarray(samples)
+    median = float(np.median(samples))
+    return {
+        'median_ms': round(median, 4),
+        'mean_ms': round(float(samples.mean()), 4),
+        'p95_ms': round(float(np.percentile(samples, 95)), 4),
+        'min_ms': round(float(samples.min()), 4),
+        'per_image_ms': round(median / batch_size, 4),
+        'runs': len(samples),
+    }
+
+
+def set_threads(threads):
+    """
+    同时设置OpenCV和PyTorch（已安装时）的线程数
+    """
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+
+
+def _setup_django():
+    try:
+        import django
+    except ImportError:
+        raise StageSkipped('未安装Django')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'handwriting_project.settings')
+    django.setup()
+
+
+class Benchmark:
+    """
+    各阶段的基准测试；每个阶段在第一次使用时构建（加载模型等），构建耗时不计入延迟
+    """
+
+    def __init__(self, images):
+        self.images = images
+        self.pil_images = [Image.fromarray(image) for image in images]
+        self.png_bytes = [encode_png(image) for image in images]
+        self._builders = {
+            'decode': self._build_decode,
+            'preprocess': self._build_preprocess,
+            'view_preprocess': self._build_view_preprocess,
+            'easyocr_readtext': self._build_easyocr_readtext,
+            'crnn_forward': lambda: self._build_forward('crnn'),
+            'cnn_mlp_forward': lambda: self._build_forward('cnn_mlp'),
+        }
+        self._stages = {}
+
+    def stage(self, name):
+        """
+        获取阶段的测试函数：接收批次大小，返回一个执行该批次的无参可调用对象
+
+        Raises:
+            StageSkipped: 阶段无法在当前环境中运行
+        """
+        if name not in self._stages:
+            try:
+                self._stages[name] = self._builders[name]()
+            except StageSkipped as e:
+                self._stages[name] = e
+        stage = self._stages[name]
+        if isinstance(stage, StageSkipped):
+            raise stage
+        return stage
+
+    def _build_decode(self):
+        def make(batch_size):
+            data = self.png_bytes[:batch_size]
+
+            def run():
+                for image_bytes in data:
+                    Image.open(BytesIO(image_bytes)).load()
+            return run
+        return make
+
+    def _build_preprocess(self):
+        from recognition.preprocessing import ImagePreprocessor
+
+        def make(batch_size):
+            if batch_size == 1:
+                image = self.pil_images[0]
+                return lambda: ImagePreprocessor.preprocess(image)
+            batch = np.stack(self.images[:batch_size])
+            return lambda: ImagePreprocessor.preprocess_batch(batch)
+        return make
+
+    def _build_view_preprocess(self):
+        _setup_django()
+        try:
+            from recognition.views import ImageRecognitionView
+        except ImportError as e:
+            raise StageSkipped(f'无法导入识别视图: {e}')
+        view = ImageRecognitionView()
+        if view.backend is None:
+            raise StageSkipped('识别后端未能加载')
+
+        def make(batch_size):
+            data = self.pil_images[:batch_size]
+
+            def run():
+                # 视图每个请求处理一张图像
+                for image in data:
+                    view._preprocess_image(image)
+            return run
+        return make
+
+    def _build_easyocr_readtext(self):
+        try:
+            import easyocr
+        except ImportError:
+            raise StageSkipped('未安装EasyOCR')
+        from recognition.preprocessing import ImagePreprocessor
+
+        try:
+            # 不联网下载模型，本地没有模型文件时跳过
+            reader = easyocr.Reader(['ch_sim'], gpu=False, verbose=False, download_enabled=False)
+        except Exception as e:
+            raise StageSkipped(f'EasyOCR模型不可用: {e}')
+        # 与EasyOCR后端的prepare相同的预处理：cv2灰度化后模糊、均衡化
+        plan = ImagePreprocessor.compile(['grayscale', 'gaussian_blur', 'histogram_equalization'])
+        prepared = [plan(cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)) for image in self.images]
+
+        def make(batch_size):
+            if batch_size == 1:
+                return lambda: reader.readtext(prepared[0], batch_size=4)
+            data = prepared[:batch_size]
+            return lambda: reader.readtext_batched(data, batch_size=max(4, batch_size))
+        return make
+
+    def _build_forward(self, model_type):
+        try:
+            import torch
+        except ImportError:
+            raise StageSkipped('未安装PyTorch')
+        from models.crnn import CRNN
+        from models.cnn_mlp import CNNMLP
+
+        torch.manual_seed(0)
+        if model_type == 'crnn':
+            model = CRNN(num_classes=3755, input_height=IMAGE_SIZE[0])
+        else:
+            model = CNNMLP(num_classes=3755, input_size=IMAGE_SIZE)
+        model.eval()
+
+        def make(batch_size):
+            height, width = IMAGE_SIZE
+            batch = torch.randn(batch_size, 1, height, width)
+
+            def run():
+                with torch.inference_mode():
+                    model(batch)
+            return run
+        return make
+
+
+def environment_info():
+    """
+    记录运行环境，对比时环境不同会给出提示
+    """
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+    try:
+        import torch
+        info['torch'] = torch.__version__
+    except ImportError:
+        info['torch'] = None
+    try:
+        info['git_commit'] = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        info['git_commit'] = None
+    return info
+
+
+def run_benchmarks(stages, batch_sizes, thread_counts, repeat, warmup):
+    """
+    按线程数 x 阶段 x 批次大小运行基准测试
+
+    Returns:
+        tuple: (结果字典，键为'阶段/bs批次大小/t线程数'；跳过的阶段及原因)
+    """
+    benchmark = Benchmark(make_images(max(batch_sizes)))
+    results = {}
+    skipped = {}
+    for threads in thread_counts:
+        set_threads(threads)
+        for name in stages:
+            if name in skipped:
+                continue
+            for batch_size in batch_sizes:
+                try:
+                    run = benchmark.stage(name)(batch_size)
+                except StageSkipped as e:
+                    skipped[name] = str(e)
+                    print(f'{name}: 跳过（{e}）', file=sys.stderr)
+                    break
+                key = f'{name}/bs{batch_size}/t{threads}'
+                results[key] = {
+                    'stage': name,
+                    'batch_size': batch_size,
+                    'threads': threads,
+                    **summarize(time_call(run, repeat, warmup), batch_size),
+                }
+                print(f"{key:<32} median {results[key]['median_ms']:>10.3f} ms  "
+                      f"per image {results[key]['per_image_ms']:>9.3f} ms", file=sys.stderr)
+    return results, skipped
+
+
+def compare(current, baseline, threshold):
+    """
+    与基线对比每张图像的中位数延迟
+
+    Args:
+        current: 本次运行的结果JSON
+        baseline: 基线结果JSON
+        threshold: 允许的相对变慢比例，例如0.1表示慢10%以内不算回退
+
+    Returns:
+        list: 回退的结果键
+    """
+    for field in ('machine', 'cpu_count'):
+        if current['environment'].get(field) != baseline['environment'].get(field):
+            print(f"注意: 运行环境不同（{field}: {baseline['environment'].get(field)} -> "
+                  f"{current['environment'].get(field)}），对比结果仅供参考", file=sys.stderr)
+
+    regressions = []
+    print(f"\n{'结果':<32}{'基线(ms)':>12}{'本次(ms)':>12}{'变化':>10}", file=sys.stderr)
+    for key, result in current['results'].items():
+        base = baseline['results'].get(key)
+        if base is None:
+            continue
+        ratio = result['per_image_ms'] / base['per_image_ms'] if base['per_image_ms'] > 0 else 1.0
+        regressed = ratio > 1 + threshold
+        if regressed:
+            regressions.append(key)
+        print(f"{key:<32}{base['per_image_ms']:>12.3f}{result['per_image_ms']:>12.3f}{ratio - 1:>+10.1%}"
+              f"{'  回退' if regressed else ''}", file=sys.stderr)
+
+    missing = sorted(set(baseline['results']) - set(current['results']))
+    if missing:
+        print(f"本次未运行的基线结果: {', '.join(missing)}", file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='识别链路的逐阶段推理基准测试')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help='要测试的阶段')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, os.cpu_count() or 1], help='线程数')
+    parser.add_argument('--repeat', type=int, default=20, help='每项计时的次数')
+    parser.add_argument('--warmup', type=int, default=3, help='每项预热的次数')
+    parser.add_argument('--output', default=None,
+                        help='结果JSON的输出路径，默认输出到标准输出；进度和对比信息始终输出到标准错误')
+    parser.add_argument('--compare', default=None, help='基线结果JSON，给出时检查性能回退')
+    parser.add_argument('--threshold', type=float, default=0.1, help='允许的相对变慢比例')
+    args = parser.parse_args()
+
+    thread_counts = sorted(set(args.threads))
+    # 被测代码（引擎加载、识别后端等）的print也输出到标准错误，标准输出只有JSON报告
+    with redirect_stdout(sys.stderr):
+        results, skipped = run_benchmarks(args.stages, args.batch_sizes, thread_counts, args.repeat, args.warmup)
+    report = {
+        'environment': environment_info(),
+        'config': {
+            'stages': args.stages,
+            'batch_sizes': args.batch_sizes,
+            'threads': thread_counts,
+            'repeat': args.repeat,
+            'warmup': args.warmup,
+        },
+        'results': results,
+        'skipped': skipped,
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f'Results saved to {args.output}', file=sys.stderr)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True))
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)}项结果比基线慢{args.threshold:.0%}以上', file=sys.stderr)
+            sys.exit(1)
+        print('\n没有发现性能回退', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
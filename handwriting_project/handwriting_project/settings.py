@@ -136,6 +136,63 @@ STATIC_URL = 'static/'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Recognition settings
+# 是否在应用启动时预加载识别引擎（否则在首个识别请求时加载）
+RECOGNITION_PRELOAD_ENGINE = False
+# 识别后端: 'easyocr'（文本检测+识别）、'crnn'或'cnn_mlp'（单字分类器）、'torchscript'或'onnx'（导出的单字分类器）
+RECOGNITION_BACKEND = 'easyocr'
+# EasyOCR后端对单字图像跳过文本检测阶段，仅在图像看起来是多行文本时运行完整检测
+RECOGNITION_DETECTOR_SKIP = True
+# 分类器后端使用的检查点、字符字典和候选字数量
+RECOGNITION_CHECKPOINT = BASE_DIR / 'models' / 'saved_models' / 'crnn_final.pth'
+RECOGNITION_CHAR_DICT = BASE_DIR.parent / 'char_dict'
+RECOGNITION_TOP_K = 5
+# 'torchscript'后端加载的模型，由models/export.py导出，或models/quantize.py生成的int8模型
+RECOGNITION_TORCHSCRIPT_MODEL = BASE_DIR / 'models' / 'saved_models' / 'crnn.ts'
+# 'onnx'后端加载的模型（python export.py onnx ...导出）和onnxruntime线程数
+# 多个Django工作进程时，intra-op线程数取CPU核数/进程数，避免进程间争抢；None表示由onnxruntime决定
+RECOGNITION_ONNX_MODEL = BASE_DIR / 'models' / 'saved_models' / 'crnn.onnx'
+RECOGNITION_ONNX_INTRA_OP_THREADS = None
+RECOGNITION_ONNX_INTER_OP_THREADS = 1
+# 分类器后端的ImagePreprocessor.preprocess步骤，需与训练数据的分布一致
+RECOGNITION_CLASSIFIER_STEPS = ['grayscale']
+# 是否合并并发识别请求，批量执行前向传播
+RECOGNITION_BATCHING_ENABLED = True
+# 合并窗口（毫秒）与最大批次大小
+RECOGNITION_BATCH_WINDOW_MS = 5
+RECOGNITION_BATCH_MAX_SIZE = 8
+# 等待合并批次结果的最长秒数，工作线程卡住时请求失败而不是一直阻塞
+RECOGNITION_BATCH_TIMEOUT = 30
+# 识别结果缓存：进程内LRU，可选再接一层Django缓存（如下方的'recognition'，设置别名后启用）
+RECOGNITION_CACHE_ENABLED = True
+RECOGNITION_CACHE_MAX_ENTRIES = 1024
+# 进程内缓存条目（含预处理后的图像）的总字节数上限
+RECOGNITION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RECOGNITION_CACHE_ALIAS = None
+RECOGNITION_CACHE_TIMEOUT = 3600
+# 识别记录异步持久化：有界队列 + 后台线程批量写入，队列满时等待PUT_TIMEOUT秒后在请求线程同步保存
+RECOGNITION_ASYNC_PERSISTENCE = True
+RECOGNITION_PERSISTENCE_WORKERS = 2
+RECOGNITION_PERSISTENCE_QUEUE_SIZE = 256
+RECOGNITION_PERSISTENCE_BATCH_SIZE = 16
+RECOGNITION_PERSISTENCE_PUT_TIMEOUT = 0.5
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # 同一主机上的多个worker共享的识别结果缓存，超过MAX_ENTRIES时按CULL_FREQUENCY淘汰
+    'recognition': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'recognition',
+        'TIMEOUT': RECOGNITION_CACHE_TIMEOUT,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
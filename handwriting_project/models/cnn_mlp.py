@@ -7,37 +7,83 @@ class CNNMLP(nn.Module):
     CNN+MLP模型，用于手写汉字识别
     结构：卷积层 -> 池化层 -> 卷积层 -> 池化层 -> 全连接层 -> 输出层
     """
+    # 模型类型标识，用于检查点命名和输出形状判断（被DistributedDataParallel等包装后isinstance不再适用）
+    model_type = 'cnn_mlp'
     
-    def __init__(self, num_classes):
+    
+    def __init__(self, num_classes, channels=(32, 64, 128), hidden_sizes=(512, 256), input_size=(64, 256)):
         """
         初始化CNN+MLP模型
         
         Args:
             num_classes: 类别数量
+            channels: 三个卷积层的输出通道数，缩小后可作为蒸馏/剪枝得到的小模型
+            hidden_sizes: 两个隐藏全连接层的大小
+            input_size: 输入图像大小(高, 宽)，需为8的倍数，决定fc1的输入维度
         """
         super(CNNMLP, self).__init__()
+        c1, c2, c3 = channels
+        h1, h2 = hidden_sizes
+        height, width = input_size
+        self.num_classes = num_classes
+        self.channels = tuple(channels)
+        self.hidden_sizes = tuple(hidden_sizes)
+        self.input_size = tuple(input_size)
         
         # 卷积层1
-        self.conv1 = nn.Conv2d(1, 32, kernel_size=3, padding=1)
-        self.bn1 = nn.BatchNorm2d(32)
+        self.conv1 = nn.Conv2d(1, c1, kernel_size=3, padding=1)
+        self.bn1 = nn.BatchNorm2d(c1)
         self.pool1 = nn.MaxPool2d(kernel_size=2, stride=2)
         
         # 卷积层2
-        self.conv2 = nn.Conv2d(32, 64, kernel_size=3, padding=1)
-        self.bn2 = nn.BatchNorm2d(64)
+        self.conv2 = nn.Conv2d(c1, c2, kernel_size=3, padding=1)
+        self.bn2 = nn.BatchNorm2d(c2)
         self.pool2 = nn.MaxPool2d(kernel_size=2, stride=2)
         
         # 卷积层3
-        self.conv3 = nn.Conv2d(64, 128, kernel_size=3, padding=1)
-        self.bn3 = nn.BatchNorm2d(128)
+        self.conv3 = nn.Conv2d(c2, c3, kernel_size=3, padding=1)
+        self.bn3 = nn.BatchNorm2d(c3)
         self.pool3 = nn.MaxPool2d(kernel_size=2, stride=2)
         
-        # 全连接层
-        self.fc1 = nn.Linear(128 * 16 * 16, 512)  # 假设输入图像大小为128x128
+        # 全连接层：三次池化后特征图为(H/8, W/8)，默认64x256输入时为128 * 8 * 32
+        self.fc1 = nn.Linear(c3 * (height // 8) * (width // 8), h1)
         self.dropout1 = nn.Dropout(0.5)
-        self.fc2 = nn.Linear(512, 256)
+        self.fc2 = nn.Linear(h1, h2)
         self.dropout2 = nn.Dropout(0.5)
-        self.fc3 = nn.Linear(256, num_classes)
+        self.fc3 = nn.Linear(h2, num_classes)
+    
+    @property
+    def config(self):
+        """
+        构造参数，写入检查点，用于恢复训练时确认模型结构一致
+        """
+        return {
+            'num_classes': self.num_classes,
+            'channels': list(self.channels),
+            'hidden_sizes': list(self.hidden_sizes),
+            'input_size': list(self.input_size),
+        }
+    
+    @classmethod
+    def from_state_dict(cls, state_dict, input_size=(64, 256)):
+        """
+        根据权重的形状推断通道数和隐藏层大小，构建模型并加载权重（兼容缩小、剪枝后的模型）
+        
+        Args:
+            state_dict: 模型权重
+            input_size: 输入图像大小(高, 宽)
+            
+        Returns:
+            CNNMLP: 加载好权重的模型
+        """
+        model = cls(
+            num_classes=state_dict['fc3.weight'].shape[0],
+            channels=tuple(state_dict[f'conv{i}.weight'].shape[0] for i in (1, 2, 3)),
+            hidden_sizes=(state_dict['fc1.weight'].shape[0], state_dict['fc2.weight'].shape[0]),
+            input_size=input_size,
+        )
+        model.load_state_dict(state_dict)
+        return model
     
     def forward(self, x):
         """
@@ -61,8 +107,8 @@ class CNNMLP(nn.Module):
         x = F.relu(self.bn3(self.conv3(x)))
         x = self.pool3(x)
         
-        # 展平
-        x = x.view(x.size(0), -1)
+        # 展平（reshape兼容channels-last输入）
+        x = x.reshape(x.size(0), -1)
         
         # 全连接层
         x = F.relu(self.fc1(x))
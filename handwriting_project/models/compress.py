@@ -0,0 +1,182 @@
+import argparse
+import copy
+import os
+
+import torch
+
+from cnn_mlp import CNNMLP
+from crnn import CRNN
+from export import load_model
+from train import ModelTrainer, compare_models, measure_latency
+
+
+def _l1_keep(weight, amount):
+    """
+    按L1范数保留最大的(1 - amount)比例的输出通道（卷积核或全连接层的行）
+
+    Returns:
+        torch.Tensor: 升序排列的保留通道索引
+    """
+    num_channels = weight.shape[0]
+    keep = max(1, int(round(num_channels * (1 - amount))))
+    norms = weight.detach().abs().reshape(num_channels, -1).sum(1)
+    return norms.topk(keep).indices.sort().values
+
+
+def prune_cnn_mlp(model, amount):
+    """
+    结构化剪枝：按L1范数剪掉每个卷积层的输出通道和每个隐藏全连接层的神经元，
+    并把剩余权重复制到一个更窄的CNNMLP中；与掩码式剪枝不同，计算量和模型大小都真正减少
+
+    Args:
+        model: 已训练的CNNMLP
+        amount: 每层剪掉的比例，0到1之间
+
+    Returns:
+        CNNMLP: 剪枝后的新模型（原模型不变），需要微调恢复准确率
+    """
+    if model.model_type != 'cnn_mlp':
+        raise ValueError(f'结构化剪枝只支持cnn_mlp模型，得到{model.model_type}')
+    state_dict = model.state_dict()
+
+    conv_keep = [_l1_keep(state_dict[f'conv{i}.weight'], amount) for i in (1, 2, 3)]
+    hidden_keep = [_l1_keep(state_dict[f'fc{i}.weight'], amount) for i in (1, 2)]
+
+    pruned_state = {}
+    previous = None
+    for i, keep in enumerate(conv_keep, 1):
+        weight = state_dict[f'conv{i}.weight'][keep]
+        if previous is not None:
+            weight = weight[:, previous]
+        pruned_state[f'conv{i}.weight'] = weight
+        pruned_state[f'conv{i}.bias'] = state_dict[f'conv{i}.bias'][keep]
+        for name in ('weight', 'bias', 'running_mean', 'running_var'):
+            pruned_state[f'bn{i}.{name}'] = state_dict[f'bn{i}.{name}'][keep]
+        pruned_state[f'bn{i}.num_batches_tracked'] = state_dict[f'bn{i}.num_batches_tracked']
+        previous = keep
+
+    # fc1的输入是按(通道, 高, 宽)展平的特征，按保留的通道取列
+    fc1_weight = state_dict['fc1.weight']
+    fc1_weight = fc1_weight.reshape(fc1_weight.shape[0], model.channels[2], -1)
+    fc1_weight = fc1_weight[hidden_keep[0]][:, conv_keep[2]]
+    pruned_state['fc1.weight'] = fc1_weight.reshape(len(hidden_keep[0]), -1)
+    pruned_state['fc1.bias'] = state_dict['fc1.bias'][hidden_keep[0]]
+    pruned_state['fc2.weight'] = state_dict['fc2.weight'][hidden_keep[1]][:, hidden_keep[0]]
+    pruned_state['fc2.bias'] = state_dict['fc2.bias'][hidden_keep[1]]
+    pruned_state['fc3.weight'] = state_dict['fc3.weight'][:, hidden_keep[1]]
+    pruned_state['fc3.bias'] = state_dict['fc3.bias']
+
+    pruned_state = {name: tensor.detach().clone().cpu() for name, tensor in pruned_state.items()}
+    return CNNMLP.from_state_dict(pruned_state, input_size=model.input_size)
+
+
+def prune_to_budget(model, latency_budget_ms, amounts=(0.25, 0.5, 0.625, 0.75, 0.875)):
+    """
+    从小到大尝试剪枝比例，返回第一个满足CPU单张图像延迟预算的模型
+
+    Args:
+        model: 已训练的CNNMLP
+        latency_budget_ms: 单张图像CPU延迟预算（毫秒）
+        amounts: 候选的剪枝比例
+
+    Returns:
+        tuple: (模型, 剪枝比例)；模型本身已满足预算时返回原模型和0，都不满足时返回剪枝最多的模型
+
+    Raises:
+        ValueError: amounts为空，或剪枝比例不在0到1之间
+    """
+    if not amounts:
+        raise ValueError('至少需要一个候选的剪枝比例')
+    if not all(0 < amount < 1 for amount in amounts):
+        raise ValueError(f'剪枝比例必须在0到1之间，得到{list(amounts)}')
+
+    cpu_model = copy.deepcopy(model).cpu().eval()
+    latency = measure_latency(cpu_model)
+    print(f'剪枝前: {latency:.2f} ms/张')
+    if latency <= latency_budget_ms:
+        return model, 0.0
+
+    for amount in sorted(amounts):
+        pruned = prune_cnn_mlp(cpu_model, amount).eval()
+        latency = measure_latency(pruned)
+        print(f'剪枝{amount:.1%}: {latency:.2f} ms/张，{sum(p.numel() for p in pruned.parameters()):,}个参数')
+        if latency <= latency_budget_ms:
+            return pruned, amount
+
+    print(f'所有剪枝比例都超出{latency_budget_ms}ms的延迟预算，使用剪枝最多的模型')
+    return pruned, amount
+
+
+def _model_dir_name(prefix, model):
+    """
+    保存目录名包含通道数和隐藏层大小，不同宽度的模型不会写进同一个目录
+    """
+    channels = '-'.join(str(c) for c in model.channels)
+    hidden = '-'.join(str(h) for h in model.hidden_sizes)
+    return f'{prefix}_c{channels}_h{hidden}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='知识蒸馏 + 结构化剪枝，得到满足CPU延迟预算的小模型')
+    parser.add_argument('--teacher', default='./saved_models/crnn_final.pth',
+                        help='CRNN教师模型的检查点，不存在时先训练一个')
+    parser.add_argument('--train-dir', default='../../data/train')
+    parser.add_argument('--test-dir', default='../../data/test')
+    parser.add_argument('--save-dir', default='./saved_models/compact')
+    parser.add_argument('--num-classes', type=int, default=3755, help='训练教师模型时的类别数')
+    parser.add_argument('--student-channels', type=int, nargs=3, default=[16, 32, 64], help='学生模型的卷积通道数')
+    parser.add_argument('--student-hidden', type=int, nargs=2, default=[256, 256], help='学生模型的隐藏层大小')
+    parser.add_argument('--epochs', type=int, default=5, help='教师和学生模型的训练轮数')
+    parser.add_argument('--fine-tune-epochs', type=int, default=2, help='剪枝后微调的轮数')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--temperature', type=float, default=4.0, help='蒸馏温度')
+    parser.add_argument('--alpha', type=float, default=0.7, help='软标签损失的权重')
+    parser.add_argument('--latency-budget', type=float, default=5.0, help='单张图像CPU延迟预算（毫秒）')
+    parser.add_argument('--prune-amounts', type=float, nargs='+', default=[0.25, 0.5, 0.625, 0.75, 0.875])
+    parser.add_argument('--eval-samples', type=int, default=None, help='对比报告评估使用的测试样本数，默认全部')
+    args = parser.parse_args()
+    if not all(0 < amount < 1 for amount in args.prune_amounts):
+        parser.error(f'--prune-amounts必须在0到1之间，得到{args.prune_amounts}')
+
+    # 1. 教师模型
+    if os.path.exists(args.teacher):
+        teacher = load_model(args.teacher, 'crnn')
+    else:
+        print(f'{args.teacher}不存在，先训练CRNN教师模型')
+        teacher = CRNN(num_classes=args.num_classes)
+        ModelTrainer(
+            teacher, args.train_dir, args.test_dir, save_dir=os.path.dirname(args.teacher) or '.'
+        ).train(epochs=args.epochs, batch_size=args.batch_size)
+        # 保存到--teacher指定的路径，下次运行直接加载而不是重新训练
+        torch.save(teacher.state_dict(), args.teacher)
+        print(f'Teacher model saved to {args.teacher}')
+        teacher = load_model(args.teacher, 'crnn')
+    num_classes = teacher.fc.out_features
+
+    # 2. 用教师模型的软标签训练较窄的CNNMLP学生模型
+    student = CNNMLP(num_classes, channels=args.student_channels, hidden_sizes=args.student_hidden)
+    ModelTrainer(
+        student, args.train_dir, args.test_dir, save_dir=os.path.join(args.save_dir, _model_dir_name('student', student)),
+        teacher=teacher, distill_temperature=args.temperature, distill_alpha=args.alpha
+    ).train(epochs=args.epochs, batch_size=args.batch_size)
+
+    # 3. 剪枝到满足延迟预算，再在教师指导下微调
+    models = {'CRNN（教师）': teacher, 'CNN+MLP学生': student}
+    pruned, amount = prune_to_budget(student, args.latency_budget, amounts=args.prune_amounts)
+    if amount > 0:
+        pruned_dir = _model_dir_name(f'pruned_{amount:g}', pruned)
+        ModelTrainer(
+            pruned, args.train_dir, args.test_dir, save_dir=os.path.join(args.save_dir, pruned_dir),
+            teacher=teacher, distill_temperature=args.temperature, distill_alpha=args.alpha
+        ).train(epochs=args.fine_tune_epochs, batch_size=args.batch_size)
+        models[f'CNN+MLP学生（剪枝{amount:.1%}）'] = pruned
+
+    # 4. 准确率、大小、延迟放在同一张报告里
+    compare_models(
+        args.train_dir, args.test_dir, batch_size=args.batch_size, trained_models=models,
+        latency_budget_ms=args.latency_budget, eval_samples=args.eval_samples
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -6,12 +6,16 @@ class CRNN(nn.Module):
     CRNN（Convolutional Recurrent Neural Network）模型，用于手写汉字识别
     结合卷积神经网络提取图像特征，循环神经网络处理序列特征
     """
-    def __init__(self, num_classes=1000):
+    # 模型类型标识，用于检查点命名和输出形状判断（被DistributedDataParallel等包装后isinstance不再适用）
+    model_type = 'crnn'
+    
+    def __init__(self, num_classes=1000, input_height=64):
         """
         初始化CRNN模型
         
         Args:
             num_classes: 分类数量，即汉字数量
+            input_height: 输入图像高度，需为16的倍数，决定LSTM的输入维度
         """
         super(CRNN, self).__init__()
         
@@ -54,15 +58,24 @@ class CRNN(nn.Module):
         )
         
         # 循环层：处理序列特征
-        # 初始化为None，在第一次前向传播时根据实际输入维度创建
-        self.lstm1 = None
+        # 卷积输出高度为H/16-1（第七层卷积核为2且无填充），每列特征维度为512 * (H/16-1)
+        if input_height % 16 != 0 or input_height < 32:
+            raise ValueError(f'input_height必须是不小于32的16的倍数，得到{input_height}')
+        self.num_classes = num_classes
+        self.input_height = input_height
+        lstm_input_size = 512 * (input_height // 16 - 1)
+        self.lstm1 = nn.LSTM(lstm_input_size, 256, bidirectional=True, batch_first=False)  # 双向LSTM
         self.lstm2 = nn.LSTM(512, 256, bidirectional=True, batch_first=False)   # 双向LSTM
         
         # 全连接层：分类输出
         self.fc = nn.Linear(512, num_classes)
-        
-        # 标记是否已经初始化LSTM
-        self.lstm_initialized = False
+    
+    @property
+    def config(self):
+        """
+        构造参数，写入检查点，用于恢复训练时确认模型结构一致
+        """
+        return {'num_classes': self.num_classes, 'input_height': self.input_height}
     
     def forward(self, x):
         """
@@ -81,22 +94,10 @@ class CRNN(nn.Module):
         # conv_out形状: (batch_size, channels, height, width)
         batch_size, channels, height, width = conv_out.size()
         
-        # 计算LSTM输入维度
-        lstm_input_size = channels * height
-        
         # 将height和channels合并，作为序列长度
         # 输出形状: (width, batch_size, channels * height)
         rnn_in = conv_out.permute(3, 0, 1, 2)
-        rnn_in = rnn_in.contiguous().view(width, batch_size, -1)
-        
-        # 动态初始化LSTM层
-        if not self.lstm_initialized:
-            # 根据实际输入维度创建LSTM层
-            self.lstm1 = nn.LSTM(lstm_input_size, 256, bidirectional=True, batch_first=False)
-            # 将模型移动到正确的设备
-            device = next(self.parameters()).device
-            self.lstm1 = self.lstm1.to(device)
-            self.lstm_initialized = True
+        rnn_in = rnn_in.contiguous().view(width, batch_size, channels * height)
         
         # 循环特征提取
         rnn_out1, _ = self.lstm1(rnn_in)
@@ -1,48 +1,232 @@
+import hashlib
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 import torch
-from torch.utils.data import Dataset, DataLoader
-from torchvision import transforms
+from PIL import Image
+from torch.utils.data import Dataset, DataLoader, Subset
+from image_transforms import IMAGE_SIZE, build_default_transform, to_normalized_tensor
+from packed import PackedHandwritingDataset, is_packed
+from gnt import GntDataset, is_gnt_dir
+
+# 预处理缓存格式版本，缓存内容的计算方式变化时递增
+CACHE_VERSION = 1
+# 样本索引清单的文件名和格式版本
+MANIFEST_NAME = '.handwriting_index.npz'
+MANIFEST_VERSION = 1
+
+
+def _scan_class_dir(path):
+    """
+    列出类别目录下的PNG文件名（在线程池中执行，os.scandir的系统调用会释放GIL）
+    """
+    with os.scandir(path) as entries:
+        return sorted(entry.name for entry in entries if entry.name.endswith('.png'))
+
+
+def build_index(data_dir, workers=None):
+    """
+    并行扫描data/<label>/*.png目录树
+
+    Args:
+        data_dir: 数据目录路径
+        workers: 扫描线程数，为None时根据CPU核数选择
+
+    Returns:
+        dict: class_dirs(类别目录名)、dir_mtimes(目录修改时间)、dir_ids/file_names/labels(逐样本数组)
+    """
+    with os.scandir(data_dir) as entries:
+        class_dirs = sorted(entry.name for entry in entries if entry.is_dir() and entry.name.isdigit())
+    paths = [os.path.join(data_dir, class_dir) for class_dir in class_dirs]
+    dir_mtimes = np.array([os.stat(path).st_mtime_ns for path in paths], dtype=np.int64)
+
+    workers = workers or min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        file_lists = list(executor.map(_scan_class_dir, paths))
+
+    counts = np.array([len(files) for files in file_lists], dtype=np.int64)
+    dir_ids = np.repeat(np.arange(len(class_dirs), dtype=np.int32), counts)
+    labels = np.repeat(np.array([int(class_dir) for class_dir in class_dirs], dtype=np.int32), counts)
+    file_names = np.array([name for files in file_lists for name in files], dtype=str)
+    return {
+        'class_dirs': np.array(class_dirs, dtype=str),
+        'dir_mtimes': dir_mtimes,
+        'dir_ids': dir_ids,
+        'file_names': file_names,
+        'labels': labels,
+    }
+
+
+def load_index(data_dir, use_manifest=True):
+    """
+    读取数据目录的样本索引：清单存在且所有类别目录的修改时间都没有变化时直接使用清单，否则重新扫描并写出清单
+    在目录中增删文件会更新该目录的修改时间，因此清单会自动失效
+
+    Args:
+        data_dir: 数据目录路径
+        use_manifest: 是否读写清单文件
+
+    Returns:
+        dict: 同build_index
+    """
+    manifest_path = os.path.join(data_dir, MANIFEST_NAME)
+    if use_manifest and os.path.exists(manifest_path):
+        try:
+            with np.load(manifest_path) as manifest:
+                index = {key: manifest[key] for key in manifest.files}
+            if int(index.pop('version')) == MANIFEST_VERSION:
+                with os.scandir(data_dir) as entries:
+                    class_dirs = sorted(entry.name for entry in entries if entry.is_dir() and entry.name.isdigit())
+                if class_dirs == index['class_dirs'].tolist():
+                    dir_mtimes = [os.stat(os.path.join(data_dir, class_dir)).st_mtime_ns for class_dir in class_dirs]
+                    if np.array_equal(dir_mtimes, index['dir_mtimes']):
+                        return index
+        except (OSError, ValueError, KeyError) as e:
+            print(f'样本索引清单无效，重新扫描: {manifest_path} ({str(e)})')
+
+    index = build_index(data_dir)
+    if use_manifest:
+        try:
+            tmp_path = os.path.join(data_dir, f'.handwriting_index.{os.getpid()}.tmp.npz')
+            np.savez(tmp_path, version=MANIFEST_VERSION, **index)
+            os.replace(tmp_path, manifest_path)
+        except OSError as e:
+            # 只读的数据目录：不保存清单
+            print(f'无法写入样本索引清单{manifest_path}: {str(e)}')
+    return index
+
 
 class HandwritingDataset(Dataset):
     """
     手写汉字数据集加载器
     """
-    def __init__(self, data_dir, transform=None):
+    def __init__(self, data_dir, transform=None, cache_dir=None, augment=None, image_size=IMAGE_SIZE,
+                 use_manifest=True):
         """
         初始化数据集
         
         Args:
             data_dir: 数据目录路径
-            transform: 图像变换
+            transform: 图像变换，对cv2读取的灰度图执行；指定时不使用预处理缓存
+            cache_dir: 预处理缓存目录，为None时不缓存。缓存保存解码并缩放后的uint8图像，
+                       从第二个epoch开始跳过PNG解码和缩放
+            augment: 数据增强，对归一化后的张量执行，缓存之后照常生效
+            image_size: 默认变换的输出大小(高, 宽)
+            use_manifest: 是否把样本索引保存为数据目录下的清单文件，之后构建数据集时直接读取
         """
         self.data_dir = data_dir
         self.transform = transform
-        self.image_paths = []
-        self.labels = []
+        self.augment = augment
+        self.image_size = tuple(image_size)
+        self.use_manifest = use_manifest
+        
+        # 默认变换只构建一次，不再在每个样本上重新创建
+        self.default_transform = build_default_transform(self.image_size)
         
         # 加载数据
         self._load_data()
+        
+        self.cache_path = None
+        self._cache_images = None
+        self._cache_filled = None
+        if cache_dir is not None:
+            if transform is not None:
+                print('指定了自定义transform，预处理缓存已禁用')
+            else:
+                self._init_cache(cache_dir)
     
     def _load_data(self):
         """
-        加载数据路径和标签
+        加载数据路径和标签：路径拆成类别目录编号和文件名两个数组，标签为int32数组
         """
-        for label_dir in os.listdir(self.data_dir):
-            label_path = os.path.join(self.data_dir, label_dir)
-            if os.path.isdir(label_path):
-                for image_file in os.listdir(label_path):
-                    if image_file.endswith('.png'):
-                        image_path = os.path.join(label_path, image_file)
-                        self.image_paths.append(image_path)
-                        self.labels.append(int(label_dir))
+        index = load_index(self.data_dir, use_manifest=self.use_manifest)
+        self.class_dirs = index['class_dirs'].tolist()
+        self.dir_ids = index['dir_ids']
+        self.file_names = index['file_names']
+        self.labels = index['labels']
+    
+    def image_path(self, idx):
+        """
+        获取样本的图像路径
+        """
+        return os.path.join(self.data_dir, self.class_dirs[self.dir_ids[idx]], str(self.file_names[idx]))
+    
+    @property
+    def image_paths(self):
+        return [self.image_path(idx) for idx in range(len(self))]
     
     def __len__(self):
         """
         获取数据集大小
         """
-        return len(self.image_paths)
+        return len(self.labels)
+    
+    def fingerprint(self):
+        """
+        数据集指纹：由样本路径、标签和默认变换的配置决定，任何一项变化都会使用新的缓存文件
+        """
+        digest = hashlib.sha1()
+        digest.update(f'v{CACHE_VERSION}|{self.image_size}|bilinear|{os.path.abspath(self.data_dir)}|'.encode('utf-8'))
+        digest.update('\0'.join(self.class_dirs).encode('utf-8'))
+        for array in (self.dir_ids, self.file_names, self.labels):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()[:16]
+    
+    def _init_cache(self, cache_dir):
+        """
+        创建或复用预处理缓存：images为(N, H, W)的uint8数组，filled标记哪些样本已经写入
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_path = os.path.join(cache_dir, f'handwriting_{self.fingerprint()}')
+        images_path = self.cache_path + '_images.npy'
+        filled_path = self.cache_path + '_filled.npy'
+        if not (os.path.exists(images_path) and os.path.exists(filled_path)):
+            # 新建的文件是稀疏的，只有实际写入的样本占用磁盘
+            height, width = self.image_size
+            np.lib.format.open_memmap(
+                images_path, mode='w+', dtype=np.uint8, shape=(len(self), height, width)
+            ).flush()
+            np.lib.format.open_memmap(
+                filled_path, mode='w+', dtype=np.bool_, shape=(len(self),)
+            ).flush()
+        filled = np.load(filled_path, mmap_mode='r')
+        print(f'预处理缓存: {self.cache_path}，已缓存{int(filled.sum())}/{len(filled)}个样本')
+    
+    def _open_cache(self):
+        # 每个进程各自映射缓存文件，DataLoader工作进程写入的样本对其他进程立即可见
+        self._cache_images = np.load(self.cache_path + '_images.npy', mmap_mode='r+')
+        self._cache_filled = np.load(self.cache_path + '_filled.npy', mmap_mode='r+')
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_cache_images'] = None
+        state['_cache_filled'] = None
+        return state
+    
+    def _load_resized(self, idx):
+        """
+        读取并缩放到模型输入大小的uint8灰度图，与默认变换中的ToPILImage + Resize相同
+        """
+        image = cv2.imread(self.image_path(idx), cv2.IMREAD_GRAYSCALE)
+        height, width = self.image_size
+        image = Image.fromarray(image).resize((width, height), Image.BILINEAR)
+        return np.asarray(image)
+    
+    def _cached_image(self, idx):
+        """
+        从预处理缓存中读取样本，未命中时解码、缩放并写入缓存
+        """
+        if self._cache_images is None:
+            self._open_cache()
+        if self._cache_filled[idx]:
+            return np.array(self._cache_images[idx])
+        image = self._load_resized(idx)
+        self._cache_images[idx] = image
+        # 先写图像再置位，其他进程看到标记时图像已经写完
+        self._cache_filled[idx] = True
+        return image
     
     def __getitem__(self, idx):
         """
@@ -55,53 +239,193 @@ class HandwritingDataset(Dataset):
             image: 预处理后的图像张量
             label: 标签
         """
-        # 读取图像
-        image_path = self.image_paths[idx]
-        image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-        
-        # 图像预处理
-        if self.transform:
-            image = self.transform(image)
+        if self.cache_path is not None:
+            # 缓存的是缩放后的uint8图像，归一化和数据增强在读取后执行
+            image = to_normalized_tensor(self._cached_image(idx))
+            if self.augment:
+                image = self.augment(image)
         else:
-            # 默认变换
-            transform = transforms.Compose([
-                transforms.ToPILImage(),
-                transforms.Resize((64, 256)),
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.5], std=[0.5])
-            ])
-            image = transform(image)
+            # 读取图像
+            image_path = self.image_path(idx)
+            image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+            
+            # 图像预处理
+            if self.transform:
+                image = self.transform(image)
+            else:
+                image = self.default_transform(image)
+                if self.augment:
+                    image = self.augment(image)
         
-        label = self.labels[idx]
+        label = int(self.labels[idx])
         return image, label
 
+    def __getitems__(self, indices):
+        """
+        批量获取样本，DataLoader会直接调用它并把结果交给collate_fn
+        
+        Args:
+            indices: 样本索引列表
+            
+        Returns:
+            tuple: (图像张量(N, 1, H, W), 标签张量(N,))
+        """
+        if self.cache_path is not None and self.augment is None:
+            # 缓存命中时整批一次归一化
+            images = to_normalized_tensor(np.stack([self._cached_image(idx) for idx in indices]))
+        else:
+            images = torch.stack([self[idx][0] for idx in indices])
+        labels = torch.from_numpy(self.labels[indices].astype(np.int64))
+        return images, labels
+
 class DataLoaderFactory:
     """
     数据加载器工厂类
     """
+    # tune_num_workers的结果，同一个数据集只测一次
+    _tuned_workers = {}
+    
     @staticmethod
-    def get_dataloader(data_dir, batch_size=32, shuffle=True, num_workers=0):
+    def get_dataset(data_dir, char_dict=None, cache_dir=None):
+        """
+        根据路径类型创建数据集
+        
+        Args:
+            data_dir: 数据目录路径，打包数据集的分片前缀/分片目录，或.gnt文件目录
+            char_dict: .gnt数据集使用的char_dict（字典或文件路径），为None时根据数据集构建
+            cache_dir: PNG目录数据集的预处理缓存目录，为None时不缓存
+            
+        Returns:
+            Dataset: 数据集
+        """
+        if is_packed(data_dir):
+            return PackedHandwritingDataset(data_dir)
+        if is_gnt_dir(data_dir):
+            return GntDataset(data_dir, char_dict=char_dict)
+        return HandwritingDataset(data_dir, cache_dir=cache_dir)
+    
+    @staticmethod
+    def _build_loader(dataset, batch_size, shuffle, num_workers, pin_memory, persistent_workers, prefetch_factor,
+                      sampler=None):
+        options = {}
+        if num_workers > 0:
+            # 工作进程在epoch之间保留，不再每个epoch重新启动并重新打开数据文件
+            options['persistent_workers'] = persistent_workers
+            if prefetch_factor is not None:
+                options['prefetch_factor'] = prefetch_factor
+        return DataLoader(
+            dataset,
+            batch_size=batch_size,
+            shuffle=shuffle if sampler is None else False,
+            sampler=sampler,
+            num_workers=num_workers,
+            pin_memory=pin_memory,
+            collate_fn=DataLoaderFactory.collate_fn,
+            **options
+        )
+    
+    @staticmethod
+    def subset(dataset, max_samples):
+        """
+        在整个数据集上等间隔抽取至多max_samples个样本
+        PNG目录数据集按类别排序，只取前max_samples个样本会集中在少数几个类别上
+        
+        Args:
+            dataset: 数据集
+            max_samples: 最大样本数
+            
+        Returns:
+            Dataset: 数据集本身（样本数不超过max_samples时）或Subset
+        """
+        if max_samples is None or max_samples >= len(dataset):
+            return dataset
+        indices = np.linspace(0, len(dataset) - 1, num=max_samples).astype(np.int64)
+        return Subset(dataset, np.unique(indices).tolist())
+    
+    @staticmethod
+    def get_dataloader(data_dir, batch_size=32, shuffle=True, num_workers=0, char_dict=None, cache_dir=None,
+                       pin_memory=None, persistent_workers=True, prefetch_factor=None, max_samples=None):
         """
         获取数据加载器
         
         Args:
-            data_dir: 数据目录路径
+            data_dir: 数据目录路径，打包数据集的分片前缀/分片目录，或.gnt文件目录
             batch_size: 批次大小
             shuffle: 是否打乱数据
-            num_workers: 工作线程数
+            num_workers: 工作进程数；为'auto'时先试跑几个候选值，选出最快的
+            char_dict: .gnt数据集使用的char_dict（字典或文件路径），为None时根据数据集构建
+            cache_dir: PNG目录数据集的预处理缓存目录，为None时不缓存
+            pin_memory: 是否使用锁页内存，为None时在有CUDA时启用
+            persistent_workers: 是否在epoch之间保留工作进程（num_workers > 0时生效）
+            prefetch_factor: 每个工作进程预取的批次数（num_workers > 0时生效），为None时使用PyTorch默认值
+            max_samples: 只使用等间隔抽取的至多max_samples个样本（校准、快速评估用），为None时使用全部样本
             
         Returns:
             DataLoader: 数据加载器
         """
-        dataset = HandwritingDataset(data_dir)
-        dataloader = DataLoader(
-            dataset,
-            batch_size=batch_size,
-            shuffle=shuffle,
-            num_workers=num_workers,
-            collate_fn=DataLoaderFactory.collate_fn
+        dataset = DataLoaderFactory.get_dataset(data_dir, char_dict=char_dict, cache_dir=cache_dir)
+        dataset = DataLoaderFactory.subset(dataset, max_samples)
+        if pin_memory is None:
+            pin_memory = torch.cuda.is_available()
+        if num_workers == 'auto':
+            num_workers = DataLoaderFactory.tune_num_workers(
+                dataset, batch_size, pin_memory=pin_memory, prefetch_factor=prefetch_factor
+            )
+        return DataLoaderFactory._build_loader(
+            dataset, batch_size, shuffle, num_workers, pin_memory, persistent_workers, prefetch_factor
         )
-        return dataloader
+    
+    @staticmethod
+    def tune_num_workers(dataset, batch_size, candidates=None, probe_batches=10, pin_memory=False,
+                         prefetch_factor=None):
+        """
+        试跑几个工作进程数，选出吞吐最高的一个
+        每个候选值先取一批作为预热（不计入进程启动耗时），再计时probe_batches批
+        
+        Args:
+            dataset: 数据集
+            batch_size: 批次大小
+            candidates: 候选的工作进程数，为None时根据CPU核数生成
+            probe_batches: 每个候选值计时的批次数
+            pin_memory: 是否使用锁页内存
+            prefetch_factor: 每个工作进程预取的批次数
+            
+        Returns:
+            int: 最快的工作进程数
+        """
+        if candidates is None:
+            cpu_count = os.cpu_count() or 1
+            candidates = [0] + [n for n in (2, 4, 8, 16) if n <= cpu_count]
+        key = (type(dataset).__name__, getattr(dataset, 'data_dir', None), len(dataset), batch_size, tuple(candidates))
+        if key in DataLoaderFactory._tuned_workers:
+            return DataLoaderFactory._tuned_workers[key]
+        
+        best_workers, best_rate = candidates[0], 0.0
+        for num_workers in candidates:
+            loader = DataLoaderFactory._build_loader(
+                dataset, batch_size, True, num_workers, pin_memory, False, prefetch_factor
+            )
+            iterator = iter(loader)
+            batches = 0
+            try:
+                next(iterator)
+                start = time.perf_counter()
+                for _ in range(probe_batches):
+                    next(iterator)
+                    batches += 1
+            except StopIteration:
+                pass
+            elapsed = time.perf_counter() - start if batches else 0.0
+            del iterator
+            
+            rate = batches / elapsed if elapsed > 0 else 0.0
+            print(f'num_workers={num_workers}: {rate:.1f} batches/s')
+            if rate > best_rate:
+                best_workers, best_rate = num_workers, rate
+        
+        print(f'选择num_workers={best_workers}')
+        DataLoaderFactory._tuned_workers[key] = best_workers
+        return best_workers
     
     @staticmethod
     def collate_fn(batch):
@@ -109,12 +433,14 @@ class DataLoaderFactory:
         自定义批次处理函数
         
         Args:
-            batch: 批次数据
+            batch: 批次数据；数据集实现了__getitems__时已经是拼好的(images, labels)
             
         Returns:
             images: 图像张量
-            labels: 标签列表
+            labels: 标签张量
         """
+        if isinstance(batch, tuple):
+            return batch
         images, labels = zip(*batch)
         images = torch.stack(images, 0)
         labels = torch.tensor(labels)
@@ -0,0 +1,204 @@
+import argparse
+import os
+import random
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data.distributed import DistributedSampler
+
+from crnn import CRNN
+from cnn_mlp import CNNMLP
+from dataset import DataLoaderFactory
+from train import ModelTrainer
+
+
+class DistributedTrainer(ModelTrainer):
+    """
+    基于torch.distributed（gloo后端）的数据并行训练器
+    每个进程持有一份模型副本，DistributedSampler切分数据集，反向传播时all-reduce梯度，
+    每个epoch的损失和准确率跨进程汇总；检查点、图表和日志只由rank 0写出
+    """
+
+    def __init__(self, model, train_dir, test_dir, save_dir='./saved_models', **kwargs):
+        """
+        初始化分布式训练器，调用前需要先init_process_group
+
+        Args:
+            model: 要训练的模型
+            train_dir: 训练数据目录
+            test_dir: 测试数据目录
+            save_dir: 模型保存目录
+            **kwargs: 传给ModelTrainer的其他参数
+        """
+        self.rank = dist.get_rank()
+        self.world_size = dist.get_world_size()
+        super().__init__(model, train_dir, test_dir, save_dir=save_dir, **kwargs)
+        self.is_main_process = self.rank == 0
+
+        # gloo在CPU上通信；DDP构造时从rank 0广播参数，各进程从相同的初始权重开始
+        self.model = DistributedDataParallel(self.module)
+
+    def build_dataloaders(self, batch_size, cache_dir=None, num_workers=0, pin_memory=None,
+                          prefetch_factor=None):
+        """
+        构建按rank切分的数据加载器；batch_size为每个进程的批次大小
+        测试集同样切分，DistributedSampler会补齐少量重复样本使各进程批次数一致
+        """
+        if num_workers == 'auto':
+            # 自动选择会在每个进程里各自试跑，分布式时按CPU核数平分
+            num_workers = max(0, (os.cpu_count() or 1) // self.world_size - 1)
+        if pin_memory is None:
+            pin_memory = False
+
+        train_dataset = DataLoaderFactory.get_dataset(self.train_dir, cache_dir=cache_dir)
+        test_dataset = DataLoaderFactory.get_dataset(
+            self.test_dir, char_dict=getattr(train_dataset, 'char_dict', None), cache_dir=cache_dir
+        )
+        train_dataloader = DataLoaderFactory._build_loader(
+            train_dataset, batch_size, True, num_workers, pin_memory, True, prefetch_factor,
+            sampler=DistributedSampler(train_dataset, num_replicas=self.world_size, rank=self.rank, shuffle=True)
+        )
+        test_dataloader = DataLoaderFactory._build_loader(
+            test_dataset, batch_size, False, num_workers, pin_memory, True, prefetch_factor,
+            sampler=DistributedSampler(test_dataset, num_replicas=self.world_size, rank=self.rank, shuffle=False)
+        )
+        return train_dataloader, test_dataloader
+
+    def _reduce_metrics(self, running_loss, correct, total, num_batches):
+        """
+        一次all-reduce汇总所有进程的损失、正确数、样本数和批次数
+        """
+        metrics = torch.stack([
+            running_loss.detach().double(),
+            correct.double(),
+            torch.tensor(float(total), dtype=torch.float64, device=running_loss.device),
+            torch.tensor(float(num_batches), dtype=torch.float64, device=running_loss.device),
+        ])
+        dist.all_reduce(metrics, op=dist.ReduceOp.SUM)
+        loss_sum, correct_sum, total_sum, batches_sum = metrics.tolist()
+        return loss_sum / batches_sum, correct_sum / total_sum, int(total_sum)
+
+    def _collect_rng_state(self):
+        """
+        收集所有进程的随机数状态到rank 0，每个进程的数据增强等随机序列各自恢复
+        """
+        states = [None] * self.world_size if self.is_main_process else None
+        dist.gather_object(self._rng_state(), states, dst=0)
+        return states
+    
+    def _restore_rng_state(self, rng_state):
+        if isinstance(rng_state, list) and len(rng_state) == self.world_size:
+            self._set_rng_state(rng_state[self.rank])
+        else:
+            # 检查点来自不同的进程数（或单进程训练），保留run中按rank设置的种子
+            self._log('检查点中的随机数状态与当前进程数不匹配，不恢复随机数状态')
+    
+    def _resume_epoch(self):
+        """
+        由rank 0判断并读取检查点，再广播给所有进程；
+        多机训练时只有rank 0的机器上有检查点，各进程必须从同一个epoch开始，否则集合通信会卡住
+        """
+        payload = [None]
+        if self.is_main_process and os.path.exists(self.checkpoint_path):
+            try:
+                payload[0] = self._read_checkpoint(self.checkpoint_path)
+            except ValueError as e:
+                # 检查点不匹配时也要完成广播，让所有进程一起报错退出
+                payload[0] = e
+        dist.broadcast_object_list(payload, src=0)
+        checkpoint = payload[0]
+        if isinstance(checkpoint, Exception):
+            raise checkpoint
+        if checkpoint is None:
+            return 0
+        return self._apply_checkpoint(checkpoint, self.checkpoint_path)
+    
+    def save_checkpoint(self, epoch):
+        super().save_checkpoint(epoch)
+        # 其他进程等待rank 0写完，之后的恢复不会读到旧检查点
+        dist.barrier()
+
+
+def _seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def run(rank, world_size, args):
+    """
+    单个训练进程的入口
+
+    Args:
+        rank: 全局rank
+        world_size: 进程总数
+        args: 命令行参数
+    """
+    if not dist.is_initialized():
+        dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    try:
+        # 每个进程平分CPU核，避免多个进程的intra-op线程互相争抢
+        torch.set_num_threads(args.threads or max(1, (os.cpu_count() or 1) // args.local_processes))
+        # 所有进程使用相同的种子构建模型，DDP再以rank 0的参数为准
+        _seed_everything(args.seed)
+
+        if args.model == 'crnn':
+            model = CRNN(num_classes=args.num_classes)
+        else:
+            model = CNNMLP(num_classes=args.num_classes)
+
+        trainer = DistributedTrainer(
+            model, args.train_dir, args.test_dir, save_dir=args.save_dir,
+            amp=args.amp, channels_last=args.channels_last,
+            accumulation_steps=args.accumulation_steps, progress_bar=False
+        )
+        # 数据增强等随机性在各进程之间错开
+        _seed_everything(args.seed + rank)
+        trainer.train(
+            epochs=args.epochs, batch_size=args.batch_size, cache_dir=args.cache_dir,
+            num_workers=args.num_workers, checkpoint_interval=args.checkpoint_interval, resume=args.resume
+        )
+    finally:
+        dist.destroy_process_group()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多进程/多机数据并行训练（gloo后端，CPU）')
+    parser.add_argument('--model', choices=['crnn', 'cnn_mlp'], default='crnn')
+    parser.add_argument('--train-dir', default='../../data/train')
+    parser.add_argument('--test-dir', default='../../data/test')
+    parser.add_argument('--save-dir', default='./saved_models')
+    parser.add_argument('--cache-dir', default=None)
+    parser.add_argument('--num-classes', type=int, default=3755)
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=64, help='每个进程的批次大小')
+    parser.add_argument('--num-workers', type=int, default=0)
+    parser.add_argument('--accumulation-steps', type=int, default=1)
+    parser.add_argument('--checkpoint-interval', type=int, default=1)
+    parser.add_argument('--amp', action='store_true')
+    parser.add_argument('--channels-last', action='store_true')
+    parser.add_argument('--resume', action='store_true', help='从save_dir中的检查点继续训练')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=None, help='每个进程的intra-op线程数')
+    parser.add_argument('--nprocs', type=int, default=2,
+                        help='单机启动的进程数；由torchrun启动时忽略，使用WORLD_SIZE/RANK环境变量')
+    args = parser.parse_args()
+
+    if 'RANK' in os.environ and 'WORLD_SIZE' in os.environ:
+        # 由torchrun启动（可跨多台机器），每个进程各自调用run
+        args.local_processes = int(os.environ.get('LOCAL_WORLD_SIZE', 1))
+        run(int(os.environ['RANK']), int(os.environ['WORLD_SIZE']), args)
+        return
+
+    # 单机多进程，便于本地测试
+    os.environ.setdefault('MASTER_ADDR', '127.0.0.1')
+    os.environ.setdefault('MASTER_PORT', '29500')
+    args.local_processes = args.nprocs
+    mp.spawn(run, args=(args.nprocs, args), nprocs=args.nprocs, join=True)
+
+
+if __name__ == '__main__':
+    main()
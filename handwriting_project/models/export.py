@@ -0,0 +1,191 @@
+import argparse
+import os
+
+import torch
+import torch.nn as nn
+
+from crnn import CRNN
+from cnn_mlp import CNNMLP
+from image_transforms import IMAGE_SIZE
+
+
+def load_state_dict(checkpoint_path):
+    """
+    读取模型权重；兼容*_final.pth/*_best.pth权重文件和ModelTrainer保存的完整检查点
+    """
+    state_dict = torch.load(checkpoint_path, map_location='cpu')
+    if 'model_state_dict' in state_dict:
+        state_dict = state_dict['model_state_dict']
+    return state_dict
+
+
+def load_model(checkpoint_path, model_type=None):
+    """
+    根据检查点构建模型并加载权重
+
+    Args:
+        checkpoint_path: 检查点路径
+        model_type: 'crnn'或'cnn_mlp'，为None时根据权重推断
+
+    Returns:
+        nn.Module: eval模式的模型
+    """
+    state_dict = load_state_dict(checkpoint_path)
+    if model_type is None:
+        model_type = 'crnn' if 'fc.weight' in state_dict else 'cnn_mlp'
+
+    if model_type == 'crnn':
+        model = CRNN(num_classes=state_dict['fc.weight'].shape[0], input_height=IMAGE_SIZE[0])
+        model.load_state_dict(state_dict)
+    elif model_type == 'cnn_mlp':
+        model = CNNMLP.from_state_dict(state_dict, input_size=IMAGE_SIZE)
+    else:
+        raise ValueError(f'不支持的模型类型: {model_type}')
+
+    model.eval()
+    return model
+
+
+class InferenceModel(nn.Module):
+    """
+    推理用的包装模型：统一输出(batch_size, num_classes)的logits
+    CRNN与训练时一致取最后一个时间步，CNNMLP直接输出
+    """
+
+    def __init__(self, model):
+        super(InferenceModel, self).__init__()
+        self.model = model
+        self.last_timestep = model.model_type == 'crnn'
+
+    def forward(self, x):
+        outputs = self.model(x)
+        if self.last_timestep:
+            outputs = outputs[-1]
+        return outputs
+
+
+def export_torchscript(model, output_path, optimize=True):
+    """
+    把模型导出为TorchScript
+
+    Args:
+        model: eval模式的CRNN或CNNMLP
+        output_path: 输出文件路径
+        optimize: 是否冻结并做推理优化（折叠BatchNorm、常量传播等）
+
+    Returns:
+        torch.jit.ScriptModule: 导出的模型
+    """
+    scripted = torch.jit.script(InferenceModel(model).eval())
+    if optimize:
+        scripted = torch.jit.optimize_for_inference(torch.jit.freeze(scripted))
+
+    # 导出后立即校验：与eager模式的输出一致
+    height, width = IMAGE_SIZE
+    example = torch.randn(2, 1, height, width)
+    with torch.no_grad():
+        expected = InferenceModel(model).eval()(example)
+        actual = scripted(example)
+    max_diff = (expected - actual).abs().max().item()
+    if max_diff > 1e-3:
+        raise RuntimeError(f'TorchScript输出与eager模式不一致，最大误差{max_diff:.6f}')
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    scripted.save(output_path)
+    print(f'TorchScript model saved to {output_path} (max diff {max_diff:.2e})')
+    return scripted
+
+
+def export_onnx(model, output_path, opset_version=17, verify=True):
+    """
+    把模型导出为ONNX，batch维为动态轴，供onnxruntime推理
+
+    Args:
+        model: eval模式的CRNN或CNNMLP
+        output_path: 输出文件路径
+        opset_version: ONNX opset版本
+        verify: 安装了onnxruntime时，用不同的批次大小校验输出与eager模式一致
+
+    Returns:
+        str: 输出文件路径
+    """
+    wrapper = InferenceModel(model).eval()
+    height, width = IMAGE_SIZE
+    example = torch.randn(1, 1, height, width)
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    torch.onnx.export(
+        wrapper, example, output_path,
+        input_names=['image'],
+        output_names=['logits'],
+        dynamic_axes={'image': {0: 'batch_size'}, 'logits': {0: 'batch_size'}},
+        opset_version=opset_version,
+        do_constant_folding=True,
+    )
+
+    if verify:
+        try:
+            import onnxruntime
+        except ImportError:
+            print('onnxruntime未安装，跳过ONNX输出校验')
+        else:
+            session = onnxruntime.InferenceSession(output_path, providers=['CPUExecutionProvider'])
+            # 导出时的示例批次大小为1，用另一个批次大小确认batch维确实是动态的
+            check = torch.randn(3, 1, height, width)
+            with torch.no_grad():
+                expected = wrapper(check).numpy()
+            actual = session.run(None, {'image': check.numpy()})[0]
+            max_diff = float(abs(expected - actual).max())
+            if max_diff > 1e-3:
+                raise RuntimeError(f'ONNX输出与eager模式不一致，最大误差{max_diff:.6f}')
+            print(f'ONNX output verified (max diff {max_diff:.2e})')
+
+    print(f'ONNX model saved to {output_path}')
+    return output_path
+
+
+def compile_model(model, **kwargs):
+    """
+    用torch.compile编译推理模型（PyTorch 2.x），用于进程内推理；编译在第一次调用时发生
+
+    Args:
+        model: eval模式的CRNN或CNNMLP
+        **kwargs: 传给torch.compile的参数，例如mode='max-autotune'
+
+    Returns:
+        编译后的模型，输出(batch_size, num_classes)的logits
+    """
+    return torch.compile(InferenceModel(model).eval(), **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导出训练好的模型用于推理')
+    subparsers = parser.add_subparsers(dest='format', required=True)
+
+    torchscript_parser = subparsers.add_parser('torchscript', help='导出TorchScript')
+    torchscript_parser.add_argument('--no-optimize', action='store_true', help='不冻结、不做推理优化')
+
+    onnx_parser = subparsers.add_parser('onnx', help='导出ONNX（动态batch维）')
+    onnx_parser.add_argument('--opset', type=int, default=17, help='ONNX opset版本')
+    onnx_parser.add_argument('--no-verify', action='store_true', help='不用onnxruntime校验导出结果')
+
+    for sub in (torchscript_parser, onnx_parser):
+        sub.add_argument('checkpoint', help='检查点路径，例如saved_models/crnn_final.pth')
+        sub.add_argument('output', help='输出文件路径')
+        sub.add_argument('--model-type', choices=['crnn', 'cnn_mlp'], default=None,
+                         help='模型类型，默认根据权重推断')
+
+    args = parser.parse_args()
+    model = load_model(args.checkpoint, args.model_type)
+    if args.format == 'torchscript':
+        export_torchscript(model, args.output, optimize=not args.no_optimize)
+    elif args.format == 'onnx':
+        export_onnx(model, args.output, opset_version=args.opset, verify=not args.no_verify)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+import bisect
+import mmap
+import os
+import pickle
+import struct
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from image_transforms import build_default_transform
+
+# .gnt样本头：sample_size(4字节小端) + tagcode(2字节GB2312，大端) + width(2字节小端) + height(2字节小端)
+GNT_HEADER = struct.Struct('<I2sHH')
+
+# 旁路索引，每个样本一条：像素数据在文件中的偏移、高、宽、tagcode
+GNT_INDEX_DTYPE = np.dtype([
+    ('offset', '<u8'),
+    ('height', '<u2'),
+    ('width', '<u2'),
+    ('tagcode', '<u2'),
+])
+INDEX_SUFFIX = '.idx.npy'
+
+
+def tagcode_to_char(tagcode):
+    """
+    把GB2312的tagcode转换成汉字
+    """
+    return struct.pack('>H', tagcode).decode('gb2312')
+
+
+def scan_gnt_file(file_path):
+    """
+    扫描一遍.gnt文件，只解析样本头，不读取像素
+
+    Args:
+        file_path: .gnt文件路径
+
+    Returns:
+        numpy.ndarray: GNT_INDEX_DTYPE结构化索引
+    """
+    records = []
+    if os.path.getsize(file_path) == 0:
+        return np.array(records, dtype=GNT_INDEX_DTYPE)
+
+    header_size = GNT_HEADER.size
+    unpack_from = GNT_HEADER.unpack_from
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        end = len(mm)
+        pos = 0
+        while pos + header_size <= end:
+            sample_size, tag, width, height = unpack_from(mm, pos)
+            if header_size + width * height != sample_size or pos + sample_size > end:
+                print(f'{file_path}: 偏移{pos}处的样本头损坏，停止扫描')
+                break
+            records.append((pos + header_size, height, width, (tag[0] << 8) | tag[1]))
+            pos += sample_size
+    return np.array(records, dtype=GNT_INDEX_DTYPE)
+
+
+def load_gnt_index(file_path, rebuild=False):
+    """
+    读取.gnt文件的旁路索引；索引不存在或比.gnt文件旧时重新扫描并写出
+
+    Args:
+        file_path: .gnt文件路径
+        rebuild: 是否强制重新扫描
+
+    Returns:
+        numpy.ndarray: GNT_INDEX_DTYPE结构化索引
+    """
+    index_path = file_path + INDEX_SUFFIX
+    if (not rebuild and os.path.exists(index_path)
+            and os.path.getmtime(index_path) >= os.path.getmtime(file_path)):
+        try:
+            index = np.load(index_path)
+            if index.dtype == GNT_INDEX_DTYPE:
+                return index
+        except (OSError, ValueError) as e:
+            print(f'索引文件损坏，重新扫描: {index_path} ({str(e)})')
+
+    index = scan_gnt_file(file_path)
+    try:
+        # 先写临时文件再替换，并发的DataLoader工作进程不会读到写了一半的索引
+        tmp_path = f'{file_path}.{os.getpid()}.tmp.npy'
+        np.save(tmp_path, index)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        # 只读的数据目录：索引只保留在内存中
+        print(f'无法写入索引文件{index_path}: {str(e)}')
+    return index
+
+
+def list_gnt_files(path):
+    """
+    列出目录下的.gnt文件；path本身是.gnt文件时直接返回
+    """
+    if os.path.isfile(path):
+        return [path]
+    return [
+        os.path.join(path, file_name)
+        for file_name in sorted(os.listdir(path))
+        if file_name.endswith('.gnt')
+    ]
+
+
+def is_gnt_dir(path):
+    """
+    判断路径是否为.gnt文件或包含.gnt文件的目录
+    """
+    if os.path.isfile(path):
+        return path.endswith('.gnt')
+    return os.path.isdir(path) and any(file_name.endswith('.gnt') for file_name in os.listdir(path))
+
+
+def build_char_dict(indexes):
+    """
+    根据索引中的tagcode构建char_dict，与gnt2png.py相同：按汉字排序后编号
+
+    Args:
+        indexes: GNT_INDEX_DTYPE索引列表
+
+    Returns:
+        dict: 汉字到类别索引的字典
+    """
+    tagcodes = set()
+    for index in indexes:
+        tagcodes.update(np.unique(index['tagcode']).tolist())
+    chars = sorted(tagcode_to_char(tagcode) for tagcode in tagcodes)
+    return dict(zip(chars, range(len(chars))))
+
+
+def iter_gnt_file(file_path):
+    """
+    逐个读取.gnt文件中的样本
+
+    Args:
+        file_path: .gnt文件路径
+
+    Yields:
+        tuple: (图像(H, W)的uint8数组, tagcode)
+    """
+    index = load_gnt_index(file_path)
+    with open(file_path, 'rb') as f:
+        for offset, height, width, tagcode in index:
+            height, width = int(height), int(width)
+            f.seek(int(offset))
+            image = np.frombuffer(f.read(height * width), dtype=np.uint8)
+            yield image.reshape(height, width), int(tagcode)
+
+
+class GntDataset(Dataset):
+    """
+    直接读取CASIA-HWDB .gnt文件的手写汉字数据集
+    每个.gnt文件只扫描一次并写出旁路索引，之后通过mmap随机访问样本，不需要先转换成PNG
+    """
+
+    def __init__(self, path, char_dict=None, transform=None, rebuild_index=False):
+        """
+        初始化数据集
+
+        Args:
+            path: .gnt文件目录，或单个.gnt文件
+            char_dict: 汉字到类别索引的字典或char_dict文件路径；为None时根据本数据集的字符构建。
+                       测试集应传入训练集的char_dict，保证类别编号一致
+            transform: 图像变换
+            rebuild_index: 是否强制重新扫描.gnt文件
+        """
+        self.files = list_gnt_files(path)
+        if not self.files:
+            raise FileNotFoundError(f'找不到.gnt文件: {path}')
+
+        if transform is None:
+            transform = build_default_transform()
+        self.transform = transform
+
+        indexes = [load_gnt_index(file_path, rebuild=rebuild_index) for file_path in self.files]
+
+        if isinstance(char_dict, (str, os.PathLike)):
+            with open(char_dict, 'rb') as f:
+                char_dict = pickle.load(f)
+        if char_dict is None:
+            char_dict = build_char_dict(indexes)
+        self.char_dict = char_dict
+
+        # tagcode到类别索引的查找表，字典里没有的字符记为-1并过滤掉
+        lookup = np.full(1 << 16, -1, dtype=np.int32)
+        for char, label in char_dict.items():
+            try:
+                code = char.encode('gb2312')
+            except UnicodeEncodeError:
+                continue
+            if len(code) == 2:
+                lookup[(code[0] << 8) | code[1]] = label
+
+        self.indexes = []
+        self.labels_per_file = []
+        for index in indexes:
+            labels = lookup[index['tagcode']]
+            keep = labels >= 0
+            self.indexes.append(index[keep])
+            self.labels_per_file.append(labels[keep])
+        skipped = sum(len(index) for index in indexes) - sum(len(index) for index in self.indexes)
+        if skipped:
+            print(f'跳过{skipped}个不在char_dict中的样本')
+
+        self.cumulative_sizes = np.cumsum([len(index) for index in self.indexes]).tolist()
+        self.labels = np.concatenate(self.labels_per_file)
+
+        # mmap在每个进程中懒打开，DataLoader工作进程各自映射文件
+        self._maps = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_maps'] = None
+        return state
+
+    def _open(self):
+        maps = []
+        for file_path, index in zip(self.files, self.indexes):
+            if not len(index):
+                maps.append(None)
+                continue
+            with open(file_path, 'rb') as f:
+                maps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        self._maps = maps
+
+    def __len__(self):
+        """
+        获取数据集大小
+        """
+        return self.cumulative_sizes[-1] if self.cumulative_sizes else 0
+
+    def get_image(self, idx):
+        """
+        获取原始灰度图（mmap上的只读视图，不复制）
+
+        Args:
+            idx: 样本索引
+
+        Returns:
+            tuple: (图像(H, W)的uint8数组, 标签)
+        """
+        if idx < 0:
+            idx += len(self)
+        if self._maps is None:
+            self._open()
+        file_id = bisect.bisect_right(self.cumulative_sizes, idx)
+        local = idx - (self.cumulative_sizes[file_id - 1] if file_id else 0)
+        offset, height, width, _ = self.indexes[file_id][local]
+        height, width = int(height), int(width)
+        image = np.frombuffer(self._maps[file_id], dtype=np.uint8, count=height * width, offset=int(offset))
+        return image.reshape(height, width), int(self.labels_per_file[file_id][local])
+
+    def __getitem__(self, idx):
+        """
+        获取单个样本
+
+        Args:
+            idx: 样本索引
+
+        Returns:
+            image: 预处理后的图像张量
+            label: 标签
+        """
+        image, label = self.get_image(idx)
+        if self.transform:
+            image = self.transform(image)
+        return image, label
+
+    def __getitems__(self, indices):
+        """
+        批量获取样本，DataLoader会直接调用它并把结果交给collate_fn
+
+        Args:
+            indices: 样本索引列表
+
+        Returns:
+            tuple: (图像张量(N, 1, H, W), 标签张量(N,))
+        """
+        images = torch.stack([self[idx][0] for idx in indices])
+        labels = torch.from_numpy(self.labels[indices].astype(np.int64))
+        return images, labels
+
+
+if __name__ == '__main__':
+    # 预先为.gnt目录建立索引并保存char_dict
+    import sys
+
+    gnt_dir = sys.argv[1] if len(sys.argv) > 1 else '../../wordDatas/trn_gnt'
+    dataset = GntDataset(gnt_dir, rebuild_index=True)
+    print(f'{len(dataset.files)}个.gnt文件，{len(dataset)}个样本，{len(dataset.char_dict)}个字符')
+    with open('char_dict', 'wb') as f:
+        pickle.dump(dataset.char_dict, f)
@@ -0,0 +1,39 @@
+# 模型输入大小(高, 宽)：训练、导出、识别后端和基准测试都从这里导入
+# torch和torchvision在函数内导入，只需要IMAGE_SIZE的Django服务和benchmark.py不必安装PyTorch
+IMAGE_SIZE = (64, 256)
+
+
+def build_default_transform(image_size=IMAGE_SIZE):
+    """
+    构建默认图像变换
+    
+    Args:
+        image_size: 输出大小(高, 宽)
+        
+    Returns:
+        transforms.Compose: 图像变换
+    """
+    from torchvision import transforms
+
+    return transforms.Compose([
+        transforms.ToPILImage(),
+        transforms.Resize(image_size),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=[0.5], std=[0.5])
+    ])
+
+
+def to_normalized_tensor(image):
+    """
+    把uint8灰度图转换成(1, H, W)的张量，计算方式与ToTensor + Normalize(0.5, 0.5)相同
+    
+    Args:
+        image: (H, W)的uint8数组，或(N, H, W)的一批图像
+        
+    Returns:
+        torch.Tensor: 归一化到[-1, 1]的float32张量，(1, H, W)或(N, 1, H, W)
+    """
+    import torch
+
+    tensor = torch.from_numpy(image).unsqueeze(-3).float().div_(255)
+    return tensor.sub_(0.5).div_(0.5)
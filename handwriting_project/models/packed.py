@@ -0,0 +1,376 @@
+import argparse
+import bisect
+import glob
+import os
+import pickle
+
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from image_transforms import build_default_transform
+from gnt import iter_gnt_file, tagcode_to_char
+
+# 打包分片格式：
+#   <prefix>.bin      所有样本的uint8灰度像素按行优先顺序首尾相接
+#   <prefix>.idx.npy  结构化索引，每个样本一条 (offset, height, width, label)
+PACKED_INDEX_DTYPE = np.dtype([
+    ('offset', '<u8'),
+    ('height', '<u2'),
+    ('width', '<u2'),
+    ('label', '<i4'),
+])
+DATA_SUFFIX = '.bin'
+INDEX_SUFFIX = '.idx.npy'
+
+
+def shard_paths(path):
+    """
+    解析打包分片路径
+
+    Args:
+        path: 分片前缀（不含后缀），或包含若干分片的目录
+
+    Returns:
+        list: 排好序的分片前缀列表，不是打包数据时为空列表
+    """
+    if os.path.isfile(path + INDEX_SUFFIX):
+        return [path]
+    if os.path.isdir(path):
+        indexes = sorted(glob.glob(os.path.join(path, '*' + INDEX_SUFFIX)))
+        return [index_path[:-len(INDEX_SUFFIX)] for index_path in indexes]
+    return []
+
+
+def is_packed(path):
+    """
+    判断路径是否为打包数据集
+    """
+    return bool(shard_paths(path))
+
+
+class PackedShardWriter:
+    """
+    打包分片写入器
+    像素数据顺序追加到临时数据文件，finish时写出临时索引，commit时把两者替换到正式路径；
+    半途中断时调用abort删除临时文件，不会留下看起来完整的残缺分片
+    """
+
+    def __init__(self, prefix):
+        """
+        初始化分片写入器
+
+        Args:
+            prefix: 分片前缀（不含后缀）
+        """
+        self.prefix = prefix
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._data_tmp = prefix + DATA_SUFFIX + '.tmp'
+        self._index_tmp = prefix + '.idx.tmp.npy'
+        self._data = open(self._data_tmp, 'wb')
+        self._records = []
+        self._offset = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, image, label):
+        """
+        追加一个样本
+
+        Args:
+            image: (H, W)的uint8灰度图
+            label: 类别索引
+        """
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        if image.ndim != 2:
+            raise ValueError(f'只支持单通道图像，得到的形状为{image.shape}')
+        height, width = image.shape
+        self._data.write(image.data)
+        self._records.append((self._offset, height, width, label))
+        self._offset += image.size
+
+    def finish(self):
+        """
+        关闭数据文件并把索引写到临时文件，此时分片仍不可读
+        """
+        if self._data.closed:
+            return
+        self._data.close()
+        np.save(self._index_tmp, np.array(self._records, dtype=PACKED_INDEX_DTYPE))
+
+    def commit(self):
+        """
+        把数据文件和索引替换到正式路径；索引最后替换，分片只有在两者都就位后才可读
+        """
+        self.finish()
+        os.replace(self._data_tmp, self.prefix + DATA_SUFFIX)
+        os.replace(self._index_tmp, self.prefix + INDEX_SUFFIX)
+
+    def abort(self):
+        """
+        放弃写入，删除临时文件；已存在的正式分片不受影响
+        """
+        self._data.close()
+        for path in (self._data_tmp, self._index_tmp):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self):
+        """
+        写出索引并提交分片
+        """
+        self.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class _ShardedWriter:
+    """
+    按样本数自动切换分片的写入器
+    写满的分片先保留为临时文件，全部成功后才一起提交，中断时一起删除
+    """
+
+    def __init__(self, prefix, max_samples_per_shard=None):
+        self.prefix = prefix
+        self.max_samples_per_shard = max_samples_per_shard
+        self.shards = []
+        self.total = 0
+        self._writers = []
+
+    def add(self, image, label):
+        if not self._writers or (
+            self.max_samples_per_shard and len(self._writers[-1]) >= self.max_samples_per_shard
+        ):
+            self._roll()
+        self._writers[-1].add(image, label)
+        self.total += 1
+
+    def _roll(self):
+        if self._writers:
+            self._writers[-1].finish()
+        if self.max_samples_per_shard:
+            # 分片写到以prefix命名的目录下，PackedHandwritingDataset可以直接读取整个目录
+            prefix = os.path.join(self.prefix, f'shard-{len(self.shards):05d}')
+        else:
+            prefix = self.prefix
+        self._writers.append(PackedShardWriter(prefix))
+        self.shards.append(prefix)
+
+    def close(self):
+        if not self._writers:
+            self._roll()
+        for writer in self._writers:
+            writer.commit()
+
+    def abort(self):
+        for writer in self._writers:
+            writer.abort()
+
+
+def pack_gnt_dir(gnt_dir, output, char_dict, max_samples_per_shard=None):
+    """
+    把.gnt目录直接转换成打包数据集，不经过PNG
+
+    Args:
+        gnt_dir: .gnt文件目录
+        output: 输出分片前缀；指定max_samples_per_shard时为输出目录
+        char_dict: 汉字到类别索引的字典
+        max_samples_per_shard: 每个分片的最大样本数，None表示只写一个分片
+
+    Returns:
+        int: 写入的样本数
+    """
+    writer = _ShardedWriter(output, max_samples_per_shard)
+    skipped = 0
+    try:
+        for file_name in sorted(os.listdir(gnt_dir)):
+            if not file_name.endswith('.gnt'):
+                continue
+            for image, tagcode in iter_gnt_file(os.path.join(gnt_dir, file_name)):
+                label = char_dict.get(tagcode_to_char(tagcode))
+                if label is None:
+                    skipped += 1
+                    continue
+                writer.add(image, label)
+            print(f'{file_name}: 已写入{writer.total}个样本')
+    except BaseException:
+        # 包括Ctrl-C：删除临时文件，不留下残缺分片
+        writer.abort()
+        raise
+    writer.close()
+    if skipped:
+        print(f'跳过{skipped}个不在字典中的样本')
+    return writer.total
+
+
+def pack_png_tree(data_dir, output, max_samples_per_shard=None):
+    """
+    把gnt2png.py生成的data/<label>/*.png目录树转换成打包数据集
+
+    Args:
+        data_dir: PNG数据目录，子目录名为类别索引
+        output: 输出分片前缀；指定max_samples_per_shard时为输出目录
+        max_samples_per_shard: 每个分片的最大样本数，None表示只写一个分片
+
+    Returns:
+        int: 写入的样本数
+    """
+    writer = _ShardedWriter(output, max_samples_per_shard)
+    try:
+        for label_dir in sorted(os.listdir(data_dir)):
+            label_path = os.path.join(data_dir, label_dir)
+            # 与build_index一致，只读取数字命名的类别目录（跳过.ipynb_checkpoints等）
+            if not label_dir.isdigit() or not os.path.isdir(label_path):
+                continue
+            label = int(label_dir)
+            for image_file in sorted(os.listdir(label_path)):
+                if not image_file.endswith('.png'):
+                    continue
+                image = cv2.imread(os.path.join(label_path, image_file), cv2.IMREAD_GRAYSCALE)
+                if image is None:
+                    print(f'无法读取图像: {os.path.join(label_path, image_file)}')
+                    continue
+                writer.add(image, label)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return writer.total
+
+
+class PackedHandwritingDataset(Dataset):
+    """
+    打包格式的手写汉字数据集
+    通过np.memmap读取分片，__getitem__返回的是映射内存上的视图，不打开文件、不解码PNG
+    """
+
+    def __init__(self, path, transform=None):
+        """
+        初始化数据集
+
+        Args:
+            path: 分片前缀，或包含若干分片的目录
+            transform: 图像变换
+        """
+        self.shards = shard_paths(path)
+        if not self.shards:
+            raise FileNotFoundError(f'找不到打包数据集: {path}')
+
+        if transform is None:
+            transform = build_default_transform()
+        self.transform = transform
+
+        self.indexes = [np.load(shard + INDEX_SUFFIX) for shard in self.shards]
+        self.cumulative_sizes = np.cumsum([len(index) for index in self.indexes]).tolist()
+        self.labels = np.concatenate([index['label'] for index in self.indexes])
+
+        # memmap在每个进程中懒打开，DataLoader工作进程不会复制整个数据文件
+        self._data = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def _open(self):
+        self._data = [
+            np.memmap(shard + DATA_SUFFIX, dtype=np.uint8, mode='r') if len(index) else None
+            for shard, index in zip(self.shards, self.indexes)
+        ]
+
+    def __len__(self):
+        """
+        获取数据集大小
+        """
+        return self.cumulative_sizes[-1] if self.cumulative_sizes else 0
+
+    def get_image(self, idx):
+        """
+        获取原始灰度图（只读视图，不复制）
+
+        Args:
+            idx: 样本索引
+
+        Returns:
+            tuple: (图像(H, W)的uint8数组, 标签)
+        """
+        if idx < 0:
+            idx += len(self)
+        if self._data is None:
+            self._open()
+        shard = bisect.bisect_right(self.cumulative_sizes, idx)
+        local = idx - (self.cumulative_sizes[shard - 1] if shard else 0)
+        offset, height, width, label = self.indexes[shard][local]
+        offset = int(offset)
+        image = self._data[shard][offset:offset + int(height) * int(width)].reshape(int(height), int(width))
+        return image, int(label)
+
+    def __getitem__(self, idx):
+        """
+        获取单个样本
+
+        Args:
+            idx: 样本索引
+
+        Returns:
+            image: 预处理后的图像张量
+            label: 标签
+        """
+        image, label = self.get_image(idx)
+        if self.transform:
+            image = self.transform(image)
+        return image, label
+
+    def __getitems__(self, indices):
+        """
+        批量获取样本，DataLoader会直接调用它并把结果交给collate_fn
+
+        Args:
+            indices: 样本索引列表
+
+        Returns:
+            tuple: (图像张量(N, 1, H, W), 标签张量(N,))
+        """
+        images = torch.stack([self[idx][0] for idx in indices])
+        labels = torch.from_numpy(self.labels[indices].astype(np.int64))
+        return images, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description='把手写汉字数据转换成打包分片格式')
+    subparsers = parser.add_subparsers(dest='source', required=True)
+
+    gnt_parser = subparsers.add_parser('gnt', help='从CASIA-HWDB的.gnt文件转换')
+    gnt_parser.add_argument('gnt_dir', help='.gnt文件目录')
+    gnt_parser.add_argument('output', help='输出分片前缀或目录')
+    gnt_parser.add_argument('--char-dict', default='../../char_dict', help='char_dict文件路径')
+
+    png_parser = subparsers.add_parser('png', help='从gnt2png.py生成的PNG目录树转换')
+    png_parser.add_argument('data_dir', help='PNG数据目录，例如data/train')
+    png_parser.add_argument('output', help='输出分片前缀或目录')
+
+    for sub in (gnt_parser, png_parser):
+        sub.add_argument('--shard-size', type=int, default=None, help='每个分片的最大样本数')
+
+    args = parser.parse_args()
+    if args.source == 'gnt':
+        with open(args.char_dict, 'rb') as f:
+            char_dict = pickle.load(f)
+        total = pack_gnt_dir(args.gnt_dir, args.output, char_dict, args.shard_size)
+    else:
+        total = pack_png_tree(args.data_dir, args.output, args.shard_size)
+    print(f'打包完成，共{total}个样本，输出: {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import argparse
+import copy
+import os
+
+import torch
+import torch.nn as nn
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+from dataset import DataLoaderFactory
+from export import InferenceModel, export_torchscript, load_model
+from image_transforms import IMAGE_SIZE
+from train import ModelEvaluator, measure_latency, state_dict_bytes
+
+
+def default_backend():
+    """
+    选择量化算子后端：新版PyTorch的x86后端（fbgemm + onednn），否则fbgemm
+    """
+    supported = torch.backends.quantized.supported_engines
+    return 'x86' if 'x86' in supported else 'fbgemm'
+
+
+def dynamic_quantize(model):
+    """
+    动态量化：Linear和LSTM的权重量化为int8，激活值在运行时按批次量化
+
+    Args:
+        model: eval模式的fp32模型
+
+    Returns:
+        nn.Module: 量化后的模型（原模型不变）
+    """
+    return quantize_dynamic(copy.deepcopy(model).eval(), {nn.Linear, nn.LSTM}, dtype=torch.qint8)
+
+
+def _calibrate(model, dataloader):
+    with torch.inference_mode():
+        for images, _ in dataloader:
+            model(images)
+
+
+def static_quantize(model, calibration_loader, backend=None):
+    """
+    静态量化（FX图模式）：在校准数据上统计激活值范围后，把卷积（及CNNMLP的全连接层）转换成int8算子
+    CRNN只对卷积部分做静态量化，LSTM和全连接层另外做动态量化
+
+    Args:
+        model: eval模式的fp32模型
+        calibration_loader: 校准数据加载器
+        backend: 量化算子后端，为None时自动选择
+
+    Returns:
+        nn.Module: 量化后的模型（原模型不变）
+    """
+    backend = backend or default_backend()
+    torch.backends.quantized.engine = backend
+    qconfig_mapping = get_default_qconfig_mapping(backend)
+    height, width = IMAGE_SIZE
+    example_inputs = (torch.randn(1, 1, height, width),)
+
+    model = copy.deepcopy(model).eval()
+    if model.model_type == 'crnn':
+        # 卷积部分是一条Sequential，可以单独追踪；Conv + BatchNorm + ReLU在prepare_fx时融合
+        model.cnn = prepare_fx(model.cnn, qconfig_mapping, example_inputs)
+        _calibrate(model, calibration_loader)
+        model.cnn = convert_fx(model.cnn)
+        return quantize_dynamic(model, {nn.Linear, nn.LSTM}, dtype=torch.qint8)
+
+    prepared = prepare_fx(model, qconfig_mapping, example_inputs)
+    _calibrate(prepared, calibration_loader)
+    quantized = convert_fx(prepared)
+    # 追踪得到的GraphModule不再是CNNMLP，保留类型标识供ModelEvaluator和InferenceModel使用
+    quantized.model_type = model.model_type
+    return quantized
+
+
+def main():
+    parser = argparse.ArgumentParser(description='训练后int8量化，并与fp32模型对比准确率、大小和延迟')
+    parser.add_argument('checkpoint', help='检查点路径，例如saved_models/crnn_final.pth')
+    parser.add_argument('output', help='量化后的TorchScript模型输出路径，可由识别服务的torchscript后端加载')
+    parser.add_argument('--model-type', choices=['crnn', 'cnn_mlp'], default=None,
+                        help='模型类型，默认根据权重推断')
+    parser.add_argument('--mode', choices=['dynamic', 'static'], default='static',
+                        help='dynamic只量化Linear/LSTM；static另外对卷积做校准后的静态量化')
+    parser.add_argument('--test-dir', default='../../data/test')
+    parser.add_argument('--calibration-samples', type=int, default=1024, help='校准使用的测试样本数')
+    parser.add_argument('--eval-samples', type=int, default=None, help='评估使用的测试样本数，默认全部')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--backend', default=None, help='量化算子后端（x86/fbgemm/qnnpack），默认自动选择')
+    args = parser.parse_args()
+
+    model = load_model(args.checkpoint, args.model_type)
+    if args.mode == 'dynamic':
+        quantized = dynamic_quantize(model)
+    else:
+        calibration_loader = DataLoaderFactory.get_dataloader(
+            args.test_dir, batch_size=args.batch_size, shuffle=False, max_samples=args.calibration_samples
+        )
+        quantized = static_quantize(model, calibration_loader, backend=args.backend)
+
+    # 量化算子只在CPU上运行，fp32模型也在CPU上评估以便对比
+    fp32_accuracy = ModelEvaluator(model, args.test_dir, device='cpu').evaluate(
+        batch_size=args.batch_size, max_samples=args.eval_samples, plot_confusion_matrix=False
+    )
+    int8_accuracy = ModelEvaluator(quantized, args.test_dir, device='cpu').evaluate(
+        batch_size=args.batch_size, max_samples=args.eval_samples, plot_confusion_matrix=False
+    )
+
+    fp32_size = state_dict_bytes(model)
+    int8_size = state_dict_bytes(quantized)
+    fp32_latency = measure_latency(InferenceModel(model).eval())
+    int8_latency = measure_latency(InferenceModel(quantized).eval())
+
+    print(f'\n=== {model.model_type} {args.mode}量化报告 ===')
+    print(f'准确率: fp32 {fp32_accuracy:.4f}, int8 {int8_accuracy:.4f}, '
+          f'变化 {int8_accuracy - fp32_accuracy:+.4f}')
+    print(f'模型大小: fp32 {fp32_size / 2 ** 20:.1f} MB, int8 {int8_size / 2 ** 20:.1f} MB, '
+          f'缩小 {fp32_size / int8_size:.2f}x')
+    print(f'单张延迟: fp32 {fp32_latency:.2f} ms, int8 {int8_latency:.2f} ms, '
+          f'加速 {fp32_latency / int8_latency:.2f}x')
+
+    # 量化模块的state_dict无法直接载入fp32模型结构，以TorchScript形式交给识别服务
+    # optimize_for_inference的图改写针对fp32算子，这里不启用
+    export_torchscript(quantized, args.output, optimize=False)
+    print(f'Quantized model: {os.path.abspath(args.output)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,31 @@
 import torch
 import torch.optim as optim
 import torch.nn as nn
+import torch.nn.functional as F
 import matplotlib.pyplot as plt
 import seaborn as sns
+import argparse
+import copy
+import io
 import os
+import random
+import tempfile
+import time
+import numpy as np
+from contextlib import nullcontext
 from tqdm import tqdm
 from sklearn.metrics import accuracy_score, confusion_matrix
 from crnn import CRNN
 from cnn_mlp import CNNMLP
-from dataset import DataLoaderFactory
+from dataset import DataLoaderFactory, IMAGE_SIZE
 
 class ModelTrainer:
     """
     模型训练器类
     """
-    def __init__(self, model, train_dir, test_dir, save_dir='./saved_models'):
+    def __init__(self, model, train_dir, test_dir, save_dir='./saved_models', amp=False, channels_last=False,
+                 accumulation_steps=1, log_interval=50, progress_bar=True, teacher=None, distill_temperature=4.0,
+                 distill_alpha=0.7):
         """
         初始化模型训练器
         
@@ -23,11 +34,24 @@ class ModelTrainer:
             train_dir: 训练数据目录
             test_dir: 测试数据目录
             save_dir: 模型保存目录
+            amp: 是否使用混合精度（CPU上为bfloat16，CUDA上为float16）
+            channels_last: 是否对卷积部分使用channels-last内存格式
+            accumulation_steps: 梯度累积步数，等效批次大小为batch_size * accumulation_steps
+            log_interval: 每隔多少个批次把设备上累计的损失和准确率读回并显示一次
+            progress_bar: 是否显示tqdm进度条；关闭时每log_interval个批次打印一行日志
+            teacher: 知识蒸馏的教师模型（已训练），为None时只用真实标签训练
+            distill_temperature: 蒸馏温度，越高教师输出的软标签越平滑
+            distill_alpha: 损失中软标签（KL散度）项的权重，其余为真实标签的交叉熵
         """
         self.model = model
         self.train_dir = train_dir
         self.test_dir = test_dir
         self.save_dir = save_dir
+        self.amp = amp
+        self.channels_last = channels_last
+        self.accumulation_steps = max(1, int(accumulation_steps))
+        self.log_interval = max(1, int(log_interval))
+        self.progress_bar = progress_bar
         
         # 创建保存目录
         os.makedirs(self.save_dir, exist_ok=True)
@@ -35,6 +59,24 @@ class ModelTrainer:
         # 设备选择
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.model.to(self.device)
+        if self.channels_last:
+            # 只影响4维的卷积权重，LSTM和全连接层不变
+            self.model.to(memory_format=torch.channels_last)
+        
+        # 教师模型只做前向传播，不参与优化，也不写入检查点
+        self.teacher = teacher
+        self.distill_temperature = distill_temperature
+        self.distill_alpha = distill_alpha
+        if self.teacher is not None:
+            self.teacher.to(self.device)
+            if self.channels_last:
+                self.teacher.to(memory_format=torch.channels_last)
+            self.teacher.eval()
+            self.teacher.requires_grad_(False)
+        
+        # 混合精度：CPU上bfloat16不需要损失缩放，CUDA上float16需要GradScaler
+        self.amp_dtype = torch.bfloat16 if self.device.type == 'cpu' else torch.float16
+        self.scaler = torch.cuda.amp.GradScaler(enabled=self.amp and self.device.type == 'cuda')
         
         # 损失函数和优化器
         self.criterion = nn.CrossEntropyLoss()
@@ -50,6 +92,220 @@ class ModelTrainer:
         self.test_loss_history = []
         self.train_accuracy_history = []
         self.test_accuracy_history = []
+        self.train_throughput_history = []
+        self.best_test_loss = float('inf')
+        
+        # 只有主进程写文件、打印进度；分布式训练时由子类设置
+        self.is_main_process = True
+    
+    def _log(self, message):
+        if self.is_main_process:
+            print(message)
+    
+    @property
+    def module(self):
+        """
+        未包装的模型（分布式训练时self.model是DistributedDataParallel包装）
+        """
+        return getattr(self.model, 'module', self.model)
+    
+    @property
+    def model_type(self):
+        return self.module.model_type
+    
+    @property
+    def checkpoint_path(self):
+        return os.path.join(self.save_dir, f'{self.model_type}_checkpoint.pth')
+    
+    def _atomic_save(self, obj, path):
+        """
+        先写临时文件再原子替换，进程在保存中途被杀掉也不会损坏已有的文件；只在主进程中保存
+        """
+        if not self.is_main_process:
+            return
+        tmp_path = f'{path}.tmp'
+        torch.save(obj, tmp_path)
+        os.replace(tmp_path, path)
+    
+    def save_checkpoint(self, epoch):
+        """
+        保存完整训练状态：模型、优化器、学习率调度器、损失缩放器、训练历史和随机数状态
+        
+        Args:
+            epoch: 已完成的epoch数
+        """
+        checkpoint = {
+            'epoch': epoch,
+            'model_type': self.model_type,
+            'model_config': self.module.config,
+            'input_size': list(IMAGE_SIZE),
+            'model_state_dict': self.module.state_dict(),
+            'optimizer_state_dict': self.optimizer.state_dict(),
+            'scheduler_state_dict': self.scheduler.state_dict(),
+            'scaler_state_dict': self.scaler.state_dict(),
+            'history': {
+                'train_loss': self.train_loss_history,
+                'test_loss': self.test_loss_history,
+                'train_accuracy': self.train_accuracy_history,
+                'test_accuracy': self.test_accuracy_history,
+                'train_throughput': self.train_throughput_history,
+            },
+            'best_test_loss': self.best_test_loss,
+            'rng_state': self._collect_rng_state(),
+        }
+        self._atomic_save(checkpoint, self.checkpoint_path)
+        self._log(f'Checkpoint saved to {self.checkpoint_path}')
+    
+    def _check_compatible(self, checkpoint, path):
+        """
+        确认检查点与当前模型的类型、构造参数和输入大小一致，否则拒绝恢复
+        
+        Raises:
+            ValueError: 检查点与当前训练配置不一致
+        """
+        expected = {
+            'model_type': self.model_type,
+            'model_config': self.module.config,
+            'input_size': list(IMAGE_SIZE),
+        }
+        for key, value in expected.items():
+            if checkpoint.get(key) != value:
+                raise ValueError(
+                    f'检查点{path}的{key}为{checkpoint.get(key)}，与当前的{value}不一致，无法恢复训练；'
+                    f'请换一个save_dir或删除该检查点'
+                )
+    
+    def _rng_state(self):
+        return {
+            'python': random.getstate(),
+            'numpy': np.random.get_state(),
+            'torch': torch.get_rng_state(),
+            'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+        }
+    
+    def _set_rng_state(self, rng_state):
+        random.setstate(rng_state['python'])
+        np.random.set_state(rng_state['numpy'])
+        torch.set_rng_state(rng_state['torch'].cpu())
+        if rng_state['cuda'] is not None and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all([state.cpu() for state in rng_state['cuda']])
+    
+    def _collect_rng_state(self):
+        """
+        要写入检查点的随机数状态；分布式训练时子类收集每个进程各自的状态
+        """
+        return self._rng_state()
+    
+    def _restore_rng_state(self, rng_state):
+        if isinstance(rng_state, list):
+            # 分布式训练保存的检查点中是每个进程的状态列表，单进程恢复时使用rank 0的状态
+            rng_state = rng_state[0]
+        self._set_rng_state(rng_state)
+    
+    def _read_checkpoint(self, path):
+        checkpoint = torch.load(path, map_location=self.device, weights_only=False)
+        self._check_compatible(checkpoint, path)
+        return checkpoint
+    
+    def load_checkpoint(self, path=None):
+        """
+        从检查点恢复完整训练状态
+        
+        Args:
+            path: 检查点路径，默认为save_dir下的最新检查点
+            
+        Returns:
+            int: 已完成的epoch数，训练从下一个epoch继续
+        """
+        path = path or self.checkpoint_path
+        return self._apply_checkpoint(self._read_checkpoint(path), path)
+    
+    def _resume_epoch(self):
+        """
+        存在检查点时恢复训练状态；分布式训练时子类由rank 0决定并广播
+        
+        Returns:
+            int: 已完成的epoch数，没有检查点时为0
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return 0
+        return self.load_checkpoint()
+    
+    def _apply_checkpoint(self, checkpoint, path):
+        self.module.load_state_dict(checkpoint['model_state_dict'])
+        self.optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+        self.scheduler.load_state_dict(checkpoint['scheduler_state_dict'])
+        self.scaler.load_state_dict(checkpoint['scaler_state_dict'])
+        
+        history = checkpoint['history']
+        self.train_loss_history = list(history['train_loss'])
+        self.test_loss_history = list(history['test_loss'])
+        self.train_accuracy_history = list(history['train_accuracy'])
+        self.test_accuracy_history = list(history['test_accuracy'])
+        self.train_throughput_history = list(history.get('train_throughput', []))
+        self.best_test_loss = checkpoint['best_test_loss']
+        
+        self._restore_rng_state(checkpoint['rng_state'])
+        
+        self._log(f'Resumed from {path} (epoch {checkpoint["epoch"]})')
+        return checkpoint['epoch']
+    
+    def _autocast(self):
+        """
+        前向传播的混合精度上下文
+        """
+        if not self.amp:
+            return nullcontext()
+        return torch.autocast(device_type=self.device.type, dtype=self.amp_dtype)
+    
+    def _log_progress(self, pbar, desc, step, num_batches, running_loss, correct, total, start_time):
+        """
+        读回设备上的累计指标并显示；只在这里发生设备同步
+        """
+        if not self.is_main_process:
+            return
+        loss = running_loss.item() / step
+        accuracy = correct.item() / total
+        samples_per_sec = total / (time.perf_counter() - start_time)
+        if self.progress_bar:
+            pbar.set_postfix({'Loss': loss, 'Accuracy': accuracy, 'Samples/s': f'{samples_per_sec:.1f}'})
+        else:
+            print(f'{desc} [{step}/{num_batches}] Loss: {loss:.4f}, Accuracy: {accuracy:.4f}, '
+                  f'Samples/s: {samples_per_sec:.1f}')
+    
+    def _reduce_metrics(self, running_loss, correct, total, num_batches):
+        """
+        把累计的指标换算成平均损失和准确率；分布式训练时子类在这里跨进程汇总
+        
+        Returns:
+            tuple: (平均损失, 准确率, 样本总数)
+        """
+        return running_loss.item() / num_batches, correct.item() / total, total
+    
+    def _distillation_loss(self, images, outputs, labels):
+        """
+        知识蒸馏损失：alpha * T^2 * KL(学生软标签 || 教师软标签) + (1 - alpha) * 交叉熵
+        乘以T^2使软标签项的梯度量级不随温度变化
+        """
+        with torch.no_grad():
+            teacher_outputs = self.teacher(images)
+            if self.teacher.model_type == 'crnn':
+                teacher_outputs = teacher_outputs[-1, :, :]
+        temperature = self.distill_temperature
+        soft_loss = F.kl_div(
+            F.log_softmax(outputs.float() / temperature, dim=1),
+            F.softmax(teacher_outputs.float() / temperature, dim=1),
+            reduction='batchmean'
+        ) * temperature ** 2
+        hard_loss = self.criterion(outputs, labels)
+        return self.distill_alpha * soft_loss + (1 - self.distill_alpha) * hard_loss
+    
+    def _to_device(self, images, labels):
+        images = images.to(self.device, non_blocking=True)
+        labels = labels.to(self.device, non_blocking=True)
+        if self.channels_last:
+            images = images.contiguous(memory_format=torch.channels_last)
+        return images, labels
     
     def train_epoch(self, dataloader):
         """
@@ -63,45 +319,59 @@ class ModelTrainer:
             accuracy: 准确率
         """
         self.model.train()
-        running_loss = 0.0
-        correct = 0
+        # 损失和正确数累计在设备上，避免每个批次都调用.item()同步
+        running_loss = torch.zeros((), device=self.device)
+        correct = torch.zeros((), dtype=torch.long, device=self.device)
         total = 0
+        num_batches = len(dataloader)
+        start_time = time.perf_counter()
+        self.optimizer.zero_grad(set_to_none=True)
         
-        with tqdm(dataloader, desc='Training') as pbar:
-            for images, labels in pbar:
-                images = images.to(self.device)
-                labels = labels.to(self.device)
-                
-                # 前向传播
-                outputs = self.model(images)
+        with tqdm(dataloader, desc='Training', disable=not (self.progress_bar and self.is_main_process)) as pbar:
+            for step, (images, labels) in enumerate(pbar, 1):
+                images, labels = self._to_device(images, labels)
+                should_step = step % self.accumulation_steps == 0 or step == num_batches
                 
-                # 根据模型类型调整输出
-                if isinstance(self.model, CRNN):
-                    # CRNN输出形状: (seq_len, batch_size, num_classes)
-                    # 取最后一个时间步的输出作为预测结果
-                    outputs = outputs[-1, :, :]
-                # CNNMLP输出形状: (batch_size, num_classes)，无需调整
-                
-                # 计算损失
-                loss = self.criterion(outputs, labels)
-                
-                # 反向传播和优化
-                self.optimizer.zero_grad()
-                loss.backward()
-                self.optimizer.step()
+                # 分布式训练时，梯度累积的中间批次跳过梯度all-reduce
+                sync_context = nullcontext() if should_step or not hasattr(self.model, 'no_sync') else self.model.no_sync()
+                with sync_context:
+                    # 前向传播
+                    with self._autocast():
+                        outputs = self.model(images)
+                        
+                        # 根据模型类型调整输出
+                        if self.model_type == 'crnn':
+                            # CRNN输出形状: (seq_len, batch_size, num_classes)
+                            # 取最后一个时间步的输出作为预测结果
+                            outputs = outputs[-1, :, :]
+                        # CNNMLP输出形状: (batch_size, num_classes)，无需调整
+                        
+                        # 计算损失；蒸馏时加入教师模型的软标签
+                        if self.teacher is None:
+                            loss = self.criterion(outputs, labels)
+                        else:
+                            loss = self._distillation_loss(images, outputs, labels)
+                    
+                    # 反向传播：损失按累积步数缩放，每accumulation_steps个批次更新一次参数
+                    self.scaler.scale(loss / self.accumulation_steps).backward()
+                if should_step:
+                    self.scaler.step(self.optimizer)
+                    self.scaler.update()
+                    self.optimizer.zero_grad(set_to_none=True)
                 
                 # 统计损失
-                running_loss += loss.item()
+                running_loss += loss.detach()
                 
                 # 计算准确率
-                _, predicted = torch.max(outputs.data, 1)
+                predicted = outputs.detach().argmax(1)
                 total += labels.size(0)
-                correct += (predicted == labels).sum().item()
+                correct += (predicted == labels).sum()
                 
-                pbar.set_postfix({'Loss': running_loss/len(pbar), 'Accuracy': correct/total})
+                if step % self.log_interval == 0 or step == num_batches:
+                    self._log_progress(pbar, 'Training', step, num_batches, running_loss, correct, total, start_time)
         
-        avg_loss = running_loss / len(dataloader)
-        accuracy = correct / total
+        avg_loss, accuracy, total = self._reduce_metrics(running_loss, correct, total, num_batches)
+        self.train_throughput_history.append(total / (time.perf_counter() - start_time))
         return avg_loss, accuracy
     
     def evaluate(self, dataloader):
@@ -116,66 +386,106 @@ class ModelTrainer:
             accuracy: 准确率
         """
         self.model.eval()
-        running_loss = 0.0
-        correct = 0
+        running_loss = torch.zeros((), device=self.device)
+        correct = torch.zeros((), dtype=torch.long, device=self.device)
         total = 0
+        num_batches = len(dataloader)
+        start_time = time.perf_counter()
         
         with torch.no_grad():
-            with tqdm(dataloader, desc='Evaluating') as pbar:
-                for images, labels in pbar:
-                    images = images.to(self.device)
-                    labels = labels.to(self.device)
+            with tqdm(dataloader, desc='Evaluating', disable=not (self.progress_bar and self.is_main_process)) as pbar:
+                for step, (images, labels) in enumerate(pbar, 1):
+                    images, labels = self._to_device(images, labels)
                     
                     # 前向传播
-                    outputs = self.model(images)
-                    
-                    # 根据模型类型调整输出
-                    if isinstance(self.model, CRNN):
-                        # CRNN输出形状: (seq_len, batch_size, num_classes)
-                        # 取最后一个时间步的输出作为预测结果
-                        outputs = outputs[-1, :, :]
-                    # CNNMLP输出形状: (batch_size, num_classes)，无需调整
-                    
-                    # 计算损失
-                    loss = self.criterion(outputs, labels)
-                    running_loss += loss.item()
+                    with self._autocast():
+                        outputs = self.model(images)
+                        
+                        # 根据模型类型调整输出
+                        if self.model_type == 'crnn':
+                            # CRNN输出形状: (seq_len, batch_size, num_classes)
+                            # 取最后一个时间步的输出作为预测结果
+                            outputs = outputs[-1, :, :]
+                        # CNNMLP输出形状: (batch_size, num_classes)，无需调整
+                        
+                        # 计算损失
+                        loss = self.criterion(outputs, labels)
+                    running_loss += loss
                     
                     # 计算准确率
-                    _, predicted = torch.max(outputs.data, 1)
+                    predicted = outputs.argmax(1)
                     total += labels.size(0)
-                    correct += (predicted == labels).sum().item()
+                    correct += (predicted == labels).sum()
                     
-                    pbar.set_postfix({'Loss': running_loss/len(pbar), 'Accuracy': correct/total})
+                    if step % self.log_interval == 0 or step == num_batches:
+                        self._log_progress(pbar, 'Evaluating', step, num_batches, running_loss, correct, total, start_time)
         
-        avg_loss = running_loss / len(dataloader)
-        accuracy = correct / total
+        avg_loss, accuracy, _ = self._reduce_metrics(running_loss, correct, total, num_batches)
         return avg_loss, accuracy
     
-    def train(self, epochs=50, batch_size=32):
+    def build_dataloaders(self, batch_size, cache_dir=None, num_workers=0, pin_memory=None,
+                          prefetch_factor=None):
+        """
+        构建训练和测试数据加载器
+        
+        Returns:
+            tuple: (训练数据加载器, 测试数据加载器)
+        """
+        train_dataloader = DataLoaderFactory.get_dataloader(
+            self.train_dir, batch_size=batch_size, shuffle=True, cache_dir=cache_dir,
+            num_workers=num_workers, pin_memory=pin_memory, prefetch_factor=prefetch_factor
+        )
+        # 直接读取.gnt文件时，测试集沿用训练集的char_dict，保证类别编号一致；工作进程数也沿用训练集的选择
+        test_dataloader = DataLoaderFactory.get_dataloader(
+            self.test_dir, batch_size=batch_size, shuffle=False,
+            char_dict=getattr(train_dataloader.dataset, 'char_dict', None), cache_dir=cache_dir,
+            num_workers=train_dataloader.num_workers, pin_memory=pin_memory, prefetch_factor=prefetch_factor
+        )
+        return train_dataloader, test_dataloader
+    
+    def train(self, epochs=50, batch_size=32, cache_dir=None, num_workers=0, pin_memory=None,
+              prefetch_factor=None, checkpoint_interval=1, resume=False):
         """
         训练模型
         
         Args:
             epochs: 训练轮数
             batch_size: 批次大小
+            cache_dir: 预处理缓存目录，为None时不缓存
+            num_workers: 数据加载的工作进程数，为'auto'时先试跑几个候选值再选择（需显式开启）
+            pin_memory: 是否使用锁页内存，为None时在有CUDA时启用
+            prefetch_factor: 每个工作进程预取的批次数
+            checkpoint_interval: 每隔多少个epoch保存一次完整训练状态
+            resume: 是否从save_dir中的检查点继续训练；检查点的模型结构或输入大小与当前不一致时报错
         """
+        start_epoch = 0
+        if resume:
+            start_epoch = self._resume_epoch()
+            if start_epoch >= epochs:
+                # 不构建数据加载器，也不覆盖已有的最终模型和图表
+                self._log(f'检查点已完成{start_epoch}个epoch，不少于epochs={epochs}，不再继续训练')
+                return
+        
         # 获取数据加载器
-        train_dataloader = DataLoaderFactory.get_dataloader(
-            self.train_dir, batch_size=batch_size, shuffle=True
-        )
-        test_dataloader = DataLoaderFactory.get_dataloader(
-            self.test_dir, batch_size=batch_size, shuffle=False
+        train_dataloader, test_dataloader = self.build_dataloaders(
+            batch_size, cache_dir=cache_dir, num_workers=num_workers, pin_memory=pin_memory,
+            prefetch_factor=prefetch_factor
         )
         
-        for epoch in range(epochs):
-            print(f'\nEpoch {epoch+1}/{epochs}')
-            print('-' * 50)
+        for epoch in range(start_epoch, epochs):
+            self._log(f'\nEpoch {epoch+1}/{epochs}')
+            self._log('-' * 50)
+            
+            # DistributedSampler按epoch重新打乱
+            if hasattr(train_dataloader.sampler, 'set_epoch'):
+                train_dataloader.sampler.set_epoch(epoch)
             
             # 训练一个epoch
             train_loss, train_accuracy = self.train_epoch(train_dataloader)
             
             # 评估模型
             test_loss, test_accuracy = self.evaluate(test_dataloader)
+            self._log(f'Train throughput: {self.train_throughput_history[-1]:.1f} samples/sec')
             
             # 更新学习率
             self.scheduler.step(test_loss)
@@ -186,18 +496,27 @@ class ModelTrainer:
             self.train_accuracy_history.append(train_accuracy)
             self.test_accuracy_history.append(test_accuracy)
             
+            # 保留测试损失最低的模型
+            if test_loss < self.best_test_loss:
+                self.best_test_loss = test_loss
+                best_model_path = os.path.join(self.save_dir, f'{self.model_type}_best.pth')
+                self._atomic_save(self.module.state_dict(), best_model_path)
+                self._log(f'Best model saved to {best_model_path} (test loss {test_loss:.4f})')
+            
             # 保存模型
             if (epoch + 1) % 10 == 0:
-                model_type = 'crnn' if isinstance(self.model, CRNN) else 'cnn_mlp'
-                model_path = os.path.join(self.save_dir, f'{model_type}_epoch_{epoch+1}.pth')
-                torch.save(self.model.state_dict(), model_path)
-                print(f'Model saved to {model_path}')
+                model_path = os.path.join(self.save_dir, f'{self.model_type}_epoch_{epoch+1}.pth')
+                self._atomic_save(self.module.state_dict(), model_path)
+                self._log(f'Model saved to {model_path}')
+            
+            # 保存完整训练状态，中断后可以从这里继续
+            if (epoch + 1) % checkpoint_interval == 0 or epoch + 1 == epochs:
+                self.save_checkpoint(epoch + 1)
         
         # 保存最终模型
-        model_type = 'crnn' if isinstance(self.model, CRNN) else 'cnn_mlp'
-        final_model_path = os.path.join(self.save_dir, f'{model_type}_final.pth')
-        torch.save(self.model.state_dict(), final_model_path)
-        print(f'Final model saved to {final_model_path}')
+        final_model_path = os.path.join(self.save_dir, f'{self.model_type}_final.pth')
+        self._atomic_save(self.module.state_dict(), final_model_path)
+        self._log(f'Final model saved to {final_model_path}')
         
         # 生成可视化图表
         self.generate_plots()
@@ -206,6 +525,9 @@ class ModelTrainer:
         """
         生成训练可视化图表
         """
+        if not self.is_main_process:
+            return
+        
         # 设置图表样式
         plt.style.use('seaborn-v0_8')
         
@@ -232,8 +554,7 @@ class ModelTrainer:
         
         # 保存图表
         plt.tight_layout()
-        model_type = 'crnn' if isinstance(self.model, CRNN) else 'cnn_mlp'
-        plot_path = os.path.join(self.save_dir, f'{model_type}_training_history.png')
+        plot_path = os.path.join(self.save_dir, f'{self.model_type}_training_history.png')
         plt.savefig(plot_path, dpi=300)
         print(f'Training history plot saved to {plot_path}')
         plt.close()
@@ -242,31 +563,36 @@ class ModelEvaluator:
     """
     模型评估器类
     """
-    def __init__(self, model, test_dir):
+    def __init__(self, model, test_dir, device=None):
         """
         初始化模型评估器
         
         Args:
             model: 要评估的模型
             test_dir: 测试数据目录
+            device: 评估设备，为None时有CUDA则用CUDA；量化模型只能在CPU上运行
         """
         self.model = model
         self.test_dir = test_dir
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        if device is None:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.device = torch.device(device)
         self.model.to(self.device)
     
-    def evaluate(self, batch_size=32):
+    def evaluate(self, batch_size=32, max_samples=None, plot_confusion_matrix=True):
         """
         评估模型
         
         Args:
             batch_size: 批次大小
+            max_samples: 只在等间隔抽取的至多max_samples个测试样本上评估，为None时使用全部样本
+            plot_confusion_matrix: 是否生成混淆矩阵图
             
         Returns:
             accuracy: 准确率
         """
         dataloader = DataLoaderFactory.get_dataloader(
-            self.test_dir, batch_size=batch_size, shuffle=False
+            self.test_dir, batch_size=batch_size, shuffle=False, max_samples=max_samples
         )
         
         self.model.eval()
@@ -278,45 +604,31 @@ class ModelEvaluator:
         with torch.no_grad():
             with tqdm(dataloader, desc='Evaluating') as pbar:
                 for images, labels in pbar:
-                    images = images.to(self.device)
-                    labels = labels.to(self.device)
+                    images = images.to(self.device, non_blocking=True)
+                    labels = labels.to(self.device, non_blocking=True)
                     
                     # 前向传播
                     outputs = self.model(images)
+                    if self.model.model_type == 'crnn':
+                        # CRNN输出形状: (seq_len, batch_size, num_classes)，与训练时一致取最后一个时间步
+                        outputs = outputs[-1, :, :]
                     
-                    # 根据模型类型调整输出和计算准确率
-                    if isinstance(self.model, CRNN):
-                        # CRNN输出形状: (seq_len, batch_size, num_classes)
-                        _, predicted = torch.max(outputs, 2)
-                        predicted = predicted.view(-1)
-                        labels = labels.view(-1)
-                        
-                        # 保存所有预测和标签
-                        all_preds.extend(predicted.cpu().numpy())
-                        all_labels.extend(labels.cpu().numpy())
-                        
-                        # 只计算有效标签的准确率
-                        mask = labels != 0
-                        if mask.sum() > 0:
-                            correct += (predicted[mask] == labels[mask]).sum().item()
-                            total += mask.sum().item()
-                    else:
-                        # CNNMLP输出形状: (batch_size, num_classes)
-                        _, predicted = torch.max(outputs.data, 1)
-                        
-                        # 保存所有预测和标签
-                        all_preds.extend(predicted.cpu().numpy())
-                        all_labels.extend(labels.cpu().numpy())
-                        
-                        # 计算准确率
-                        total += labels.size(0)
-                        correct += (predicted == labels).sum().item()
+                    _, predicted = torch.max(outputs, 1)
+                    
+                    # 保存所有预测和标签
+                    all_preds.extend(predicted.cpu().numpy())
+                    all_labels.extend(labels.cpu().numpy())
+                    
+                    # 计算准确率
+                    total += labels.size(0)
+                    correct += (predicted == labels).sum().item()
         
         accuracy = correct / total if total > 0 else 0
         print(f'\nFinal Accuracy: {accuracy:.4f}')
         
         # 生成混淆矩阵
-        self.generate_confusion_matrix(all_preds, all_labels)
+        if plot_confusion_matrix:
+            self.generate_confusion_matrix(all_preds, all_labels)
         
         return accuracy
     
@@ -344,60 +656,190 @@ class ModelEvaluator:
         plt.ylabel('True Label')
         
         # 保存混淆矩阵
-        model_type = 'crnn' if isinstance(self.model, CRNN) else 'cnn_mlp'
-        cm_path = os.path.join('./saved_models', f'{model_type}_confusion_matrix.png')
+        cm_path = os.path.join('./saved_models', f'{self.model.model_type}_confusion_matrix.png')
         plt.savefig(cm_path, dpi=300)
         print(f'Confusion matrix saved to {cm_path}')
         plt.close()
 
-def compare_models(train_dir, test_dir, epochs=5, batch_size=64):
+def state_dict_bytes(model):
+    """
+    模型序列化后的大小（字节），量化模型的打包权重同样计入
+    """
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def measure_latency(model, batch_size=1, runs=50, warmup=5):
+    """
+    测量单次前向传播的平均延迟，模型需已在CPU上
+    
+    Args:
+        model: eval模式的模型
+        batch_size: 批次大小
+        runs: 计时的次数
+        warmup: 预热次数（不计时）
+        
+    Returns:
+        float: 平均延迟（毫秒）
+    """
+    height, width = IMAGE_SIZE
+    example = torch.randn(batch_size, 1, height, width)
+    with torch.inference_mode():
+        for _ in range(warmup):
+            model(example)
+        start = time.perf_counter()
+        for _ in range(runs):
+            model(example)
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def measure_train_step(model, batch_size=32, steps=50, log_interval=50, repeat=3):
+    """
+    在随机输入上测量ModelTrainer每个训练步的耗时（前向、反向、优化器更新和指标统计）
+    log_interval=1时每个批次都把指标读回主机，可与默认间隔对比设备同步的开销
+    
+    Args:
+        model: 要测量的模型（在副本上训练，原模型不变）
+        batch_size: 批次大小
+        steps: 每次计时的训练步数
+        log_interval: 读回指标的间隔，传给ModelTrainer
+        repeat: 计时的轮数，取中位数
+        
+    Returns:
+        float: 每个训练步的耗时中位数（毫秒）
+    """
+    height, width = IMAGE_SIZE
+    generator = torch.Generator().manual_seed(0)
+    batches = [
+        (torch.randn(batch_size, 1, height, width, generator=generator),
+         torch.randint(0, model.num_classes, (batch_size,), generator=generator))
+        for _ in range(steps)
+    ]
+    with tempfile.TemporaryDirectory() as save_dir:
+        trainer = ModelTrainer(copy.deepcopy(model), None, None, save_dir=save_dir, log_interval=log_interval)
+        # 预热：cuDNN算法选择、内存分配器等
+        trainer.train_epoch(batches[:min(5, steps)])
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            trainer.train_epoch(batches)
+            if trainer.device.type == 'cuda':
+                torch.cuda.synchronize()
+            timings.append((time.perf_counter() - start) / steps * 1000)
+    return float(np.median(timings))
+
+
+def profile_model(model, test_dir, batch_size=64, max_samples=None):
     """
-    对比CRNN和CNN+MLP模型的性能
+    统计模型的准确率、参数量、大小和CPU单张图像延迟
+    
+    Args:
+        model: 已训练的模型
+        test_dir: 测试数据目录
+        batch_size: 评估的批次大小
+        max_samples: 评估使用的测试样本数，为None时使用全部样本
+        
+    Returns:
+        dict: {'accuracy', 'params', 'size_mb', 'latency_ms'}
+    """
+    accuracy = ModelEvaluator(model, test_dir).evaluate(
+        batch_size=batch_size, max_samples=max_samples, plot_confusion_matrix=False
+    )
+    # 延迟在CPU副本上测量，对应识别服务的部署环境
+    cpu_model = copy.deepcopy(model).cpu().eval()
+    return {
+        'accuracy': accuracy,
+        'params': sum(p.numel() for p in cpu_model.parameters()),
+        'size_mb': state_dict_bytes(cpu_model) / 2 ** 20,
+        'latency_ms': measure_latency(cpu_model),
+    }
+
+
+def compare_models(train_dir, test_dir, epochs=5, batch_size=64, trained_models=None, latency_budget_ms=None,
+                   eval_samples=None, resume=False, num_workers=0):
+    """
+    对比模型的准确率、大小和CPU延迟
     
     Args:
         train_dir: 训练数据目录
         test_dir: 测试数据目录
         epochs: 训练轮数
         batch_size: 批次大小
+        trained_models: 名称到已训练模型的字典，为None时训练并对比CRNN和CNN+MLP模型
+        latency_budget_ms: 单张图像CPU延迟预算（毫秒），给出时选出预算内准确率最高的模型
+        eval_samples: 评估使用的测试样本数，为None时使用全部样本
+        resume: 训练时是否从已有的检查点继续
+        num_workers: 训练时数据加载的工作进程数，为'auto'时自动选择
+        
+    Returns:
+        dict: 名称到profile_model结果的字典
     """
     print("=== 开始模型对比实验 ===\n")
     
-    # 训练和评估CRNN模型
-    print("1. 训练和评估CRNN模型")
-    crnn_model = CRNN(num_classes=3755)
-    crnn_trainer = ModelTrainer(crnn_model, train_dir, test_dir)
-    crnn_trainer.train(epochs=epochs, batch_size=batch_size)
-    crnn_evaluator = ModelEvaluator(crnn_model, test_dir)
-    crnn_accuracy = crnn_evaluator.evaluate()
-    
-    # 训练和评估CNN+MLP模型
-    print("\n2. 训练和评估CNN+MLP模型")
-    cnn_mlp_model = CNNMLP(num_classes=3755)
-    cnn_mlp_trainer = ModelTrainer(cnn_mlp_model, train_dir, test_dir)
-    cnn_mlp_trainer.train(epochs=epochs, batch_size=batch_size)
-    cnn_mlp_evaluator = ModelEvaluator(cnn_mlp_model, test_dir)
-    cnn_mlp_accuracy = cnn_mlp_evaluator.evaluate()
+    if trained_models is None:
+        # 训练CRNN模型
+        print("1. 训练CRNN模型")
+        crnn_model = CRNN(num_classes=3755)
+        crnn_trainer = ModelTrainer(crnn_model, train_dir, test_dir)
+        crnn_trainer.train(epochs=epochs, batch_size=batch_size, num_workers=num_workers, resume=resume)
+        
+        # 训练CNN+MLP模型
+        print("\n2. 训练CNN+MLP模型")
+        cnn_mlp_model = CNNMLP(num_classes=3755)
+        cnn_mlp_trainer = ModelTrainer(cnn_mlp_model, train_dir, test_dir)
+        cnn_mlp_trainer.train(epochs=epochs, batch_size=batch_size, num_workers=num_workers, resume=resume)
+        
+        trained_models = {'CRNN': crnn_model, 'CNN+MLP': cnn_mlp_model}
+    
+    # 评估所有模型
+    results = {}
+    for name, model in trained_models.items():
+        print(f"\n评估{name}模型")
+        results[name] = profile_model(model, test_dir, batch_size=batch_size, max_samples=eval_samples)
     
     # 生成对比报告
     print("\n=== 模型对比报告 ===")
-    print(f"CRNN模型准确率: {crnn_accuracy:.4f}")
-    print(f"CNN+MLP模型准确率: {cnn_mlp_accuracy:.4f}")
+    print(f"{'模型':<32}{'准确率':>10}{'参数量':>14}{'大小(MB)':>12}{'延迟(ms)':>12}")
+    for name, result in results.items():
+        within_budget = latency_budget_ms is None or result['latency_ms'] <= latency_budget_ms
+        print(f"{name:<32}{result['accuracy']:>10.4f}{result['params']:>14,}{result['size_mb']:>12.1f}"
+              f"{result['latency_ms']:>12.2f}{'' if within_budget else '  超出延迟预算'}")
     
-    if crnn_accuracy > cnn_mlp_accuracy:
-        print("结论: CRNN模型性能优于CNN+MLP模型")
-    elif cnn_mlp_accuracy > crnn_accuracy:
-        print("结论: CNN+MLP模型性能优于CRNN模型")
+    candidates = {
+        name: result for name, result in results.items()
+        if latency_budget_ms is None or result['latency_ms'] <= latency_budget_ms
+    }
+    if candidates:
+        best = max(candidates, key=lambda name: candidates[name]['accuracy'])
+        budget = f"延迟预算{latency_budget_ms}ms内" if latency_budget_ms is not None else ""
+        print(f"结论: {budget}准确率最高的是{best}模型")
     else:
-        print("结论: 两种模型性能相当")
+        print(f"结论: 没有模型满足{latency_budget_ms}ms的延迟预算")
     
     print("\n所有模型训练和评估完成！")
+    return results
 
 if __name__ == '__main__':
     # 训练参数
-    train_dir = '../../data/train'
-    test_dir = '../../data/test'
-    epochs = 5
-    batch_size = 64
+    parser = argparse.ArgumentParser(description='训练并对比CRNN和CNN+MLP模型')
+    parser.add_argument('--train-dir', default='../../data/train')
+    parser.add_argument('--test-dir', default='../../data/test')
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--resume', action='store_true', help='从saved_models中的检查点继续训练')
+    parser.add_argument('--num-workers', type=lambda value: value if value == 'auto' else int(value), default=0,
+                        help="数据加载的工作进程数；为auto时先试跑几个候选值，选出最快的（每个数据集多花几秒）")
+    parser.add_argument('--benchmark-step', action='store_true',
+                        help='不训练，只在随机输入上对比每个批次读回指标与按间隔读回指标的训练步耗时')
+    args = parser.parse_args()
     
-    # 执行模型对比
-    compare_models(train_dir, test_dir, epochs=epochs, batch_size=batch_size)
+    if args.benchmark_step:
+        for model in (CRNN(num_classes=3755), CNNMLP(num_classes=3755)):
+            per_batch = measure_train_step(model, batch_size=args.batch_size, log_interval=1)
+            interval = measure_train_step(model, batch_size=args.batch_size)
+            print(f'{model.model_type}: 每批次同步 {per_batch:.2f} ms/步，每50批次同步 {interval:.2f} ms/步')
+    else:
+        # 执行模型对比
+        compare_models(args.train_dir, args.test_dir, epochs=args.epochs, batch_size=args.batch_size,
+                       resume=args.resume, num_workers=args.num_workers)
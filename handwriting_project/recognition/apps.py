@@ -1,5 +1,24 @@
+import threading
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class RecognitionConfig(AppConfig):
     name = 'recognition'
+
+    def ready(self):
+        # 可选：在应用启动时预加载识别引擎，避免首个请求承担加载耗时
+        if not getattr(settings, 'RECOGNITION_PRELOAD_ENGINE', False):
+            return
+
+        from .engine import engine_registry, EASYOCR_ENGINE
+        from . import backends  # noqa: F401  注册分类器后端
+
+        # 后台线程加载，不阻塞manage.py命令和服务启动
+        threading.Thread(
+            target=engine_registry.get,
+            args=(getattr(settings, 'RECOGNITION_BACKEND', EASYOCR_ENGINE),),
+            name='recognition-engine-preload',
+            daemon=True
+        ).start()
@@ -0,0 +1,574 @@
+import os
+import pickle
+from functools import partial
+
+import cv2
+import numpy as np
+from PIL import Image
+from django.conf import settings
+
+from models.image_transforms import IMAGE_SIZE
+
+from .engine import engine_registry, EngineUnavailable, EASYOCR_ENGINE
+from .preprocessing import ImagePreprocessor
+
+
+class RecognizerBackend:
+    """
+    识别后端基类
+    prepare负责把上传的PIL图像转换成后端输入，recognize_batch对一批输入执行识别
+    """
+    name = None
+    preprocessing_steps = []
+    # 模型版本标识，模型或会影响输出的参数变化时随之变化（用于识别结果缓存的键）
+    cache_version = ''
+
+    def prepare(self, image):
+        """
+        预处理单张图像
+
+        Args:
+            image: PIL图像对象
+
+        Returns:
+            numpy.ndarray: 后端输入图像
+        """
+        raise NotImplementedError
+
+    def recognize_batch(self, images):
+        """
+        批量识别
+
+        Args:
+            images: prepare输出的图像列表
+
+        Returns:
+            list: 每张图像的识别结果字典{'result', 'confidence', 'candidates'}，未识别出文字时为None
+        """
+        raise NotImplementedError
+
+
+class EasyOCRBackend(RecognizerBackend):
+    """
+    EasyOCR识别后端（文本检测+识别）
+    """
+    name = EASYOCR_ENGINE
+    preprocessing_steps = ['grayscale', 'gaussian_blur', 'histogram_equalization']
+
+    def __init__(self, detector_skip=True):
+        """
+        初始化EasyOCR后端
+
+        Args:
+            detector_skip: 是否对单字图像跳过CRAFT文本检测，直接裁剪笔迹区域送入识别阶段
+        """
+        self.detector_skip = detector_skip
+        self.cache_version = f'easyocr:ch_sim:detector_skip={int(detector_skip)}'
+        self._plan = ImagePreprocessor.compile(self.preprocessing_steps)
+
+    def prepare(self, image):
+        """
+        图像预处理：灰度化+高斯模糊+直方图均衡化，与app.py逐像素一致
+        灰度化使用cv2.cvtColor(COLOR_RGB2GRAY)，与PIL的convert('L')舍入不同，均衡化后差异会被放大；
+        模糊和均衡化由融合后的预处理计划完成
+        """
+        if image.mode == 'L':
+            # 三个通道相同时cv2的灰度系数之和恰为1，结果与原灰度值相同，省去RGB往返
+            gray = np.asarray(image)
+        else:
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            gray = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2GRAY)
+        # 直接返回单通道图像，EasyOCR会自行处理灰度输入；计划中的grayscale对单通道输入为空操作
+        return self._plan(gray)
+
+    def recognize_batch(self, images):
+        reader = engine_registry.get(EASYOCR_ENGINE)
+        if reader is None:
+            raise EngineUnavailable('EasyOCR not initialized, cannot perform recognition')
+
+        with engine_registry.inference_lock(EASYOCR_ENGINE):
+            results = self.read(reader, images)
+        return [self._to_outcome(result) for result in results]
+
+    def read(self, reader, images):
+        """
+        使用给定的EasyOCR读取器识别一批prepare输出的图像；app.py复用同一流程
+
+        Args:
+            reader: EasyOCR读取器
+            images: prepare输出的图像列表
+
+        Returns:
+            list: 每张图像的EasyOCR原始结果[(框, 文本, 置信度)]
+        """
+        results = [None] * len(images)
+        pending = list(range(len(images)))
+        if self.detector_skip:
+            pending = self._recognize_cropped(reader, images, results)
+        self._readtext(reader, images, pending, results)
+        return results
+
+    def _recognize_cropped(self, reader, images, results):
+        """
+        快速路径：自行裁剪笔迹区域，跳过文本检测，只对裁剪出的单字运行识别阶段
+        一批图像的裁剪结果纵向拼接成一张图，每个字对应horizontal_list中的一个框，
+        一次recognize调用即可对所有裁剪图做批量前向传播
+
+        Args:
+            reader: EasyOCR读取器
+            images: 预处理后的图像列表
+            results: 结果列表，原地填充
+
+        Returns:
+            list: 需要走完整检测流程的图像索引（多行文本或快速路径未识别出文字）
+        """
+        fallback = []
+        crops = []
+        for index, gray in enumerate(images):
+            bbox, is_multiline = ImagePreprocessor.locate_ink(gray)
+            if bbox is None or is_multiline:
+                fallback.append(index)
+                continue
+            x, y, w, h = bbox
+            crops.append((index, gray[y:y+h, x:x+w]))
+        if not crops:
+            return fallback
+
+        recognized = self.recognize_crops(reader, [crop for _, crop in crops])
+        for (index, _), items in zip(crops, recognized):
+            if items:
+                results[index] = items
+            else:
+                fallback.append(index)
+        return sorted(fallback)
+
+    @staticmethod
+    def recognize_crops(reader, crops, gap=8):
+        """
+        对多张已裁剪的单字图像执行一次批量识别
+
+        Args:
+            reader: EasyOCR读取器
+            crops: 灰度裁剪图列表
+            gap: 拼接时相邻裁剪图之间的空白行数
+
+        Returns:
+            list: 每张裁剪图的识别结果列表[(框, 文本, 置信度)]，未识别出文字时为空列表
+        """
+        width = max(crop.shape[1] for crop in crops)
+        height = sum(crop.shape[0] for crop in crops) + gap * (len(crops) - 1)
+        tiled = np.full((height, width), 255, dtype=np.uint8)
+        boxes = []
+        offsets = {}
+        y = 0
+        for i, crop in enumerate(crops):
+            h, w = crop.shape[:2]
+            tiled[y:y+h, :w] = crop
+            boxes.append([0, w, y, y + h])
+            offsets[y] = i
+            y += h + gap
+
+        recognized = reader.recognize(
+            tiled, horizontal_list=boxes, free_list=[], batch_size=len(crops), detail=1
+        )
+        # 结果按框的纵坐标对应回各裁剪图，并把框换算回裁剪图坐标
+        per_crop = [[] for _ in crops]
+        for box, text, confidence in recognized:
+            top = int(box[0][1])
+            i = offsets.get(top)
+            if i is None or not str(text).strip():
+                continue
+            local_box = [[px, py - top] for px, py in box]
+            per_crop[i].append((local_box, text, confidence))
+        return per_crop
+
+    @staticmethod
+    def _readtext(reader, images, indices, results):
+        """
+        完整的检测+识别流程
+        readtext_batched要求同一批图像尺寸一致，因此按尺寸分组，每组执行一次批量前向传播
+        """
+        groups = {}
+        for index in indices:
+            groups.setdefault(images[index].shape, []).append(index)
+
+        for group in groups.values():
+            if len(group) == 1:
+                results[group[0]] = reader.readtext(images[group[0]], batch_size=4)
+                continue
+            group_results = reader.readtext_batched(
+                [images[i] for i in group], batch_size=max(4, len(group))
+            )
+            for i, result in zip(group, group_results):
+                results[i] = result
+
+    @staticmethod
+    def _to_outcome(result):
+        """
+        把EasyOCR结果转换成识别结果字典
+
+        Args:
+            result: EasyOCR返回的结果
+
+        Returns:
+            dict: 识别结果，未识别出文字时为None
+        """
+        texts = []
+        confidences = []
+        if result:
+            for item in result:
+                if isinstance(item, (list, tuple)) and len(item) >= 2:
+                    text = str(item[1]) if item[1] is not None else ''
+                    conf = float(item[2]) if len(item) > 2 and item[2] is not None else 0.0
+                    if text:
+                        texts.append(text)
+                        confidences.append(conf)
+        print(f"Parsed texts: {texts}, confidences: {confidences}")
+
+        if not texts:
+            return None
+
+        best_text = texts[0]
+        best_confidence = confidences[0] if confidences else 0.85
+        predicted_char = best_text[0]
+
+        candidates = [
+            {'char': predicted_char, 'confidence': best_confidence}
+        ]
+
+        if len(best_text) > 1:
+            for i, char in enumerate(best_text[1:4]):
+                if char and isinstance(char, str) and char.strip():
+                    candidates.append({
+                        'char': char,
+                        'confidence': round(best_confidence - (i+1)*0.05, 4)
+                    })
+
+        return {
+            'result': predicted_char,
+            'confidence': best_confidence,
+            'candidates': candidates,
+        }
+
+
+def load_char_list(char_dict_path):
+    """
+    加载字符字典，返回按类别索引排列的字符列表
+
+    Args:
+        char_dict_path: gnt2png.py生成的char_dict文件路径（字符 -> 类别索引）
+
+    Returns:
+        list: 类别索引到字符的列表
+    """
+    with open(char_dict_path, 'rb') as f:
+        char_dict = pickle.load(f)
+    chars = [''] * (max(char_dict.values()) + 1)
+    for char, index in char_dict.items():
+        chars[index] = char
+    return chars
+
+
+class ClassifierBackend(RecognizerBackend):
+    """
+    单字分类器后端基类
+    对预处理后的图像执行一次分类前向传播，返回softmax的top-k候选字
+    """
+    input_size = IMAGE_SIZE  # (height, width)，与训练时的transforms.Resize一致
+
+    def __init__(self, chars, top_k=5, preprocess_steps=None):
+        """
+        初始化分类器后端
+
+        Args:
+            chars: 类别索引到字符的列表
+            top_k: 候选字数量
+            preprocess_steps: ImagePreprocessor.preprocess的步骤列表
+        """
+        self.chars = chars
+        self.top_k = top_k
+        self.preprocessing_steps = list(preprocess_steps or ['grayscale'])
+        # 构建时编译预处理计划，步骤配置有误时在加载阶段就报错
+        self._plan = ImagePreprocessor.compile(self.preprocessing_steps)
+
+    def _set_cache_version(self, model_path):
+        """
+        根据模型文件名、修改时间、top_k和预处理步骤设置cache_version，替换模型文件后缓存自动失效
+
+        Args:
+            model_path: 加载的模型文件路径
+        """
+        self.cache_version = (
+            f'{self.name}:{os.path.basename(str(model_path))}:'
+            f'{int(os.path.getmtime(model_path))}:top{self.top_k}:{",".join(self.preprocessing_steps)}'
+        )
+
+    def prepare(self, image):
+        """
+        预处理：执行预处理计划后缩放到模型输入大小
+
+        Args:
+            image: PIL图像对象
+
+        Returns:
+            numpy.ndarray: input_size大小的uint8灰度图
+        """
+        processed = Image.fromarray(self._plan.run(image))
+        if processed.mode != 'L':
+            processed = processed.convert('L')
+        height, width = self.input_size
+        # 与训练时的ToPILImage + Resize(IMAGE_SIZE)保持一致
+        processed = processed.resize((width, height), Image.Resampling.BILINEAR)
+        return np.asarray(processed, dtype=np.uint8)
+
+    def _to_batch(self, images):
+        """
+        把uint8灰度图列表转换成归一化后的(N, 1, H, W)float32数组，等价于ToTensor + Normalize(0.5, 0.5)
+        """
+        batch = np.stack(images).astype(np.float32)
+        batch /= 127.5
+        batch -= 1.0
+        return batch[:, None, :, :]
+
+    def _forward(self, batch):
+        """
+        执行前向传播
+
+        Args:
+            batch: (N, 1, H, W)的float32数组
+
+        Returns:
+            numpy.ndarray: (N, num_classes)的logits
+        """
+        raise NotImplementedError
+
+    def recognize_batch(self, images):
+        logits = self._forward(self._to_batch(images))
+
+        # 数值稳定的softmax
+        logits = logits - logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+
+        k = min(self.top_k, probs.shape[1])
+        top_indices = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+
+        outcomes = []
+        for row, indices in zip(probs, top_indices):
+            indices = indices[np.argsort(-row[indices])]
+            candidates = [
+                {'char': self.chars[i], 'confidence': round(float(row[i]), 4)}
+                for i in indices if i < len(self.chars) and self.chars[i]
+            ]
+            if not candidates:
+                outcomes.append(None)
+                continue
+            outcomes.append({
+                'result': candidates[0]['char'],
+                'confidence': candidates[0]['confidence'],
+                'candidates': candidates,
+            })
+        return outcomes
+
+
+class TorchClassifierBackend(ClassifierBackend):
+    """
+    PyTorch单字分类器后端，加载models/中训练得到的CRNN或CNNMLP检查点
+    """
+
+    def __init__(self, name, model, chars, top_k=5, preprocess_steps=None):
+        super().__init__(chars, top_k=top_k, preprocess_steps=preprocess_steps)
+        self.name = name
+        self.model = model
+        self._is_crnn = name == 'crnn'
+
+    @classmethod
+    def load(cls, name, checkpoint_path, char_dict_path, top_k=5, preprocess_steps=None):
+        """
+        加载检查点和字符字典
+
+        Args:
+            name: 模型类型，'crnn'或'cnn_mlp'
+            checkpoint_path: *_final.pth/*_best.pth模型权重，或训练时保存的*_checkpoint.pth完整检查点
+            char_dict_path: 字符字典路径
+            top_k: 候选字数量
+            preprocess_steps: ImagePreprocessor.preprocess的步骤列表
+
+        Returns:
+            TorchClassifierBackend: 加载好的后端
+        """
+        import torch
+        from models.crnn import CRNN
+        from models.cnn_mlp import CNNMLP
+
+        state_dict = torch.load(checkpoint_path, map_location='cpu')
+        if 'model_state_dict' in state_dict:
+            # ModelTrainer保存的完整训练状态，只取模型权重
+            state_dict = state_dict['model_state_dict']
+
+        if name == 'crnn':
+            model = CRNN(num_classes=state_dict['fc.weight'].shape[0], input_height=cls.input_size[0])
+            model.load_state_dict(state_dict)
+        elif name == 'cnn_mlp':
+            # 通道数和隐藏层大小从权重推断，蒸馏、剪枝得到的小模型同样可以加载
+            model = CNNMLP.from_state_dict(state_dict, input_size=cls.input_size)
+        else:
+            raise ValueError(f'不支持的模型类型: {name}')
+
+        model.eval()
+        backend = cls(name, model, load_char_list(char_dict_path),
+                      top_k=top_k, preprocess_steps=preprocess_steps)
+        backend._set_cache_version(checkpoint_path)
+        return backend
+
+    @classmethod
+    def load_torchscript(cls, name, model_path, char_dict_path, top_k=5, preprocess_steps=None):
+        """
+        加载models/export.py导出的TorchScript模型，输出已经是(batch_size, num_classes)
+
+        Args:
+            name: 引擎名称
+            model_path: TorchScript模型路径
+            char_dict_path: 字符字典路径
+            top_k: 候选字数量
+            preprocess_steps: ImagePreprocessor.preprocess的步骤列表
+
+        Returns:
+            TorchClassifierBackend: 加载好的后端
+        """
+        import torch
+
+        model = torch.jit.load(str(model_path), map_location='cpu')
+        model.eval()
+        backend = cls(name, model, load_char_list(char_dict_path),
+                      top_k=top_k, preprocess_steps=preprocess_steps)
+        backend._is_crnn = False
+        backend._set_cache_version(model_path)
+        return backend
+
+    def _forward(self, batch):
+        import torch
+
+        with engine_registry.inference_lock(self.name), torch.inference_mode():
+            outputs = self.model(torch.from_numpy(batch))
+            if self._is_crnn:
+                # CRNN输出形状: (seq_len, batch_size, num_classes)，与训练时一致取最后一个时间步
+                outputs = outputs[-1, :, :]
+            return outputs.float().numpy()
+
+
+class OnnxClassifierBackend(ClassifierBackend):
+    """
+    onnxruntime单字分类器后端，加载models/export.py导出的ONNX模型，使用CPUExecutionProvider
+    """
+
+    def __init__(self, name, session, chars, top_k=5, preprocess_steps=None):
+        super().__init__(chars, top_k=top_k, preprocess_steps=preprocess_steps)
+        self.name = name
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+
+    @classmethod
+    def load(cls, name, model_path, char_dict_path, top_k=5, preprocess_steps=None,
+             intra_op_threads=None, inter_op_threads=None):
+        """
+        创建推理会话并加载字符字典
+
+        Args:
+            name: 引擎名称
+            model_path: ONNX模型路径，输出为(batch_size, num_classes)的logits
+            char_dict_path: 字符字典路径
+            top_k: 候选字数量
+            preprocess_steps: ImagePreprocessor.preprocess的步骤列表
+            intra_op_threads: 单个算子内的线程数，None时由onnxruntime决定（物理核数）
+            inter_op_threads: 算子间并行的线程数，None时由onnxruntime决定
+
+        Returns:
+            OnnxClassifierBackend: 加载好的后端
+        """
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 模型是一条顺序的算子链，并行执行分支没有收益
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+
+        session = onnxruntime.InferenceSession(
+            str(model_path), sess_options=options, providers=['CPUExecutionProvider']
+        )
+        backend = cls(name, session, load_char_list(char_dict_path),
+                      top_k=top_k, preprocess_steps=preprocess_steps)
+        backend._set_cache_version(model_path)
+        return backend
+
+    def _forward(self, batch):
+        # 推理会话本身是线程安全的，加锁是为了让并发请求不争抢同一个intra-op线程池
+        with engine_registry.inference_lock(self.name):
+            return self.session.run(None, {self.input_name: batch})[0]
+
+
+def _load_torch_backend(name):
+    return TorchClassifierBackend.load(
+        name,
+        settings.RECOGNITION_CHECKPOINT,
+        settings.RECOGNITION_CHAR_DICT,
+        top_k=getattr(settings, 'RECOGNITION_TOP_K', 5),
+        preprocess_steps=getattr(settings, 'RECOGNITION_CLASSIFIER_STEPS', None),
+    )
+
+
+def _load_torchscript_backend():
+    return TorchClassifierBackend.load_torchscript(
+        'torchscript',
+        settings.RECOGNITION_TORCHSCRIPT_MODEL,
+        settings.RECOGNITION_CHAR_DICT,
+        top_k=getattr(settings, 'RECOGNITION_TOP_K', 5),
+        preprocess_steps=getattr(settings, 'RECOGNITION_CLASSIFIER_STEPS', None),
+    )
+
+
+def _load_onnx_backend():
+    return OnnxClassifierBackend.load(
+        'onnx',
+        settings.RECOGNITION_ONNX_MODEL,
+        settings.RECOGNITION_CHAR_DICT,
+        top_k=getattr(settings, 'RECOGNITION_TOP_K', 5),
+        preprocess_steps=getattr(settings, 'RECOGNITION_CLASSIFIER_STEPS', None),
+        intra_op_threads=getattr(settings, 'RECOGNITION_ONNX_INTRA_OP_THREADS', None),
+        inter_op_threads=getattr(settings, 'RECOGNITION_ONNX_INTER_OP_THREADS', None),
+    )
+
+
+for _name in ('crnn', 'cnn_mlp'):
+    engine_registry.register(_name, partial(_load_torch_backend, _name))
+engine_registry.register('torchscript', _load_torchscript_backend)
+engine_registry.register('onnx', _load_onnx_backend)
+
+# 首次使用时才读取settings，app.py等不配置Django的入口也可以导入本模块
+_easyocr_backend = None
+
+
+def get_backend():
+    """
+    获取settings.RECOGNITION_BACKEND配置的识别后端
+
+    Returns:
+        RecognizerBackend: 识别后端，引擎加载失败或仍在退避时间内时返回None
+    """
+    global _easyocr_backend
+    name = getattr(settings, 'RECOGNITION_BACKEND', EASYOCR_ENGINE)
+    if name == EASYOCR_ENGINE:
+        # EasyOCR后端对象本身不持有模型，读取器由注册表加载
+        if engine_registry.get(EASYOCR_ENGINE) is None:
+            return None
+        if _easyocr_backend is None:
+            _easyocr_backend = EasyOCRBackend(
+                detector_skip=getattr(settings, 'RECOGNITION_DETECTOR_SKIP', True)
+            )
+        return _easyocr_backend
+    return engine_registry.get(name)
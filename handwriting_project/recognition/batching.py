@@ -0,0 +1,230 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+
+from .backends import get_backend
+from .engine import EngineUnavailable
+
+
+class MicroBatcher:
+    """
+    进程内请求合并器
+    在一个很短的时间窗口内收集并发请求，凑成一批后执行一次批量前向传播，再把结果分发回各请求
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, window_ms=5.0, timeout=30.0, name='recognition-batcher'):
+        """
+        初始化请求合并器
+
+        Args:
+            batch_fn: 批处理函数，接收输入列表，返回等长的结果列表
+            max_batch_size: 最大批次大小
+            window_ms: 收集窗口（毫秒），第一个请求到达后最多等待这么久
+            timeout: run等待结果的默认超时（秒），为None时不限时
+            name: 工作线程名称
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self.timeout = timeout
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        # 工作线程正在处理的批次，线程意外退出时由等待方把它们标记为失败
+        self._inflight = []
+
+        self._batches = 0
+        self._items = 0
+        self._max_seen = 0
+        self._restarts = 0
+
+    def _worker_alive(self):
+        return self._thread is not None and self._pid == os.getpid() and self._thread.is_alive()
+
+    def _ensure_worker(self):
+        """
+        懒启动工作线程；fork出的子进程中线程不存在，需要重新启动；
+        线程意外退出时，它正在处理的请求标记为失败，队列中的请求由新线程继续处理
+        """
+        if self._worker_alive():
+            return
+        with self._lock:
+            if self._worker_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._inflight = []
+            elif self._thread is not None:
+                self._restarts += 1
+                print(f"Recognition batcher worker died, restarting (restart #{self._restarts})")
+                error = RuntimeError('识别请求合并器的工作线程意外退出')
+                for future in self._inflight:
+                    if not future.done():
+                        future.set_exception(error)
+                self._inflight = []
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def submit(self, item):
+        """
+        提交单个输入
+
+        Args:
+            item: 单个输入
+
+        Returns:
+            Future: 结果的Future对象
+        """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def run(self, item, timeout=None, poll_interval=1.0):
+        """
+        提交单个输入并等待结果
+        等待期间定期检查工作线程，线程已退出时重新启动；超时后取消尚未开始处理的请求
+
+        Args:
+            item: 单个输入
+            timeout: 等待超时（秒），为None时使用构造时的timeout
+            poll_interval: 检查工作线程是否存活的间隔（秒）
+
+        Returns:
+            单个输入对应的结果
+
+        Raises:
+            TimeoutError: 超时仍未得到结果（工作线程卡住等）
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        future = self.submit(item)
+        while True:
+            wait = poll_interval
+            if deadline is not None:
+                wait = min(wait, max(0.0, deadline - time.monotonic()))
+            try:
+                return future.result(timeout=wait)
+            except TimeoutError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    future.cancel()
+                    raise TimeoutError(f'识别请求在{timeout:g}秒内未完成')
+                self._ensure_worker()
+
+    def _collect(self):
+        """
+        阻塞直到拿到第一个请求，然后在时间窗口内继续收集，直到窗口结束或批次已满
+        """
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # 窗口已结束，只取已经在排队的请求
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # 跳过等待超时已被取消的请求
+            batch = [
+                (item, future) for item, future in self._collect()
+                if future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+
+            self._inflight = futures
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f'批处理函数返回了{len(results)}个结果，期望{len(items)}个'
+                    )
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future, result in zip(futures, results):
+                    future.set_result(result)
+            self._inflight = []
+
+            self._batches += 1
+            self._items += len(batch)
+            self._max_seen = max(self._max_seen, len(batch))
+
+    def stats(self):
+        """
+        获取合并器统计信息
+
+        Returns:
+            dict: 批次数、请求数、平均批次大小等
+        """
+        return {
+            'max_batch_size': self.max_batch_size,
+            'window_ms': self.window * 1000.0,
+            'batches': self._batches,
+            'items': self._items,
+            'avg_batch_size': round(self._items / self._batches, 3) if self._batches else 0.0,
+            'max_observed_batch_size': self._max_seen,
+            'queued': self._queue.qsize(),
+            'worker_restarts': self._restarts,
+        }
+
+
+def recognize_batch(images):
+    """
+    使用当前配置的识别后端批量识别
+
+    Args:
+        images: 后端prepare输出的图像列表
+
+    Returns:
+        list: 每张图像的识别结果
+    """
+    backend = get_backend()
+    if backend is None:
+        raise EngineUnavailable('识别引擎未能加载')
+    return backend.recognize_batch(images)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """
+    获取进程内共享的识别请求合并器
+
+    Returns:
+        MicroBatcher: 请求合并器，未启用时返回None
+    """
+    global _batcher
+    if not getattr(settings, 'RECOGNITION_BATCHING_ENABLED', False):
+        return None
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(
+                    recognize_batch,
+                    max_batch_size=getattr(settings, 'RECOGNITION_BATCH_MAX_SIZE', 8),
+                    window_ms=getattr(settings, 'RECOGNITION_BATCH_WINDOW_MS', 5.0),
+                    timeout=getattr(settings, 'RECOGNITION_BATCH_TIMEOUT', 30.0),
+                )
+    return _batcher
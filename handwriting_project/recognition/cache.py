@@ -0,0 +1,182 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .preprocessing import PREPROCESS_VERSION
+
+
+class RecognitionCache:
+    """
+    基于内容寻址的识别结果缓存
+    键为解码后像素数据的哈希，加上预处理版本和模型版本；
+    第一层为进程内LRU，第二层为可选的Django缓存后端（带TTL和容量淘汰，可跨进程共享）
+    """
+
+    def __init__(self, max_entries=1024, alias=None, timeout=3600, max_bytes=64 * 1024 * 1024):
+        """
+        初始化识别结果缓存
+
+        Args:
+            max_entries: 进程内LRU的最大条目数
+            alias: Django缓存别名，为None时不使用共享缓存层
+            timeout: 共享缓存层的过期时间（秒）
+            max_bytes: 进程内LRU中数组和字节串的总大小上限；条目包含预处理后的图像，大图上传时按条目数无法限制内存
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.alias = alias
+        self.timeout = timeout
+
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._local_hits = 0
+        self._shared_hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def make_key(image, model_version):
+        """
+        计算缓存键
+
+        Args:
+            image: 已打开的PIL图像对象
+            model_version: 识别后端的版本标识
+
+        Returns:
+            str: 缓存键
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f'{image.mode}|{image.size}|{PREPROCESS_VERSION}|{model_version}|'.encode('utf-8'))
+        digest.update(image.tobytes())
+        return f'recognition:{digest.hexdigest()}'
+
+    def get(self, key):
+        """
+        查询缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存的值，未命中时返回None
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._local_hits += 1
+                return value
+
+        if self.alias is not None:
+            try:
+                value = caches[self.alias].get(key)
+            except Exception as e:
+                print(f"Error reading recognition cache: {str(e)}")
+                value = None
+            if value is not None:
+                self._store_local(key, value)
+                with self._lock:
+                    self._shared_hits += 1
+                return value
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def set(self, key, value):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 要缓存的值
+        """
+        self._store_local(key, value)
+        if self.alias is not None:
+            try:
+                caches[self.alias].set(key, value, timeout=self.timeout)
+            except Exception as e:
+                print(f"Error writing recognition cache: {str(e)}")
+
+    @classmethod
+    def entry_nbytes(cls, value):
+        """
+        估算条目占用的内存：numpy数组和字节串按实际大小计，其他对象忽略不计
+        """
+        if isinstance(value, dict):
+            return sum(cls.entry_nbytes(item) for item in value.values())
+        if isinstance(value, (list, tuple)):
+            return sum(cls.entry_nbytes(item) for item in value)
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+        return int(getattr(value, 'nbytes', 0))
+
+    def _store_local(self, key, value):
+        size = self.entry_nbytes(value)
+        if size > self.max_bytes:
+            # 单个条目超过上限时不放入进程内缓存
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizes[key]
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                evicted, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(evicted)
+
+    def stats(self):
+        """
+        获取缓存统计信息
+
+        Returns:
+            dict: 命中次数、未命中次数和命中率
+        """
+        with self._lock:
+            hits = self._local_hits + self._shared_hits
+            lookups = hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'shared_alias': self.alias,
+                'local_hits': self._local_hits,
+                'shared_hits': self._shared_hits,
+                'misses': self._misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    获取进程内共享的识别结果缓存
+
+    Returns:
+        RecognitionCache: 识别结果缓存，未启用时返回None
+    """
+    global _cache
+    if not getattr(settings, 'RECOGNITION_CACHE_ENABLED', False):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RecognitionCache(
+                    max_entries=getattr(settings, 'RECOGNITION_CACHE_MAX_ENTRIES', 1024),
+                    alias=getattr(settings, 'RECOGNITION_CACHE_ALIAS', None),
+                    timeout=getattr(settings, 'RECOGNITION_CACHE_TIMEOUT', 3600),
+                    max_bytes=getattr(settings, 'RECOGNITION_CACHE_MAX_BYTES', 64 * 1024 * 1024),
+                )
+    return _cache
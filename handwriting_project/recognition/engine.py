@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+
+
+def _current_rss_bytes():
+    """
+    获取当前进程的常驻内存(RSS)大小
+
+    Returns:
+        int: RSS字节数，无法获取时返回None
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        # ru_maxrss为峰值RSS，Linux下单位为KB，macOS下单位为字节
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, AttributeError):
+        return None
+
+
+class EngineUnavailable(RuntimeError):
+    """
+    识别引擎未加载（加载失败或仍在失败后的退避时间内），与图像本身无关
+    """
+
+
+def _parameter_bytes(engine):
+    """
+    统计引擎中所有PyTorch模块的参数与缓冲区字节数
+
+    Args:
+        engine: 已加载的引擎对象
+
+    Returns:
+        int: 参数字节数，引擎不包含PyTorch模块时返回None
+    """
+    modules = []
+    if hasattr(engine, 'parameters'):
+        modules.append(engine)
+    else:
+        for attr in ('detector', 'recognizer', 'model'):
+            module = getattr(engine, attr, None)
+            if module is not None and hasattr(module, 'parameters'):
+                modules.append(module)
+    if not modules:
+        return None
+
+    total = 0
+    for module in modules:
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class EngineRegistry:
+    """
+    进程级识别引擎注册表
+    每个工作进程只加载一次引擎，在线程间共享，并记录加载耗时与内存占用
+    加载失败会被记住，退避时间内的请求直接返回None，不再重复尝试耗时数秒的加载
+    """
+
+    def __init__(self, retry_backoff=30.0, max_retry_backoff=600.0):
+        """
+        初始化引擎注册表
+
+        Args:
+            retry_backoff: 首次加载失败后重试前等待的秒数，之后每次失败翻倍
+            max_retry_backoff: 重试等待的最长秒数
+        """
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self._factories = {}
+        self._engines = {}
+        self._stats = {}
+        self._failures = {}
+        self._load_locks = {}
+        self._inference_locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        """
+        注册引擎工厂函数
+
+        Args:
+            name: 引擎名称
+            factory: 无参可调用对象，返回加载好的引擎
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._load_locks.setdefault(name, threading.Lock())
+            self._inference_locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        """
+        获取引擎，首次调用时加载
+
+        Args:
+            name: 引擎名称
+
+        Returns:
+            引擎对象，加载失败或仍在失败后的退避时间内时返回None
+        """
+        engine = self._engines.get(name)
+        if engine is not None:
+            return engine
+
+        if name not in self._factories:
+            raise KeyError(f'未注册的识别引擎: {name}')
+        if self._in_backoff(name):
+            return None
+
+        with self._load_locks[name]:
+            # 双重检查，避免并发请求重复加载；等锁期间其他请求加载失败时也不再重试
+            engine = self._engines.get(name)
+            if engine is not None:
+                return engine
+            if self._in_backoff(name):
+                return None
+
+            print(f"Loading recognition engine '{name}'...")
+            rss_before = _current_rss_bytes()
+            start_time = time.perf_counter()
+            try:
+                engine = self._factories[name]()
+            except Exception as e:
+                failures = self._failures.get(name, {}).get('count', 0) + 1
+                backoff = min(self.retry_backoff * 2 ** (failures - 1), self.max_retry_backoff)
+                self._failures[name] = {'count': failures, 'retry_at': time.monotonic() + backoff}
+                print(f"Error: recognition engine '{name}' initialization failed, "
+                      f"retrying in {backoff:g}s. Error: {str(e)}")
+                self._stats[name] = {
+                    'status': 'failed',
+                    'error': str(e),
+                    'load_time': round(time.perf_counter() - start_time, 4),
+                    'failures': failures,
+                    'retry_at': time.time() + backoff,
+                }
+                return None
+            load_time = time.perf_counter() - start_time
+            rss_after = _current_rss_bytes()
+
+            self._stats[name] = {
+                'status': 'loaded',
+                'load_time': round(load_time, 4),
+                'loaded_at': time.time(),
+                'parameter_bytes': _parameter_bytes(engine),
+                'rss_delta_bytes': (
+                    rss_after - rss_before
+                    if rss_before is not None and rss_after is not None else None
+                ),
+            }
+            self._engines[name] = engine
+            self._failures.pop(name, None)
+            print(f"Recognition engine '{name}' loaded in {load_time:.2f}s")
+            return engine
+
+    def _in_backoff(self, name):
+        failure = self._failures.get(name)
+        return failure is not None and time.monotonic() < failure['retry_at']
+
+    def inference_lock(self, name):
+        """
+        获取引擎的推理锁
+        PyTorch推理本身已使用多线程，串行化调用可避免多个请求争抢CPU和共享状态
+
+        Args:
+            name: 引擎名称
+
+        Returns:
+            threading.Lock: 推理锁
+        """
+        return self._inference_locks[name]
+
+    def is_loaded(self, name):
+        return name in self._engines
+
+    def stats(self):
+        """
+        获取所有引擎的状态
+
+        Returns:
+            dict: 引擎名称到状态信息的映射
+        """
+        rss = _current_rss_bytes()
+        result = {}
+        for name in self._factories:
+            info = dict(self._stats.get(name, {'status': 'not_loaded'}))
+            info['process_rss_bytes'] = rss
+            result[name] = info
+        return result
+
+
+def _build_easyocr_reader():
+    """
+    创建EasyOCR读取器，使用中文简体
+    """
+    import easyocr
+    return easyocr.Reader(['ch_sim'], gpu=False, verbose=False)
+
+
+EASYOCR_ENGINE = 'easyocr'
+
+engine_registry = EngineRegistry()
+engine_registry.register(EASYOCR_ENGINE, _build_easyocr_reader)
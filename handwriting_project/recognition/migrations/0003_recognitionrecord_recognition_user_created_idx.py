@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recognition', '0002_alter_recognitionrecord_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recognitionrecord',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='recognition_user_created_idx'),
+        ),
+    ]
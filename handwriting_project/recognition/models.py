@@ -17,6 +17,10 @@ class RecognitionRecord(models.Model):
         verbose_name = '识别记录'
         verbose_name_plural = '识别记录'
         ordering = ['-created_at']
+        indexes = [
+            # 识别历史按(user, created_at, id)做游标分页
+            models.Index(fields=['user', '-created_at', '-id'], name='recognition_user_created_idx'),
+        ]
     
     def __str__(self):
         return f'{self.user.username} - {self.result} ({self.created_at})'
\ No newline at end of file
@@ -0,0 +1,286 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import uuid
+from concurrent.futures import Future
+from io import BytesIO
+
+from PIL import Image
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+
+from .models import RecognitionRecord
+
+logger = logging.getLogger(__name__)
+
+
+def build_record(job):
+    """
+    根据持久化任务构建识别记录（不写数据库）
+
+    Args:
+        job: 持久化任务字典，包含user_id、original_bytes、original_ext、
+             preprocessed_png或preprocessed_array、result、confidence、candidates
+
+    Returns:
+        RecognitionRecord: 未保存的识别记录
+    """
+    # 保存原始图像：直接使用上传的字节，不再重新编码
+    original_image_name = f"original_{uuid.uuid4()}.{job.get('original_ext', 'png')}"
+    original_image_content = ContentFile(job['original_bytes'], name=original_image_name)
+
+    # 保存预处理后的图像：优先复用已经编码好的PNG，否则在后台线程中编码
+    preprocessed_png = job.get('preprocessed_png')
+    if preprocessed_png is None and job.get('preprocessed_array') is not None:
+        buffer = BytesIO()
+        Image.fromarray(job['preprocessed_array']).save(buffer, format='PNG')
+        preprocessed_png = buffer.getvalue()
+    preprocessed_image_content = None
+    if preprocessed_png:
+        preprocessed_image_name = f"preprocessed_{uuid.uuid4()}.png"
+        preprocessed_image_content = ContentFile(preprocessed_png, name=preprocessed_image_name)
+
+    return RecognitionRecord(
+        user_id=job['user_id'],
+        image=original_image_content,
+        preprocessed_image=preprocessed_image_content,
+        result=job['result'],
+        confidence=job['confidence'],
+        candidates=job['candidates']
+    )
+
+
+def save_records(jobs):
+    """
+    批量保存识别记录；批量插入失败时逐条保存，避免一条坏数据拖垮整批
+
+    Args:
+        jobs: 持久化任务列表
+
+    Returns:
+        list: 与jobs一一对应的识别记录，保存失败的位置为异常对象
+    """
+    records = []
+    for job in jobs:
+        try:
+            records.append(build_record(job))
+        except Exception as e:
+            records.append(e)
+
+    valid = [record for record in records if isinstance(record, RecognitionRecord)]
+    if not valid:
+        return records
+    try:
+        RecognitionRecord.objects.bulk_create(valid)
+        return records
+    except Exception as e:
+        print(f"Error bulk saving recognition records: {str(e)}")
+
+    results = []
+    for record in records:
+        if not isinstance(record, RecognitionRecord):
+            results.append(record)
+            continue
+        try:
+            record.save()
+            results.append(record)
+        except Exception as e:
+            print(f"Error saving recognition record: {str(e)}")
+            results.append(e)
+    return results
+
+
+class RecordPersistenceQueue:
+    """
+    识别记录后台持久化队列
+    有界队列 + 工作线程 + 批量bulk_create；队列满时在请求线程中同步保存，形成背压
+    """
+
+    def __init__(self, max_queue_size=256, workers=2, batch_size=16, put_timeout=0.5):
+        """
+        初始化持久化队列
+
+        Args:
+            max_queue_size: 队列容量
+            workers: 工作线程数
+            batch_size: 每次bulk_create的最大记录数
+            put_timeout: 队列满时等待的秒数，超时后在调用线程中同步保存
+        """
+        self.max_queue_size = max_queue_size
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.put_timeout = put_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+
+        self._saved = 0
+        self._failed = 0
+        self._batches = 0
+        self._synchronous = 0
+
+    def _ensure_workers(self):
+        """
+        懒启动工作线程；fork出的子进程中线程不存在，需要重新启动
+        """
+        if self._pid == os.getpid() and all(thread.is_alive() for thread in self._threads):
+            return
+        with self._lock:
+            if self._pid == os.getpid() and all(thread.is_alive() for thread in self._threads):
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue_size)
+                self._threads = []
+            self._pid = os.getpid()
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._run,
+                    name=f'recognition-persistence-{len(self._threads)}',
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, job):
+        """
+        提交持久化任务
+
+        Args:
+            job: 持久化任务字典
+
+        Returns:
+            Future: 结果为保存后的识别记录
+        """
+        self._ensure_workers()
+        future = Future()
+        try:
+            self._queue.put((job, future), timeout=self.put_timeout)
+        except queue.Full:
+            # 背压：队列已满，由请求线程同步保存
+            self._synchronous += 1
+            self._complete([job], [future])
+        return future
+
+    def _complete(self, jobs, futures):
+        results = save_records(jobs)
+        for future, result in zip(futures, results):
+            if isinstance(result, Exception):
+                self._failed += 1
+                future.set_exception(result)
+            else:
+                self._saved += 1
+                future.set_result(result)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._complete([job for job, _ in batch], [future for _, future in batch])
+                self._batches += 1
+            except Exception as e:
+                print(f"Error persisting recognition records: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        self._failed += 1
+                        future.set_exception(e)
+            finally:
+                close_old_connections()
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """
+        等待队列中的任务全部保存完成
+        """
+        if self._pid == os.getpid() and self._threads:
+            self._queue.join()
+
+    def stats(self):
+        """
+        获取持久化队列统计信息
+
+        Returns:
+            dict: 队列长度、已保存数、失败数、同步保存次数等
+        """
+        return {
+            'queued': self._queue.qsize(),
+            'max_queue_size': self.max_queue_size,
+            'workers': self.workers,
+            'batches': self._batches,
+            'saved': self._saved,
+            'failed': self._failed,
+            'synchronous_fallbacks': self._synchronous,
+        }
+
+
+_persistence = None
+_persistence_lock = threading.Lock()
+
+
+def get_persistence():
+    """
+    获取进程内共享的识别记录持久化队列
+
+    Returns:
+        RecordPersistenceQueue: 持久化队列，未启用异步持久化时返回None
+    """
+    global _persistence
+    if not getattr(settings, 'RECOGNITION_ASYNC_PERSISTENCE', False):
+        return None
+    if _persistence is None:
+        with _persistence_lock:
+            if _persistence is None:
+                _persistence = RecordPersistenceQueue(
+                    max_queue_size=getattr(settings, 'RECOGNITION_PERSISTENCE_QUEUE_SIZE', 256),
+                    workers=getattr(settings, 'RECOGNITION_PERSISTENCE_WORKERS', 2),
+                    batch_size=getattr(settings, 'RECOGNITION_PERSISTENCE_BATCH_SIZE', 16),
+                    put_timeout=getattr(settings, 'RECOGNITION_PERSISTENCE_PUT_TIMEOUT', 0.5),
+                )
+                # 进程正常退出时尽量把队列中的记录写完
+                atexit.register(_persistence.flush)
+    return _persistence
+
+
+def persist_record(job):
+    """
+    保存识别记录：启用异步持久化时提交到后台队列，否则同步保存
+
+    Args:
+        job: 持久化任务字典
+
+    Returns:
+        Future: 结果为保存后的识别记录
+    """
+    persistence = get_persistence()
+    if persistence is not None:
+        future = persistence.submit(job)
+    else:
+        future = Future()
+        result = save_records([job])[0]
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+    future.add_done_callback(_log_result)
+    return future
+
+
+def _log_result(future):
+    # 每个识别请求都会调用，成功时只在DEBUG级别记录
+    error = future.exception()
+    if error is not None:
+        logger.error('Error saving recognition record: %s', error, exc_info=error)
+    else:
+        logger.debug('Recognition record saved: %s', future.result().image.name)
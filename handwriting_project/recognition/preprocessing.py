@@ -1,11 +1,272 @@
 import cv2
 import numpy as np
 from PIL import Image
+from functools import lru_cache, partial
 import io
 
+# 预处理流程版本，修改任何会改变预处理输出的逻辑时需要递增（用于识别结果缓存的键）
+PREPROCESS_VERSION = 3
+
+DEFAULT_STEPS = ['grayscale', 'adaptive_binarize', 'denoise', 'center', 'resize', 'normalize']
+
+
+class _Workspace:
+    """
+    可复用的uint8缓冲区
+    每种尺寸保留两块缓冲区交替使用，整条流水线（以及批处理中的每张图像）不再逐步分配内存
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def buffer(self, shape, exclude=None):
+        """
+        获取指定尺寸的缓冲区
+
+        Args:
+            shape: 缓冲区形状
+            exclude: 不能返回的数组（通常是当前步骤的输入）
+
+        Returns:
+            numpy.ndarray: uint8缓冲区，内容未初始化
+        """
+        shape = tuple(shape)
+        pair = self._buffers.get(shape)
+        if pair is None:
+            pair = self._buffers[shape] = [np.empty(shape, np.uint8), np.empty(shape, np.uint8)]
+        return pair[1] if pair[0] is exclude else pair[0]
+
+
+def _grayscale(src, ws):
+    """
+    灰度化，与PIL的Image.convert('L')逐像素一致（ITU-R 601-2定点系数）
+    三通道输入交给PIL的C实现，比NumPy整数运算更快且结果完全相同
+    """
+    if src.ndim == 2:
+        return src
+    return np.asarray(Image.fromarray(src).convert('L'))
+
+
+def _resize(src, ws, target_size=(64, 256)):
+    """
+    缩放，沿用PIL的LANCZOS实现以保证输出与原流程一致
+    """
+    return np.asarray(Image.fromarray(src).resize(target_size, Image.Resampling.LANCZOS))
+
+
+def _binarize(src, ws, threshold=127):
+    """
+    固定阈值二值化：p < threshold为0，否则为255
+    """
+    dst = ws.buffer(src.shape, exclude=src)
+    cv2.threshold(src, threshold - 1, 255, cv2.THRESH_BINARY, dst=dst)
+    return dst
+
+
+def _adaptive_binarize(src, ws, block_size=11, C=2):
+    dst = ws.buffer(src.shape, exclude=src)
+    cv2.adaptiveThreshold(
+        src, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY_INV, block_size, C, dst=dst
+    )
+    return dst
+
+
+def _denoise(src, ws):
+    dst = ws.buffer(src.shape, exclude=src)
+    kernel = np.ones((1, 1), np.uint8)
+    # 开运算降噪
+    cv2.morphologyEx(src, cv2.MORPH_OPEN, kernel, dst=dst)
+    # 闭运算填充
+    cv2.morphologyEx(dst, cv2.MORPH_CLOSE, kernel, dst=dst)
+    return dst
+
+
+def _gaussian_blur(src, ws):
+    dst = ws.buffer(src.shape, exclude=src)
+    cv2.GaussianBlur(src, (3, 3), 0, dst=dst)
+    return dst
+
+
+def _histogram_equalization(src, ws):
+    dst = ws.buffer(src.shape, exclude=src)
+    cv2.equalizeHist(src, dst=dst)
+    return dst
+
+
+def _grayscale_blur_equalize(src, ws):
+    """
+    融合的灰度化+高斯模糊+直方图均衡化：模糊结果写入缓冲区后原地均衡化，只占用一块缓冲区
+    """
+    gray = _grayscale(src, ws)
+    dst = ws.buffer(gray.shape, exclude=gray)
+    cv2.GaussianBlur(gray, (3, 3), 0, dst=dst)
+    cv2.equalizeHist(dst, dst=dst)
+    return dst
+
+
+def _normalize(src, ws):
+    """
+    原实现先除以255再乘以255并截断为uint8，对全部256个取值都是恒等映射，因此不再做浮点往返
+    """
+    return src
+
+
+def _center(src, ws):
+    # 查找图像边界：用行/列投影代替findNonZero，避免为每个非零像素生成坐标
+    rows = np.flatnonzero(src.any(axis=1))
+    if rows.size == 0:
+        return src
+    cols = np.flatnonzero(src.any(axis=0))
+    y, h = rows[0], rows[-1] - rows[0] + 1
+    x, w = cols[0], cols[-1] - cols[0] + 1
+    # 创建新图像，居中放置裁剪后的图像
+    dst = ws.buffer(src.shape, exclude=src)
+    dst.fill(255)
+    start_y = (dst.shape[0] - h) // 2
+    start_x = (dst.shape[1] - w) // 2
+    dst[start_y:start_y+h, start_x:start_x+w] = src[y:y+h, x:x+w]
+    return dst
+
+
+# 预处理步骤名称到数组内核的映射，内核签名为kernel(src, workspace, **params) -> uint8数组
+_KERNELS = {
+    'grayscale': _grayscale,
+    'gaussian_blur': _gaussian_blur,
+    'histogram_equalization': _histogram_equalization,
+    'resize': _resize,
+    'binarize': _binarize,
+    'adaptive_binarize': _adaptive_binarize,
+    'denoise': _denoise,
+    'normalize': _normalize,
+    'center': _center,
+}
+
+# 可以融合成单个内核的连续步骤
+_FUSIONS = {
+    ('grayscale', 'gaussian_blur', 'histogram_equalization'): _grayscale_blur_equalize,
+}
+
+# 对uint8图像是恒等变换的步骤：denoise使用(1, 1)结构元素做开闭运算，normalize是无损的浮点往返
+_NO_OP_STEPS = {'denoise', 'normalize'}
+
+
+class PreprocessPlan:
+    """
+    编译后的预处理计划
+    构建时校验步骤列表、绑定参数、融合相邻步骤并去掉恒等步骤，执行时只依次调用预先构建好的内核
+    """
+
+    def __init__(self, steps, block_size=11, C=2, target_size=(64, 256), threshold=127):
+        """
+        编译预处理计划
+
+        Args:
+            steps: 预处理步骤列表
+            block_size: adaptive_binarize的块大小
+            C: adaptive_binarize的常数
+            target_size: resize的目标大小(宽, 高)，与PIL一致
+            threshold: binarize的阈值
+
+        Raises:
+            ValueError: 步骤列表中包含未知步骤
+        """
+        unknown = [step for step in steps if step not in _KERNELS]
+        if unknown:
+            raise ValueError(f"未知的预处理步骤: {', '.join(unknown)}")
+
+        self.steps = list(steps)
+        self.starts_with_grayscale = bool(steps) and steps[0] == 'grayscale'
+        self.ends_with_binarize = bool(steps) and steps[-1] == 'binarize'
+
+        params = {
+            'adaptive_binarize': {'block_size': block_size, 'C': C},
+            'resize': {'target_size': tuple(target_size)},
+            'binarize': {'threshold': threshold},
+        }
+
+        self._kernels = []
+        i = 0
+        while i < len(steps):
+            for pattern, fused in _FUSIONS.items():
+                if tuple(steps[i:i + len(pattern)]) == pattern:
+                    self._kernels.append(fused)
+                    i += len(pattern)
+                    break
+            else:
+                step = steps[i]
+                if step not in _NO_OP_STEPS:
+                    kernel = _KERNELS[step]
+                    self._kernels.append(partial(kernel, **params[step]) if step in params else kernel)
+                i += 1
+
+    def __call__(self, array, ws=None):
+        """
+        对uint8数组执行预处理计划
+
+        Args:
+            array: uint8图像数组，(H, W)或(H, W, C)
+            ws: 可选的_Workspace，批处理时复用
+
+        Returns:
+            numpy.ndarray: 处理后的数组（可能是工作区缓冲区）
+        """
+        if ws is None:
+            ws = _Workspace()
+        for kernel in self._kernels:
+            array = kernel(array, ws)
+        return array
+
+    def run(self, image):
+        """
+        对PIL图像或数组执行预处理计划
+
+        Args:
+            image: PIL图像对象，或uint8的numpy数组
+
+        Returns:
+            numpy.ndarray: 处理后的数组
+        """
+        if isinstance(image, Image.Image):
+            if self.starts_with_grayscale:
+                # PIL的灰度转换直接在C中完成，并覆盖调色板等各种图像模式；之后的grayscale内核为空操作
+                image = image.convert('L')
+            array = _to_array(image)
+        else:
+            array = np.asarray(image, dtype=np.uint8)
+        return np.array(self(array))
+
+    def run_batch(self, images, out=None):
+        """
+        批量执行预处理计划，所有图像共享同一组缓冲区
+
+        Args:
+            images: uint8数组(N, H, W)/(N, H, W, C)，或图像数组列表
+            out: 可选的输出数组，形状需为(N, 输出高, 输出宽)
+
+        Returns:
+            numpy.ndarray: 预处理后的数组(N, 输出高, 输出宽)
+        """
+        ws = _Workspace()
+        for i, image in enumerate(images):
+            processed = self(np.asarray(image, dtype=np.uint8), ws)
+            if out is None:
+                out = np.empty((len(images),) + processed.shape, dtype=np.uint8)
+            out[i] = processed
+        return out
+
+
+def _to_array(image):
+    if image.mode == '1':
+        image = image.convert('L')
+    return np.asarray(image)
+
+
 class ImagePreprocessor:
     """
     图像预处理类，用于处理手写汉字图像
+    单步方法接收并返回PIL图像；preprocess/preprocess_batch执行按配置缓存的PreprocessPlan，
+    中间结果始终是可复用的uint8缓冲区，只在输入输出处与PIL转换一次
     """
     
     @staticmethod
@@ -33,10 +294,7 @@ class ImagePreprocessor:
         Returns:
             PIL图像对象: 调整大小后的图像
         """
-        # 确保图像被调整到正确的大小
-        resized = image.resize(target_size, Image.Resampling.LANCZOS)
-        print(f"Resized image size: {resized.size}")
-        return resized
+        return image.resize(target_size, Image.Resampling.LANCZOS)
     
     @staticmethod
     def binarize(image, threshold=127):
@@ -50,7 +308,8 @@ class ImagePreprocessor:
         Returns:
             PIL图像对象: 二值化图像
         """
-        return image.point(lambda p: 0 if p < threshold else 255, '1')
+        binary = _binarize(_to_array(image), _Workspace(), threshold=threshold)
+        return Image.fromarray(binary).convert('1', dither=Image.Dither.NONE)
     
     @staticmethod
     def adaptive_binarize(image, block_size=11, C=2):
@@ -65,15 +324,7 @@ class ImagePreprocessor:
         Returns:
             PIL图像对象: 自适应二值化图像
         """
-        # 转换为OpenCV格式
-        img_cv = np.array(image)
-        # 自适应阈值二值化
-        binary = cv2.adaptiveThreshold(
-            img_cv, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-            cv2.THRESH_BINARY_INV, block_size, C
-        )
-        # 转换回PIL格式
-        return Image.fromarray(binary)
+        return Image.fromarray(_adaptive_binarize(_to_array(image), _Workspace(), block_size, C))
     
     @staticmethod
     def denoise(image):
@@ -86,15 +337,7 @@ class ImagePreprocessor:
         Returns:
             PIL图像对象: 降噪后的图像
         """
-        # 转换为OpenCV格式
-        img_cv = np.array(image)
-        # 开运算降噪
-        kernel = np.ones((1, 1), np.uint8)
-        opening = cv2.morphologyEx(img_cv, cv2.MORPH_OPEN, kernel)
-        # 闭运算填充
-        closing = cv2.morphologyEx(opening, cv2.MORPH_CLOSE, kernel)
-        # 转换回PIL格式
-        return Image.fromarray(closing)
+        return Image.fromarray(_denoise(_to_array(image), _Workspace()))
     
     @staticmethod
     def normalize(image):
@@ -107,13 +350,7 @@ class ImagePreprocessor:
         Returns:
             PIL图像对象: 归一化图像
         """
-        # 转换为numpy数组
-        img_np = np.array(image)
-        # 归一化到[0, 1]
-        img_norm = img_np / 255.0
-        # 转换回PIL格式
-        img_norm = (img_norm * 255).astype(np.uint8)
-        return Image.fromarray(img_norm)
+        return image.copy()
     
     @staticmethod
     def center(image):
@@ -126,46 +363,130 @@ class ImagePreprocessor:
         Returns:
             PIL图像对象: 居中后的图像
         """
-        # 转换为numpy数组
-        img_np = np.array(image)
-        # 查找图像边界
-        coords = cv2.findNonZero(img_np)
+        return Image.fromarray(_center(_to_array(image), _Workspace()))
+    
+    @staticmethod
+    def locate_ink(gray, block_size=11, C=2, padding=10):
+        """
+        定位笔迹区域并判断是否为多行文本
+
+        Args:
+            gray: 灰度图numpy数组（白底黑字）
+            block_size: 自适应二值化块大小
+            C: 自适应二值化常数
+            padding: 笔迹边框外扩的像素数
+
+        Returns:
+            tuple: ((x, y, w, h)笔迹边框，没有笔迹时为None, 是否为多行文本)
+        """
+        binary = cv2.adaptiveThreshold(
+            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY_INV, block_size, C
+        )
+        # 开运算去除孤立噪点，避免边框被噪点撑大
+        binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+        coords = cv2.findNonZero(binary)
+        if coords is None:
+            return None, False
         x, y, w, h = cv2.boundingRect(coords)
-        # 裁剪图像
-        cropped = img_np[y:y+h, x:x+w]
-        # 创建新图像，居中放置裁剪后的图像
-        new_img = np.ones_like(img_np) * 255
-        start_y = (new_img.shape[0] - h) // 2
-        start_x = (new_img.shape[1] - w) // 2
-        new_img[start_y:start_y+h, start_x:start_x+w] = cropped
-        # 转换回PIL格式
-        return Image.fromarray(new_img)
+
+        # 水平投影：按空白行把笔迹切分成若干横带
+        rows = binary[y:y+h, x:x+w].any(axis=1)
+        min_gap = max(3, int(h * 0.15))
+        bands = []
+        start = None
+        gap = 0
+        for i, has_ink in enumerate(rows):
+            if has_ink:
+                if start is None:
+                    start = i
+                elif gap >= min_gap:
+                    bands.append(end - start + 1)
+                    start = i
+                end = i
+                gap = 0
+            else:
+                gap += 1
+        if start is not None:
+            bands.append(end - start + 1)
+
+        # 单字中"三""二"等横画也会被切成多条横带，但每条都很薄；
+        # 只有至少两条横带都足够高时才认为是多行文本
+        tall_bands = [band for band in bands if band >= h * 0.25]
+        is_multiline = len(tall_bands) >= 2
+
+        x0 = max(0, x - padding)
+        y0 = max(0, y - padding)
+        x1 = min(gray.shape[1], x + w + padding)
+        y1 = min(gray.shape[0], y + h + padding)
+        return (x0, y0, x1 - x0, y1 - y0), is_multiline
+
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def _compile(steps, block_size, C, target_size):
+        return PreprocessPlan(list(steps), block_size=block_size, C=C, target_size=target_size)
     
     @classmethod
-    def preprocess(cls, image, steps=None):
+    def compile(cls, steps=None, block_size=11, C=2, target_size=(64, 256)):
         """
-        完整的图像预处理流程
+        获取预处理计划，相同配置只编译一次
         
         Args:
-            image: PIL图像对象
             steps: 预处理步骤列表，默认使用所有步骤
+            block_size: adaptive_binarize的块大小
+            C: adaptive_binarize的常数
+            target_size: resize的目标大小
             
         Returns:
-            tuple: (预处理后的图像, 预处理步骤记录)
+            PreprocessPlan: 预处理计划
+            
+        Raises:
+            ValueError: 步骤列表中包含未知步骤
         """
         if steps is None:
-            steps = ['grayscale', 'adaptive_binarize', 'denoise', 'center', 'resize', 'normalize']
+            steps = DEFAULT_STEPS
+        return cls._compile(tuple(steps), block_size, C, tuple(target_size))
+    
+    @classmethod
+    def preprocess(cls, image, steps=None, **params):
+        """
+        完整的图像预处理流程
+        
+        Args:
+            image: PIL图像对象，或uint8的numpy数组(H, W)/(H, W, C)
+            steps: 预处理步骤列表，默认使用所有步骤
+            **params: 预处理参数（block_size、C、target_size）
+            
+        Returns:
+            tuple: (预处理后的图像（与输入类型相同）, 预处理步骤记录)
+        """
+        plan = cls.compile(steps, **params)
+        processed = plan.run(image)
         
-        processed_image = image
-        step_records = []
+        if not isinstance(image, Image.Image):
+            return processed, list(plan.steps)
         
-        # 执行指定的预处理步骤
-        for step in steps:
-            if hasattr(cls, step):
-                processed_image = getattr(cls, step)(processed_image)
-                step_records.append(step)
+        processed_image = Image.fromarray(processed)
+        if plan.ends_with_binarize:
+            processed_image = processed_image.convert('1', dither=Image.Dither.NONE)
+        return processed_image, list(plan.steps)
+    
+    @classmethod
+    def preprocess_batch(cls, images, steps=None, out=None, **params):
+        """
+        批量图像预处理，所有图像共享同一组缓冲区
         
-        return processed_image, step_records
+        Args:
+            images: uint8数组(N, H, W)/(N, H, W, C)，或尺寸一致的图像数组列表
+            steps: 预处理步骤列表，默认使用所有步骤
+            out: 可选的输出数组，形状需为(N, 输出高, 输出宽)
+            **params: 预处理参数（block_size、C、target_size）
+            
+        Returns:
+            tuple: (预处理后的数组(N, 输出高, 输出宽), 预处理步骤记录)
+        """
+        plan = cls.compile(steps, **params)
+        return plan.run_batch(images, out=out), list(plan.steps)
     
     @staticmethod
     def pil_to_bytes(image):
@@ -194,4 +515,30 @@ class ImagePreprocessor:
         Returns:
             PIL图像对象
         """
-        return Image.open(io.BytesIO(image_bytes))
\ No newline at end of file
+        return Image.open(io.BytesIO(image_bytes))
+
+
+if __name__ == '__main__':
+    # 微基准：测量单张和批量预处理的每张图像耗时
+    import time
+
+    rng = np.random.default_rng(0)
+    canvas = np.full((280, 280, 3), 255, dtype=np.uint8)
+    for _ in range(8):
+        x0, y0, x1, y1 = (int(v) for v in rng.integers(40, 240, size=4))
+        cv2.line(canvas, (x0, y0), (x1, y1), (0, 0, 0), thickness=9)
+    pil_canvas = Image.fromarray(canvas)
+    batch = np.stack([canvas] * 64)
+
+    def per_image_ms(func, count, repeat=5):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best / count * 1000
+
+    n = 200
+    print(f"preprocess(PIL):       {per_image_ms(lambda: [ImagePreprocessor.preprocess(pil_canvas) for _ in range(n)], n):.3f} ms/image")
+    print(f"preprocess(ndarray):   {per_image_ms(lambda: [ImagePreprocessor.preprocess(canvas) for _ in range(n)], n):.3f} ms/image")
+    print(f"preprocess_batch(N=64): {per_image_ms(lambda: ImagePreprocessor.preprocess_batch(batch), len(batch)):.3f} ms/image")
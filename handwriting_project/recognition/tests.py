@@ -1,3 +1,479 @@
-from django.test import TestCase
+import base64
+import io
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .backends import EasyOCRBackend
+from .batching import MicroBatcher
+from .cache import RecognitionCache
+from .engine import EASYOCR_ENGINE, EngineRegistry, EngineUnavailable
+from .persistence import RecordPersistenceQueue
+from .preprocessing import DEFAULT_STEPS, ImagePreprocessor, PreprocessPlan, _KERNELS, _Workspace
+from .views import RecognitionHistoryView
+
+
+class MicroBatcherTests(SimpleTestCase):
+    """
+    请求合并器：时间窗口和批次上限触发执行，批处理异常传递到每个Future
+    """
+
+    def _recording_batcher(self, **kwargs):
+        batches = []
+
+        def batch_fn(items):
+            batches.append(list(items))
+            return [item * 10 for item in items]
+
+        return MicroBatcher(batch_fn, **kwargs), batches
+
+    def test_window_flushes_partial_batch(self):
+        batcher, batches = self._recording_batcher(max_batch_size=8, window_ms=100)
+        futures = [batcher.submit(i) for i in range(3)]
+
+        self.assertEqual([future.result(timeout=2) for future in futures], [0, 10, 20])
+        # 批次未满，窗口结束后三个请求合并为一批执行
+        self.assertEqual(batches, [[0, 1, 2]])
+
+    def test_max_batch_size_flushes_before_window(self):
+        batcher, batches = self._recording_batcher(max_batch_size=2, window_ms=10000)
+        start = time.perf_counter()
+        futures = [batcher.submit(i) for i in range(4)]
+
+        self.assertEqual([future.result(timeout=2) for future in futures], [0, 10, 20, 30])
+        # 批次满时立即执行，不等待10秒的窗口
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertEqual(batches, [[0, 1], [2, 3]])
+        self.assertEqual(batcher.stats()['max_observed_batch_size'], 2)
+
+    def test_exception_propagates_to_every_future(self):
+        def batch_fn(items):
+            raise ValueError('engine failed')
+
+        batcher = MicroBatcher(batch_fn, max_batch_size=4, window_ms=50)
+        futures = [batcher.submit(i) for i in range(3)]
+
+        for future in futures:
+            with self.assertRaisesMessage(ValueError, 'engine failed'):
+                future.result(timeout=2)
+
+    def test_result_count_mismatch_raises(self):
+        batcher = MicroBatcher(lambda items: items[:1], max_batch_size=2, window_ms=10000)
+        futures = [batcher.submit(i) for i in range(2)]
+
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=2)
+
+
+
+    def test_run_times_out_when_worker_hangs(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        batcher = MicroBatcher(lambda items: release.wait() or items, max_batch_size=1, window_ms=0)
+
+        start = time.perf_counter()
+        with self.assertRaises(TimeoutError):
+            batcher.run(1, timeout=0.3, poll_interval=0.05)
+        self.assertLess(time.perf_counter() - start, 2)
+
+    def test_dead_worker_is_restarted(self):
+        class WorkerKilled(BaseException):
+            pass
+
+        calls = []
+
+        def batch_fn(items):
+            calls.append(items)
+            if len(calls) == 1:
+                raise WorkerKilled()
+            return items
+
+        batcher = MicroBatcher(batch_fn, max_batch_size=1, window_ms=0)
+        # 线程因未捕获的BaseException退出，避免测试输出中的回溯
+        with mock.patch('threading.excepthook'):
+            with self.assertRaises(RuntimeError):
+                batcher.run('lost', timeout=5, poll_interval=0.05)
+        self.assertEqual(batcher.run('next', timeout=5, poll_interval=0.05), 'next')
+        self.assertEqual(batcher.stats()['worker_restarts'], 1)
+
+
+class FakeEasyOCRReader:
+    """
+    记录recognize调用的EasyOCR替身，识别结果为框的宽度，便于核对结果是否对应回正确的图像
+    """
+
+    def __init__(self):
+        self.recognize_calls = []
+
+    def recognize(self, image, horizontal_list, free_list, batch_size, detail):
+        self.recognize_calls.append(len(horizontal_list))
+        return [
+            ([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], str(x1 - x0), 0.9)
+            for x0, x1, y0, y1 in horizontal_list
+        ]
+
+
+class EasyOCRBatchingTests(SimpleTestCase):
+    """
+    检测跳过路径下，合并器凑成的一批请求只对EasyOCR做一次识别前向传播
+    """
+
+    def setUp(self):
+        self.reader = FakeEasyOCRReader()
+        registry = EngineRegistry()
+        registry.register(EASYOCR_ENGINE, lambda: self.reader)
+        patcher = mock.patch('recognition.backends.engine_registry', registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _single_char(width):
+        image = np.full((120, 160), 255, dtype=np.uint8)
+        image[40:80, 30:30 + width] = 0
+        return image
+
+    def test_queued_requests_share_one_recognize_call(self):
+        backend = EasyOCRBackend(detector_skip=True)
+        batcher = MicroBatcher(backend.recognize_batch, max_batch_size=8, window_ms=200)
+        widths = [20, 30, 40, 50, 60, 70]
+        futures = [batcher.submit(self._single_char(width)) for width in widths]
+        outcomes = [future.result(timeout=5) for future in futures]
+
+        self.assertLess(len(self.reader.recognize_calls), len(widths))
+        self.assertEqual(self.reader.recognize_calls, [len(widths)])
+        # locate_ink在笔迹两侧各外扩10像素；识别结果取文本的第一个字符
+        self.assertEqual([outcome['result'] for outcome in outcomes], [str(w + 20)[0] for w in widths])
+
+
+
+@override_settings(RECOGNITION_BACKEND=EASYOCR_ENGINE, RECOGNITION_CACHE_ENABLED=False,
+                   RECOGNITION_BATCHING_ENABLED=False)
+class EngineUnavailableTests(TestCase):
+    """
+    识别引擎加载失败时返回503，而不是提示用户图像中没有文字
+    """
+
+    def setUp(self):
+        self.factory_calls = 0
+
+        def failing_factory():
+            self.factory_calls += 1
+            raise OSError('model files missing')
+
+        registry = EngineRegistry(retry_backoff=60)
+        registry.register(EASYOCR_ENGINE, failing_factory)
+        patcher = mock.patch('recognition.backends.engine_registry', registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = get_user_model().objects.create_user(username='engine-test', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=user)
+
+    def _post_image(self):
+        buffer = io.BytesIO()
+        Image.new('L', (64, 64), 255).save(buffer, format='PNG')
+        upload = SimpleUploadedFile('char.png', buffer.getvalue(), content_type='image/png')
+        return self.client.post(reverse('image_recognition'), {'image': upload}, format='multipart')
+
+    def test_failed_engine_load_returns_503(self):
+        with mock.patch('builtins.print'):
+            first = self._post_image()
+            second = self._post_image()
+
+        self.assertEqual(first.status_code, 503)
+        self.assertEqual(second.status_code, 503)
+        # 退避时间内不再重复加载
+        self.assertEqual(self.factory_calls, 1)
+
+    def test_engine_lost_during_recognition_returns_503(self):
+        backend = EasyOCRBackend()
+        with mock.patch('recognition.views.get_backend', return_value=backend), \
+                mock.patch.object(backend, 'recognize_batch', side_effect=EngineUnavailable('gone')), \
+                mock.patch('builtins.print'):
+            response = self._post_image()
+
+        self.assertEqual(response.status_code, 503)
+
+
+@override_settings(RECOGNITION_BACKEND=EASYOCR_ENGINE, RECOGNITION_CACHE_ENABLED=False,
+                   RECOGNITION_BATCHING_ENABLED=False)
+class RecognizeResponseRecordTests(TestCase):
+    """
+    识别响应带回新记录，客户端不必等待异步持久化完成再查询历史
+    """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        backend = EasyOCRBackend()
+        outcome = {'result': '永', 'confidence': 0.875, 'candidates': [{'char': '永', 'confidence': 0.875}]}
+        for patcher in (
+            mock.patch('recognition.views.get_backend', return_value=backend),
+            mock.patch.object(backend, 'recognize_batch', return_value=[outcome]),
+            mock.patch('builtins.print'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.user = get_user_model().objects.create_user(username='record-test', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _post_image(self):
+        buffer = io.BytesIO()
+        Image.new('L', (64, 64), 255).save(buffer, format='PNG')
+        upload = SimpleUploadedFile('char.png', buffer.getvalue(), content_type='image/png')
+        return self.client.post(reverse('image_recognition'), {'image': upload}, format='multipart')
+
+    def test_pending_record_is_returned_without_id(self):
+        with mock.patch('recognition.views.persist_record', return_value=Future()):
+            response = self._post_image()
+
+        self.assertEqual(response.status_code, 200)
+        record = response.data['record']
+        self.assertIsNone(record['id'])
+        self.assertEqual(record['result'], '永')
+        self.assertEqual(record['confidence'], 0.875)
+        self.assertEqual(record['candidates'], response.data['candidates'])
+
+    @override_settings(RECOGNITION_ASYNC_PERSISTENCE=False)
+    def test_saved_record_matches_history_entry(self):
+        response = self._post_image()
+
+        history = self.client.get(reverse('recognition_history'), {'limit': 1})
+        self.assertEqual(response.data['record'], history.data['results'][0])
+
+
+class RecognitionCacheTests(SimpleTestCase):
+    """
+    识别结果缓存：键随像素、模式、预处理版本和模型版本变化，进程内LRU按条目数和字节数淘汰
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.image = Image.fromarray(rng.integers(0, 256, size=(64, 96), dtype=np.uint8))
+
+    def test_key_is_stable_for_same_input(self):
+        copy = Image.fromarray(np.asarray(self.image).copy())
+        self.assertEqual(
+            RecognitionCache.make_key(self.image, 'crnn:1'),
+            RecognitionCache.make_key(copy, 'crnn:1'),
+        )
+
+    def test_key_changes_with_model_version(self):
+        self.assertNotEqual(
+            RecognitionCache.make_key(self.image, 'crnn:1'),
+            RecognitionCache.make_key(self.image, 'crnn:2'),
+        )
+
+    def test_key_changes_with_preprocess_version(self):
+        key = RecognitionCache.make_key(self.image, 'crnn:1')
+        with mock.patch('recognition.cache.PREPROCESS_VERSION', -1):
+            self.assertNotEqual(RecognitionCache.make_key(self.image, 'crnn:1'), key)
+
+    def test_key_changes_with_image_mode(self):
+        self.assertNotEqual(
+            RecognitionCache.make_key(self.image, 'crnn:1'),
+            RecognitionCache.make_key(self.image.convert('RGB'), 'crnn:1'),
+        )
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = RecognitionCache(max_entries=2)
+        cache.set('a', {'result': 'a'})
+        cache.set('b', {'result': 'b'})
+        cache.get('a')
+        cache.set('c', {'result': 'c'})
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), {'result': 'a'})
+        self.assertEqual(cache.get('c'), {'result': 'c'})
+
+    def test_lru_evicts_by_bytes(self):
+        cache = RecognitionCache(max_entries=100, max_bytes=2500)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, {'preprocessed': np.zeros(1000, dtype=np.uint8)})
+
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+        self.assertEqual(cache.stats()['bytes'], 2000)
+
+    def test_oversized_entry_is_not_stored(self):
+        cache = RecognitionCache(max_bytes=100)
+        cache.set('a', {'preprocessed': np.zeros(1000, dtype=np.uint8)})
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+
+class RecordPersistenceQueueTests(SimpleTestCase):
+    """
+    持久化队列：队列满时在调用线程中同步保存
+    """
+
+    def test_full_queue_falls_back_to_synchronous_save(self):
+        persistence = RecordPersistenceQueue(max_queue_size=1, workers=1, put_timeout=0)
+        saved_in = []
+
+        def save_records(jobs):
+            saved_in.append(threading.current_thread())
+            return [f"record-{job['id']}" for job in jobs]
+
+        # 不启动工作线程，第一条任务留在队列中把队列占满
+        with mock.patch.object(persistence, '_ensure_workers'), \
+                mock.patch('recognition.persistence.save_records', side_effect=save_records):
+            queued = persistence.submit({'id': 1})
+            fallback = persistence.submit({'id': 2})
+
+        self.assertFalse(queued.done())
+        self.assertEqual(fallback.result(timeout=0), 'record-2')
+        self.assertEqual(saved_in, [threading.current_thread()])
+        stats = persistence.stats()
+        self.assertEqual(stats['synchronous_fallbacks'], 1)
+        self.assertEqual(stats['queued'], 1)
+        self.assertEqual(stats['saved'], 1)
+
+
+class HistoryCursorTests(TestCase):
+    """
+    识别历史游标：编码解码往返一致，格式错误的游标返回400
+    """
+
+    def test_cursor_round_trip(self):
+        created_at = datetime(2024, 5, 6, 7, 8, 9, 123456, tzinfo=dt_timezone.utc)
+        cursor = RecognitionHistoryView._encode_cursor(created_at, 42)
+
+        self.assertEqual(RecognitionHistoryView._decode_cursor(cursor), (created_at, 42))
+
+    def test_decode_rejects_malformed_cursor(self):
+        malformed = [
+            'not-base64!',
+            base64.urlsafe_b64encode(b'no separator').decode('ascii'),
+            base64.urlsafe_b64encode(b'2024-05-06T07:08:09|abc').decode('ascii'),
+            base64.urlsafe_b64encode(b'yesterday|1').decode('ascii'),
+            base64.urlsafe_b64encode(b'\xff\xfe|1').decode('ascii'),
+        ]
+        for cursor in malformed:
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                RecognitionHistoryView._decode_cursor(cursor)
+
+    def test_history_returns_400_for_malformed_cursor(self):
+        user = get_user_model().objects.create_user(username='cursor-test', password='password')
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        response = client.get(reverse('recognition_history'), {'cursor': 'not-base64!'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+# 优化前逐步使用PIL/OpenCV实现的ImagePreprocessor在固定输入上的输出，用来发现预处理结果的任何变化
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), 'testdata', 'preprocess_golden.npz')
+GOLDEN_STEPS = {
+    'default': None,
+    'grayscale_resize': ['grayscale', 'resize'],
+    'grayscale_binarize': ['grayscale', 'binarize'],
+}
+
+
+class PreprocessGoldenTests(SimpleTestCase):
+    """
+    预处理输出与优化前流水线生成的参考输出逐像素一致
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with np.load(GOLDEN_PATH) as golden:
+            cls.golden = dict(golden)
+        cls.inputs = [cls.golden[f'input_{i}'] for i in range(3)]
+
+    def _expected(self, name, i):
+        expected = self.golden[f'{name}_{i}']
+        # 参考输出中二值图为'1'模式（布尔数组）
+        return expected.astype(np.uint8) * 255 if expected.dtype == bool else expected
+
+    def test_pil_input_matches_golden(self):
+        for name, steps in GOLDEN_STEPS.items():
+            for i, array in enumerate(self.inputs):
+                processed, _ = ImagePreprocessor.preprocess(Image.fromarray(array), steps)
+                with self.subTest(steps=name, input=i):
+                    np.testing.assert_array_equal(np.asarray(processed), self.golden[f'{name}_{i}'])
+
+    def test_array_input_matches_golden(self):
+        for name, steps in GOLDEN_STEPS.items():
+            for i, array in enumerate(self.inputs):
+                processed, _ = ImagePreprocessor.preprocess(array, steps)
+                with self.subTest(steps=name, input=i):
+                    np.testing.assert_array_equal(processed, self._expected(name, i))
+
+    def test_step_methods_match_golden(self):
+        for i, array in enumerate(self.inputs):
+            image = Image.fromarray(array)
+            for step in DEFAULT_STEPS:
+                image = getattr(ImagePreprocessor, step)(image)
+            with self.subTest(input=i):
+                np.testing.assert_array_equal(np.asarray(image), self.golden[f'default_{i}'])
+
+
+class PreprocessPlanTests(SimpleTestCase):
+    """
+    编译后的预处理计划（融合内核、去掉恒等步骤、批处理共享缓冲区）与逐步执行一致
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with np.load(GOLDEN_PATH) as golden:
+            cls.golden = dict(golden)
+        cls.inputs = [cls.golden[f'input_{i}'] for i in range(3)]
+
+    @staticmethod
+    def _step_by_step(array, steps):
+        for step in steps:
+            array = np.array(_KERNELS[step](array, _Workspace()))
+        return array
+
+    def test_fused_kernel_matches_separate_steps(self):
+        steps = ['grayscale', 'gaussian_blur', 'histogram_equalization', 'resize']
+        for i, array in enumerate(self.inputs):
+            with self.subTest(input=i):
+                np.testing.assert_array_equal(PreprocessPlan(steps).run(array), self._step_by_step(array, steps))
+
+    def test_no_op_steps_are_dropped_without_changing_output(self):
+        plan = PreprocessPlan(DEFAULT_STEPS)
+        self.assertEqual(len(plan._kernels), len(DEFAULT_STEPS) - 2)
+        for i, array in enumerate(self.inputs):
+            with self.subTest(input=i):
+                np.testing.assert_array_equal(plan.run(array), self.golden[f'default_{i}'])
+
+    def test_compile_reuses_plan(self):
+        self.assertIs(ImagePreprocessor.compile(), ImagePreprocessor.compile(list(DEFAULT_STEPS)))
+
+    def test_unknown_step_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ImagePreprocessor.compile(['grayscale', 'sharpen'])
+
+    def test_batch_matches_golden(self):
+        # 批处理要求尺寸一致，只使用第一张输入
+        batch = np.stack([self.inputs[0]] * 3)
+        processed, _ = ImagePreprocessor.preprocess_batch(batch)
+        for image in processed:
+            np.testing.assert_array_equal(image, self.golden['default_0'])
@@ -2,7 +2,8 @@ from django.urls import path
 from .views import (
     ImageRecognitionView,
     RecognitionHistoryView,
-    RecognitionDetailView
+    RecognitionDetailView,
+    RecognitionStatusView
 )
 
 urlpatterns = [
@@ -14,4 +15,7 @@ urlpatterns = [
     
     # 单个识别记录详情API
     path('history/<int:record_id>/', RecognitionDetailView.as_view(), name='recognition_detail'),
+    
+    # 识别服务状态API
+    path('status/', RecognitionStatusView.as_view(), name='recognition_status'),
 ]
\ No newline at end of file
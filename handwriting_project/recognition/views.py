@@ -1,19 +1,25 @@
 from rest_framework import views, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.core.files.base import ContentFile
-from datetime import datetime
+from django.db.models import Q
+from django.utils import timezone
+from datetime import date, datetime, timedelta
 from PIL import Image
 from io import BytesIO
-import numpy as np
-import cv2
 import base64
-import uuid
-import time
-import easyocr
-import os
+from concurrent.futures import TimeoutError
 
 from .models import RecognitionRecord
+from .engine import engine_registry, EngineUnavailable
+from .backends import get_backend
+from .batching import get_batcher
+from .cache import get_cache
+from .persistence import get_persistence, persist_record
+
+# 预处理图像预览格式：none不返回预览，png为单通道PNG，webp为WebP，url为已保存的预处理图像地址
+PREVIEW_FORMATS = ('none', 'png', 'webp', 'url')
+# preview=url时等待识别记录保存的最长秒数
+PREVIEW_URL_TIMEOUT = 5
 
 class ImageRecognitionView(views.APIView):
     """
@@ -22,67 +28,127 @@ class ImageRecognitionView(views.APIView):
     """
     permission_classes = [IsAuthenticated]
     
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        # 初始化EasyOCR系统
-        print("Initializing OCR System for handwriting recognition")
-        print("Loading EasyOCR model...")
-        
-        # 尝试初始化EasyOCR
-        try:
-            # 加载EasyOCR模型，使用中文简体
-            # detail=0 返回简化结果格式，更容易解析
-            self.reader = easyocr.Reader(['ch_sim'], gpu=False, verbose=False)
-            print("EasyOCR engine initialized successfully")
-        except Exception as e:
-            print(f"Error: EasyOCR engine initialization failed. Error: {str(e)}")
-            self.reader = None
-        
-        print("OCR system ready for handwriting recognition")
+    @property
+    def backend(self):
+        """
+        当前配置的识别后端（settings.RECOGNITION_BACKEND），进程内共享
+        """
+        return get_backend()
     
     def _preprocess_image(self, image):
         """
-        图像预处理：和app.py一致
+        图像预处理：由识别后端决定，EasyOCR后端和app.py一致
+        """
+        return self.backend.prepare(image)
+    
+    def _recognize(self, backend, image):
         """
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        预处理并识别单张图像
         
-        image_np = np.array(image)
+        Args:
+            backend: 识别后端
+            image: PIL图像对象
+            
+        Returns:
+            tuple: (识别结果字典或None, 预处理后的单通道图像数组, 识别是否正常完成)
+            
+        Raises:
+            EngineUnavailable: 识别引擎不可用
+            TimeoutError: 等待合并批次的结果超时
+        """
+        # 图像预处理
+        processed_image = backend.prepare(image)
         
-        gray = cv2.cvtColor(image_np, cv2.COLOR_RGB2GRAY)
-        blurred = cv2.GaussianBlur(gray, (3, 3), 0)
-        enhanced = cv2.equalizeHist(blurred)
-        enhanced = cv2.cvtColor(enhanced, cv2.COLOR_GRAY2RGB)
+        # 执行识别
+        batcher = get_batcher()
+        try:
+            if batcher is not None:
+                # 与并发请求合并成一批，执行一次批量前向传播
+                outcome = batcher.run(processed_image)
+            else:
+                outcome = backend.recognize_batch([processed_image])[0]
+        except (EngineUnavailable, TimeoutError):
+            # 服务端问题，不能当作图像中没有文字
+            raise
+        except Exception as e:
+            print(f"Error during OCR processing: {str(e)}")
+            return None, processed_image, False
         
-        return enhanced
+        return outcome, processed_image, True
     
-    def _process_ocr_result(self, result):
+    def _parse_preview_options(self, request):
         """
-        处理OCR结果
+        解析预处理图像预览参数
         
         Args:
-            result: EasyOCR返回的结果
+            request: HTTP请求对象，可在表单或查询参数中携带preview和preview_max_size
             
         Returns:
-            tuple: (texts, confidences)
+            tuple: (预览格式, 最大边长或None)
+            
+        Raises:
+            ValueError: 参数不合法
         """
-        texts = []
-        confidences = []
+        preview = request.data.get('preview') or request.query_params.get('preview') or 'none'
+        preview = str(preview).lower()
+        if preview not in PREVIEW_FORMATS:
+            raise ValueError(f"preview参数必须是{', '.join(PREVIEW_FORMATS)}之一")
         
-        if result is None:
-            return texts, confidences
+        max_size = request.data.get('preview_max_size') or request.query_params.get('preview_max_size')
+        if max_size in (None, ''):
+            return preview, None
+        max_size = int(max_size)
+        if max_size <= 0:
+            raise ValueError('preview_max_size必须是正整数')
+        return preview, max_size
+    
+    def _encode_preview(self, processed_image, preview, max_size):
+        """
+        编码预处理图像预览
         
-        try:
-            for item in result:
-                if isinstance(item, (list, tuple)) and len(item) >= 2:
-                    text = item[1] if isinstance(item[1], str) else str(item[1])
-                    confidence = float(item[2]) if len(item) > 2 and isinstance(item[2], (int, float, np.floating)) else 0.0
-                    texts.append(text)
-                    confidences.append(confidence)
-        except Exception as e:
-            print(f"Error processing OCR result: {e}")
+        Args:
+            processed_image: 预处理后的单通道图像数组
+            preview: 'png'或'webp'
+            max_size: 最大边长，None表示保持原始分辨率
+            
+        Returns:
+            bytes: 编码后的图像字节
+        """
+        preview_image = Image.fromarray(processed_image)
+        if max_size and max(preview_image.size) > max_size:
+            preview_image.thumbnail((max_size, max_size), Image.Resampling.BILINEAR)
+        
+        buffer = BytesIO()
+        if preview == 'webp':
+            preview_image.save(buffer, format='WEBP', quality=80, method=0)
+        else:
+            preview_image.save(buffer, format='PNG')
+        return buffer.getvalue()
+    
+    @staticmethod
+    def _record_data(record_future, response_data):
+        """
+        构建与识别历史条目格式相同的新记录；记录已经写入时带上id，否则id为None
         
-        return texts, confidences
+        Args:
+            record_future: persist_record返回的Future，提交失败时为None
+            response_data: 识别响应数据
+            
+        Returns:
+            dict: 识别记录数据
+        """
+        record_data = {
+            'id': None,
+            'result': response_data['result'],
+            'confidence': response_data['confidence'],
+            'candidates': response_data['candidates'],
+            'created_at': timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        if record_future is not None and record_future.done() and record_future.exception() is None:
+            record = record_future.result()
+            record_data['id'] = record.id
+            record_data['created_at'] = record.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        return record_data
     
     def post(self, request, *args, **kwargs):
         """
@@ -102,115 +168,81 @@ class ImageRecognitionView(views.APIView):
             )
         
         try:
-            # 获取图像
-            image = Image.open(request.data['image'])
-            
-            # 图像预处理
-            processed_image = self._preprocess_image(image)
+            preview, preview_max_size = self._parse_preview_options(request)
+        except (TypeError, ValueError) as e:
+            return Response(
+                {'error': f'预览参数错误: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            backend = self.backend
+            if backend is None:
+                return Response(
+                    {'error': '识别引擎未能加载，请稍后重试'},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
             
-            # 将预处理后的图像转换为base64编码
-            preprocessed_image_base64 = None
-            try:
-                # 将numpy数组转换回PIL图像
-                processed_pil_image = Image.fromarray(processed_image)
-                
-                # 将图像保存到BytesIO对象
-                buffer = BytesIO()
-                processed_pil_image.save(buffer, format='PNG')
-                
-                # 转换为base64编码
-                preprocessed_image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                print("Preprocessed image converted to base64 successfully")
-            except Exception as e:
-                print(f"Error converting preprocessed image to base64: {str(e)}")
-                preprocessed_image_base64 = None
+            # 获取图像，保留上传的原始字节用于保存原始图像
+            original_bytes = request.data['image'].read()
+            image = Image.open(BytesIO(original_bytes))
+            original_ext = (image.format or 'png').lower()
             
-            # 使用EasyOCR进行OCR
-            result = None
-            texts = []
-            confidences = []
+            # 查询识别结果缓存，命中时跳过预处理和识别
+            cache = get_cache()
+            cache_key = cache.make_key(image, backend.cache_version) if cache is not None else None
+            cached = cache.get(cache_key) if cache is not None else None
             
-            if self.reader:
-                try:
-                    result = self.reader.readtext(processed_image, batch_size=4)
-                    print(f"EasyOCR result: {result}")
-                    texts = []
-                    confidences = []
-                    if result:
-                        for item in result:
-                            if isinstance(item, (list, tuple)) and len(item) >= 2:
-                                text = str(item[1]) if item[1] is not None else ''
-                                conf = float(item[2]) if len(item) > 2 and item[2] is not None else 0.0
-                                if text:
-                                    texts.append(text)
-                                    confidences.append(conf)
-                    print(f"Parsed texts: {texts}, confidences: {confidences}")
-                except Exception as e:
-                    print(f"Error during OCR processing: {str(e)}")
-                    texts, confidences = [], []
+            if cached is not None:
+                outcome = cached['outcome']
+                processed_image = cached['processed_image']
+                print("Recognition cache hit")
             else:
-                print("EasyOCR not initialized, cannot perform recognition")
+                outcome, processed_image, succeeded = self._recognize(backend, image)
+                if cache is not None and succeeded:
+                    cache.set(cache_key, {
+                        'outcome': outcome,
+                        'processed_image': processed_image,
+                    })
             
             # 处理识别结果
             predicted_char = ""
             confidence = 0.0
             candidates = []
             
-            if texts:
-                best_text = texts[0]
-                best_confidence = confidences[0] if confidences else 0.85
-                print(f"Best OCR Result: '{best_text}' with confidence: {best_confidence}")
-                
-                predicted_char = best_text[0]
-                confidence = best_confidence
+            if outcome:
+                predicted_char = outcome['result']
+                confidence = outcome['confidence']
+                candidates = outcome['candidates']
                 print(f"Selected character: '{predicted_char}'")
-                
-                candidates = [
-                    {'char': predicted_char, 'confidence': best_confidence}
-                ]
-                
-                if len(best_text) > 1:
-                    for i, char in enumerate(best_text[1:4]):
-                        if char and isinstance(char, str) and char.strip():
-                            candidates.append({
-                                'char': char,
-                                'confidence': round(best_confidence - (i+1)*0.05, 4)
-                            })
             
             print(f"Final result: char='{predicted_char}', confidence={confidence}, candidates_count={len(candidates)}")
                 
-            if not texts:
+            if not outcome:
                 return Response(
                     {'error': '未能识别出文字，请上传更清晰的手写图像'},
                     status=status.HTTP_200_OK
                 )
             
-            # 保存识别记录
+            # 仅在客户端请求时编码预览；全分辨率PNG预览可直接复用为识别记录中的预处理图像
+            preview_bytes = None
+            if preview in ('png', 'webp'):
+                preview_bytes = self._encode_preview(processed_image, preview, preview_max_size)
+            reuse_preview = preview == 'png' and preview_max_size is None
+            
+            # 保存识别记录：提交到后台持久化队列，不阻塞响应；预处理图像的PNG编码也在后台完成
+            record_future = None
             try:
-                # 保存原始图像
-                original_image_name = f"original_{uuid.uuid4()}.png"
-                original_image_io = BytesIO()
-                image.save(original_image_io, format='PNG')
-                original_image_content = ContentFile(original_image_io.getvalue(), name=original_image_name)
-                
-                # 保存预处理后的图像
-                preprocessed_image_name = f"preprocessed_{uuid.uuid4()}.png"
-                preprocessed_image_content = None
-                if preprocessed_image_base64:
-                    preprocessed_image_data = base64.b64decode(preprocessed_image_base64)
-                    preprocessed_image_content = ContentFile(preprocessed_image_data, name=preprocessed_image_name)
-                
-                # 创建识别记录
-                recognition_record = RecognitionRecord(
-                    user=request.user,
-                    image=original_image_content,
-                    preprocessed_image=preprocessed_image_content,
-                    result=predicted_char,
-                    confidence=confidence,
-                    candidates=candidates
-                )
-                recognition_record.save()
-                print(f"Recognition record saved: {recognition_record.id}")
+                record_future = persist_record({
+                    'user_id': request.user.pk,
+                    'original_bytes': original_bytes,
+                    'original_ext': original_ext,
+                    'preprocessed_png': preview_bytes if reuse_preview else None,
+                    'preprocessed_array': None if reuse_preview else processed_image,
+                    'result': predicted_char,
+                    'confidence': confidence,
+                    'candidates': candidates,
+                })
             except Exception as e:
                 print(f"Error saving recognition record: {str(e)}")
             
@@ -218,13 +250,43 @@ class ImageRecognitionView(views.APIView):
                 'result': predicted_char,
                 'confidence': round(float(confidence), 4),
                 'candidates': candidates,
-                'preprocessing_steps': ['grayscale', 'gaussian_blur', 'histogram_equalization'],
-                'preprocessed_image': preprocessed_image_base64
+                'preprocessing_steps': backend.preprocessing_steps,
+                'preprocessed_image': None
             }
             
-            print(f"Response data: {response_data}")
+            if preview_bytes is not None:
+                response_data['preprocessed_image'] = base64.b64encode(preview_bytes).decode('utf-8')
+                response_data['preprocessed_image_format'] = preview
+            elif preview == 'url':
+                # 需要已保存文件的地址，等待该条记录写入完成
+                response_data['preprocessed_image_url'] = None
+                try:
+                    record = record_future.result(timeout=PREVIEW_URL_TIMEOUT)
+                    if record.preprocessed_image:
+                        response_data['preprocessed_image_url'] = request.build_absolute_uri(
+                            record.preprocessed_image.url
+                        )
+                except Exception as e:
+                    print(f"Error resolving preprocessed image url: {str(e)}")
+            
+            # 新记录随响应返回，客户端直接插入最近记录列表；异步持久化时查询历史可能还看不到这条记录
+            response_data['record'] = self._record_data(record_future, response_data)
+            
+            print(f"Response data: {dict(response_data, preprocessed_image=bool(response_data['preprocessed_image']))}")
             return Response(response_data, status=status.HTTP_200_OK)
             
+        except EngineUnavailable as e:
+            print(f"Recognition engine unavailable: {str(e)}")
+            return Response(
+                {'error': '识别引擎未能加载，请稍后重试'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        except TimeoutError as e:
+            print(f"Recognition timed out: {str(e)}")
+            return Response(
+                {'error': '识别服务繁忙，请稍后重试'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
         except Exception as e:
             print(f"识别过程中发生错误: {str(e)}")
             import traceback
@@ -241,32 +303,91 @@ class RecognitionHistoryView(views.APIView):
     """
     permission_classes = [IsAuthenticated]
     
+    default_limit = 20
+    max_limit = 100
+    
+    @staticmethod
+    def _encode_cursor(created_at, record_id):
+        raw = f'{created_at.isoformat()}|{record_id}'
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+    
+    @staticmethod
+    def _decode_cursor(cursor):
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, record_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(record_id)
+    
+    @staticmethod
+    def _parse_date(value):
+        return timezone.make_aware(datetime.combine(date.fromisoformat(value), datetime.min.time()))
+    
     def get(self, request, *args, **kwargs):
         """
-        获取用户的识别历史记录
+        获取用户的识别历史记录（游标分页）
         
         Args:
-            request: HTTP请求对象
+            request: HTTP请求对象，支持查询参数：
+                limit: 每页记录数，默认20，最大100
+                cursor: 上一页返回的next_cursor
+                date_from / date_to: 日期范围（YYYY-MM-DD，包含两端）
+                result: 按识别结果字符过滤
             
         Returns:
-            Response: 包含识别历史记录的HTTP响应
+            Response: 包含results和next_cursor的HTTP响应
         """
+        params = request.query_params
         try:
-            # 获取用户的识别历史记录
-            records = RecognitionRecord.objects.filter(user=request.user).order_by('-created_at')
+            limit = min(max(int(params.get('limit', self.default_limit)), 1), self.max_limit)
+            records = RecognitionRecord.objects.filter(user=request.user)
+            
+            if params.get('date_from'):
+                records = records.filter(created_at__gte=self._parse_date(params['date_from']))
+            if params.get('date_to'):
+                records = records.filter(
+                    created_at__lt=self._parse_date(params['date_to']) + timedelta(days=1)
+                )
+            if params.get('result'):
+                records = records.filter(result=params['result'])
+            if params.get('cursor'):
+                cursor_created_at, cursor_id = self._decode_cursor(params['cursor'])
+                records = records.filter(
+                    Q(created_at__lt=cursor_created_at) |
+                    Q(created_at=cursor_created_at, id__lt=cursor_id)
+                )
+        except (ValueError, TypeError) as e:
+            return Response(
+                {'error': f'查询参数错误: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            # 只取需要的列，避免加载图像字段；多取一条判断是否还有下一页
+            rows = list(
+                records.order_by('-created_at', '-id')
+                .values('id', 'result', 'confidence', 'candidates', 'created_at')[:limit + 1]
+            )
+            has_more = len(rows) > limit
+            rows = rows[:limit]
             
             # 构建响应数据
-            history_data = []
-            for record in records:
-                history_data.append({
-                    'id': record.id,
-                    'result': record.result,
-                    'confidence': record.confidence,
-                    'candidates': record.candidates,
-                    'created_at': record.created_at.strftime('%Y-%m-%d %H:%M:%S')
-                })
+            history_data = [
+                {
+                    'id': row['id'],
+                    'result': row['result'],
+                    'confidence': row['confidence'],
+                    'candidates': row['candidates'],
+                    'created_at': row['created_at'].strftime('%Y-%m-%d %H:%M:%S')
+                }
+                for row in rows
+            ]
+            next_cursor = (
+                self._encode_cursor(rows[-1]['created_at'], rows[-1]['id']) if has_more else None
+            )
             
-            return Response(history_data, status=status.HTTP_200_OK)
+            return Response(
+                {'results': history_data, 'next_cursor': next_cursor},
+                status=status.HTTP_200_OK
+            )
         except Exception as e:
             print(f"Error loading history: {str(e)}")
             return Response(
@@ -317,3 +438,31 @@ class RecognitionDetailView(views.APIView):
                 {'error': f'获取识别记录失败: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+class RecognitionStatusView(views.APIView):
+    """
+    识别服务状态视图
+    返回识别引擎的加载状态、加载耗时、内存占用、请求合并统计、缓存命中率和持久化队列状态
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, *args, **kwargs):
+        """
+        获取识别服务状态
+        
+        Args:
+            request: HTTP请求对象
+            
+        Returns:
+            Response: 包含引擎状态的HTTP响应
+        """
+        batcher = get_batcher()
+        cache = get_cache()
+        persistence = get_persistence()
+        status_data = {
+            'engines': engine_registry.stats(),
+            'batching': batcher.stats() if batcher is not None else None,
+            'cache': cache.stats() if cache is not None else None,
+            'persistence': persistence.stats() if persistence is not None else None,
+        }
+        return Response(status_data, status=status.HTTP_200_OK)